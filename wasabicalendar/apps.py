@@ -4,3 +4,17 @@ from django.apps import AppConfig
 class WasabicalendarConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'wasabicalendar'
+
+    def ready(self):
+        from django.contrib.auth.models import User
+        from django.contrib.auth.signals import user_logged_out
+        from django.db.models.signals import post_save
+        from wasabicalendar import caches
+
+        # keep the users cached by the JSON API fast path up to date
+        def drop_cached_user(sender, user=None, instance=None, **kwargs):
+            user = instance or user
+            if user is not None:
+                caches.invalidate_user(user.pk)
+        post_save.connect(drop_cached_user, sender=User, weak=False)
+        user_logged_out.connect(drop_cached_user, weak=False)
@@ -0,0 +1,132 @@
+# @file: archive.py
+# @brief: move tasks and availability blocks older than the archive horizon
+#         out of the hot tables into ArchivedTask and ArchivedBlock
+
+from django.db import transaction
+
+from wasabicalendar.models import (Description, Task, Block, ArchivedTask,
+                                   ArchivedBlock)
+from wasabicalendar import caches
+
+# define macros
+CHUNK_SIZE = 500
+
+# @brief: archive all tasks and blocks of a calendar dated before cutoff.
+#         Rows are moved in chunks, each chunk in its own transaction, so the
+#         hot tables are never locked for long
+# @type cal: Calendar
+# @param cal: calendar to archive
+# @type cutoff: datetime.date
+# @param cutoff: tasks and blocks strictly before this date are archived
+# @type progress: function
+# @param progress: optional function called after every chunk with the number
+#                  of tasks and blocks archived so far
+# @returns: a tuple (number of archived tasks, number of archived blocks)
+def archive_calendar(cal, cutoff, progress=None):
+    # record the horizon first so reads of old weeks start looking in the
+    # archive before any row is moved
+    if cal.archived_before is None or cal.archived_before < cutoff:
+        cal.archived_before = cutoff
+        cal.save(update_fields=['archived_before'])
+
+    task_count = 0
+    while True:
+        with transaction.atomic():
+            tasks = list(cal.tasks.filter(taskDate__lt=cutoff)
+                                  .select_related('description')
+                                  .order_by('id')[:CHUNK_SIZE])
+            if not tasks:
+                break
+            ArchivedTask.objects.bulk_create([_archived_task(t) for t in tasks])
+            Task.objects.filter(id__in=[t.id for t in tasks]).delete()
+            Description.objects.filter(
+                id__in=[t.description_id for t in tasks]).delete()
+        task_count += len(tasks)
+        if progress is not None:
+            progress(task_count)
+
+    block_count = 0
+    cutoff_str = cutoff.strftime("%Y-%m-%d")
+    through = Block.select_user.through
+    archived_through = ArchivedBlock.select_user.through
+    while True:
+        with transaction.atomic():
+            # block dates are YY-mm-dd strings, so they compare like dates
+            blocks = list(cal.blocks.filter(date__lt=cutoff_str)
+                                    .order_by('id')[:CHUNK_SIZE])
+            if not blocks:
+                break
+            archived = ArchivedBlock.objects.bulk_create(
+                [ArchivedBlock(date=b.date, slot=b.slot, calendar=cal)
+                 for b in blocks])
+            new_ids = dict((b.id, a.id) for b, a in zip(blocks, archived))
+            selections = through.objects.filter(block_id__in=new_ids.keys())
+            archived_through.objects.bulk_create(
+                [archived_through(archivedblock_id=new_ids[s.block_id],
+                                  user_id=s.user_id) for s in selections])
+            selections.delete()
+            Block.objects.filter(id__in=new_ids.keys()).delete()
+        block_count += len(blocks)
+        if progress is not None:
+            progress(task_count + block_count)
+
+    if task_count or block_count:
+        caches.bump_revision(cal.id)
+    return (task_count, block_count)
+
+# @brief: move the archived blocks of some days of a calendar back into the
+#         hot table, so they can be changed again. Selections of an archived
+#         block are merged into the hot block of the same day and slot if
+#         there already is one. Call it inside a transaction
+# @type cal: Calendar
+# @type dates: list
+# @param dates: YY-mm-dd strings of the days to restore
+# @returns: the number of archived blocks moved back
+def restore_blocks(cal, dates):
+    archived = list(cal.archived_blocks.filter(date__in=dates))
+    if not archived:
+        return 0
+    blocks = dict(((b.date, b.slot), b) 
+                  for b in cal.blocks.filter(date__in=dates))
+    missing = {}
+    for a in archived:
+        if (a.date, a.slot) not in blocks:
+            missing[(a.date, a.slot)] = Block(date=a.date, slot=a.slot, 
+                                              calendar=cal)
+    for b in Block.objects.bulk_create(missing.values()):
+        blocks[(b.date, b.slot)] = b
+    new_ids = dict((a.id, blocks[(a.date, a.slot)].id) for a in archived)
+
+    through = Block.select_user.through
+    archived_through = ArchivedBlock.select_user.through
+    selections = set((new_ids[block_id], user_id) for block_id, user_id in 
+                     archived_through.objects
+                        .filter(archivedblock_id__in=new_ids.keys())
+                        .values_list('archivedblock_id', 'user_id'))
+    selections -= set(through.objects
+                        .filter(block_id__in=set(new_ids.values()))
+                        .values_list('block_id', 'user_id'))
+    through.objects.bulk_create([through(block_id=block_id, user_id=user_id)
+                                 for block_id, user_id in selections])
+    archived_through.objects.filter(archivedblock_id__in=new_ids.keys()).delete()
+    ArchivedBlock.objects.filter(id__in=new_ids.keys()).delete()
+    return len(archived)
+
+# @brief: copy a task and its description into an ArchivedTask
+# @type task: Task
+# @returns: an unsaved ArchivedTask with the same id as the task
+def _archived_task(task):
+    return ArchivedTask(id=task.id,
+                        topic=task.topic,
+                        tag_id=task.tag_id,
+                        calendar_id=task.calendar_id,
+                        taskDate=task.taskDate,
+                        startSlot=task.startSlot,
+                        endSlot=task.endSlot,
+                        location=task.description.location,
+                        link=task.description.link,
+                        text=task.description.text,
+                        created_by_id=task.created_by_id,
+                        creation_time=task.creation_time,
+                        updated_by_id=task.updated_by_id,
+                        update_time=task.update_time)
@@ -0,0 +1,151 @@
+# @file: caches.py
+# @brief: calendar revision counters and cache key helpers shared by the views
+#         that cache rendered or computed calendar data
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from wasabicalendar.models import Tag, Calendar
+
+import hashlib
+import json
+import time
+import uuid
+
+# define macros
+REVISION_TIMEOUT = None # revision tokens never expire on their own
+RENDER_TIMEOUT = 60 * 60 # cached renders are dropped after an hour
+USER_TIMEOUT = 10 * 60 # cached users of the JSON API fast path
+ACTIVITY_TIMEOUT = 60 * 60 # a calendar unchanged this long counts as idle
+# suggested poll intervals in ms, by seconds since the last change
+POLL_INTERVALS = ((60, 2000), (15 * 60, 10000))
+IDLE_POLL_INTERVAL = 60000
+
+# @brief: get the current revision token of a calendar. The token changes
+#         every time a task, tag, member or block of the calendar is written,
+#         so it can be used as part of a cache key for any derived data
+# @type cal_id: int
+# @param cal_id: id of the calendar
+# @returns: a string revision token
+def get_revision(cal_id):
+    return _get_token("cal_rev_%d" % int(cal_id))
+
+# @brief: get the current tag token of a calendar. Unlike the revision it only
+#         changes when tags are added, so the tag list survives task and
+#         block writes
+# @type cal_id: int
+# @param cal_id: id of the calendar
+# @returns: a string token
+def get_tag_token(cal_id):
+    return _get_token("cal_tag_rev_%d" % int(cal_id))
+
+# @brief: get a token from the cache, creating it if it is missing
+# @type key: string
+# @returns: a string token
+def _get_token(key):
+    rev = cache.get(key)
+    if rev is None:
+        rev = uuid.uuid4().hex
+        # another request may have set the token first, keep theirs
+        if not cache.add(key, rev, REVISION_TIMEOUT):
+            rev = cache.get(key, rev)
+    return rev
+
+# @brief: give the calendar a new revision token so every cached value built
+#         from the old revision is ignored. A fresh random token is used
+#         instead of an increment so concurrent writers never collide. Inside
+#         a transaction the token changes only after the commit, otherwise
+#         another worker could cache uncommitted-away data under the new token
+# @type cal_id: int
+# @param cal_id: id of the calendar that was modified
+def bump_revision(cal_id):
+    key = "cal_rev_%d" % int(cal_id)
+    transaction.on_commit(
+        lambda: cache.set(key, uuid.uuid4().hex, REVISION_TIMEOUT))
+    transaction.on_commit(
+        lambda: cache.set("cal_changed_%d" % int(cal_id), time.time(),
+                          ACTIVITY_TIMEOUT))
+
+# @brief: give the calendar a new tag token after its tags changed, see
+#         get_tag_token. Like bump_revision it takes effect on commit
+# @type cal_id: int
+# @param cal_id: id of the calendar whose tags were modified
+def bump_tags(cal_id):
+    key = "cal_tag_rev_%d" % int(cal_id)
+    transaction.on_commit(
+        lambda: cache.set(key, uuid.uuid4().hex, REVISION_TIMEOUT))
+
+# @brief: suggest how long a client should wait before polling a calendar
+#         again. Calendars written to recently are polled fast, calendars with
+#         no writes for a while are polled rarely
+# @type cal_id: int
+# @returns: the suggested poll interval in ms
+def get_poll_interval(cal_id):
+    changed = cache.get("cal_changed_%d" % int(cal_id))
+    if changed is not None:
+        idle = time.time() - changed
+        for seconds, interval in POLL_INTERVALS:
+            if idle < seconds:
+                return interval
+    return IDLE_POLL_INTERVAL
+
+# @brief: build a cache key for data derived from one week of a calendar
+# @type kind: string
+# @param kind: what is being cached, e.g. "print"
+# @type cal_id: int
+# @type week: string
+# @param week: Monday of the week in YY-mm-dd format
+# @returns: a cache key string that changes with the calendar revision
+def week_key(kind, cal_id, week):
+    return "cal_%s_%d_%s_%s" % (kind, int(cal_id), get_revision(cal_id), week)
+
+# @brief: get the tags of a calendar from the cache. The list is cached per
+#         tag token, so add_tag only has to bump the tag token
+# @type cal_id: int
+# @param cal_id: id of the calendar whose tags we want
+# @returns: a dict with "version", a hash of the tag list that stays the same
+#           as long as the tags do, and "tags", a list of {"id", "name",
+#           "color"} dicts
+def get_tags(cal_id):
+    key = "cal_tags_%d_%s" % (int(cal_id), get_tag_token(cal_id))
+    entry = cache.get(key)
+    if entry is None:
+        tags = [{"id": t.id, "name": t.name, "color": t.color}
+                for t in Tag.objects.filter(calendar_id=cal_id).order_by('id')]
+        version = hashlib.md5(json.dumps(tags).encode()).hexdigest()
+        entry = {"version": version, "tags": tags}
+        cache.set(key, entry, RENDER_TIMEOUT)
+    return entry
+
+# @brief: check whether a user is the owner or a member of a calendar. The
+#         answer is cached until the next write to the calendar, which
+#         includes adding members
+# @type user_id: int
+# @type cal_id: int
+# @returns: True if the user can access the calendar
+def has_access(user_id, cal_id):
+    key = "cal_access_%d_%d_%s" % (int(cal_id), int(user_id), get_revision(cal_id))
+    access = cache.get(key)
+    if access is None:
+        access = (Calendar.objects.filter(id=cal_id)
+                                  .filter(Q(owner_id=user_id) | Q(members__id=user_id))
+                                  .exists())
+        cache.set(key, access, RENDER_TIMEOUT)
+    return access
+
+# @brief: get a user object cached by the JSON API auth fast path
+# @type user_id: string
+# @param user_id: the user id stored in the session
+# @returns: the cached User object, or None
+def get_user(user_id):
+    return cache.get("auth_user_%s" % user_id)
+
+# @brief: cache a user object for the JSON API auth fast path
+def set_user(user):
+    cache.set("auth_user_%s" % user.pk, user, USER_TIMEOUT)
+
+# @brief: drop a cached user, called whenever the user row is saved or the
+#         user logs out
+def invalidate_user(user_id):
+    cache.delete("auth_user_%s" % user_id)
@@ -0,0 +1,104 @@
+# @file: clone.py
+# @brief: copy a calendar's tags, members and a date range of its tasks into a
+#         new calendar with bulk inserts
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from wasabicalendar.models import Description, Tag, Task, Calendar
+from wasabicalendar import caches, search
+
+import datetime
+
+# define macros
+CHUNK_SIZE = 500
+
+# @brief: clone a calendar. Tags and members are copied in one transaction,
+#         tasks are then copied in chunks of CHUNK_SIZE, each chunk in its own
+#         transaction with one insert for the descriptions and one for the
+#         tasks. Ids of the new tags and descriptions are remapped in memory
+# @type cal: Calendar
+# @param cal: the calendar to copy
+# @type owner: User
+# @param owner: owner of the new calendar
+# @type name: string
+# @param name: name of the new calendar
+# @type first: datetime.date
+# @param first: first date of the tasks to copy, None to copy no tasks
+# @type last: datetime.date
+# @param last: last date of the tasks to copy, included
+# @type offset: int
+# @param offset: number of days the copied tasks are moved by
+# @param copy_members: if True, members and owner of cal become members
+# @param progress: optional function called with the number of tasks copied
+# @returns: the new Calendar object
+def clone_calendar(cal, owner, name, first=None, last=None, offset=0,
+                   copy_members=True, progress=None):
+    with transaction.atomic():
+        new_cal = Calendar.objects.create(owner=owner, name=name)
+        tags = list(cal.tags.order_by('id'))
+        new_tags = _bulk_create(Tag, [Tag(name=t.name, color=t.color,
+                                          calendar=new_cal) for t in tags])
+        tag_ids = dict((t.id, n.id) for t, n in zip(tags, new_tags))
+        caches.bump_tags(new_cal.id)
+
+        if copy_members:
+            member_ids = set(cal.members.values_list('id', flat=True))
+            member_ids.add(cal.owner_id)
+            member_ids.discard(owner.id)
+            through = Calendar.members.through
+            through.objects.bulk_create([through(calendar_id=new_cal.id,
+                                                 user_id=user_id)
+                                         for user_id in member_ids])
+
+    if first is None:
+        return new_cal
+
+    shift = datetime.timedelta(days=offset)
+    now = timezone.now()
+    copied = 0
+    # tasks of old weeks may be in the archive with the description inline
+    sources = [(cal.tasks.select_related('description'),
+                lambda t: t.description),
+               (cal.archived_tasks, lambda t: t)]
+    for tasks, get_description in sources:
+        last_id = 0
+        while True:
+            chunk = list(tasks.filter(taskDate__range=(first, last),
+                                      id__gt=last_id).order_by('id')[:CHUNK_SIZE])
+            if not chunk:
+                break
+            last_id = chunk[-1].id
+            with transaction.atomic():
+                descriptions = _bulk_create(Description, [
+                    Description(text=get_description(t).text,
+                                location=get_description(t).location,
+                                link=get_description(t).link) for t in chunk])
+                Task.objects.bulk_create([
+                    Task(topic=t.topic,
+                         tag_id=tag_ids[t.tag_id],
+                         description=d,
+                         calendar=new_cal,
+                         taskDate=t.taskDate + shift,
+                         startSlot=t.startSlot,
+                         endSlot=t.endSlot,
+                         created_by=owner,
+                         creation_time=now,
+                         updated_by=owner,
+                         update_time=now) for t, d in zip(chunk, descriptions)])
+            copied += len(chunk)
+            if progress is not None:
+                progress(copied)
+    # bulk inserts skip index_tasks, index the copied tasks in one go
+    search.index_calendar(new_cal.id)
+    return new_cal
+
+# @brief: bulk insert objects and make sure their ids are set, which backends
+#         without RETURNING support do not do for bulk inserts
+# @returns: the list of saved objects
+def _bulk_create(model, objs):
+    if connection.features.can_return_rows_from_bulk_insert:
+        return model.objects.bulk_create(objs, batch_size=CHUNK_SIZE)
+    for obj in objs:
+        obj.save()
+    return objs
@@ -8,7 +8,8 @@ from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 from django.utils import timezone
 
-from wasabicalendar.models import Tag, Task, Calendar, Profile
+from wasabicalendar.models import Tag, Task, Calendar
+from wasabicalendar import caches
 
 # task form used in create task page and modify task page which contains fields 
 # including topic, tag, description, location, link, task date, start time and end time
@@ -28,9 +29,9 @@ class TaskForm(forms.Form):
     #                 the form in modify task page
     def __init__(self, *args, calendar=None, initial=None):
         super().__init__(*args)
-        L = [] # initialize choices
-        for item in calendar.tags.all():
-            L.append((item.id, item.name))
+        L = [] # initialize choices from the cached tag list of the calendar
+        for item in caches.get_tags(calendar.id)['tags']:
+            L.append((item['id'], item['name']))
         self.fields['tag'].choices = tuple(L)
 
     # @brief: clean the input data while submitting and sanitize the strings
@@ -56,4 +57,9 @@ class TaskForm(forms.Form):
             raise forms.ValidationError("Invalid link.")
         if startTime >= endTime:
             raise forms.ValidationError("Start time must be before end time.")
-        return cleaned_data
\ No newline at end of file
+        return cleaned_data
+
+# task form used in create task page, the user may also check the new task
+# against the tasks of all their other calendars
+class NewTaskForm(TaskForm):
+    check_conflicts = forms.BooleanField(required=False, label="Check My Other Calendars")
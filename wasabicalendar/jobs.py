@@ -0,0 +1,170 @@
+# @file: jobs.py
+# @brief: database backed queue of background jobs. Views enqueue a job and
+#         return at once, the run_workers management command claims and runs
+#         them. A job kind is registered with @handler, which sets how many
+#         jobs of the kind may run at once and how often a failing job is
+#         tried. Handlers import their modules when they run, so views that
+#         only enqueue jobs do not load them
+
+from django.db import close_old_connections
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from wasabicalendar.models import Calendar, Job
+
+import datetime
+import json
+import logging
+
+# define macros
+LEASE_SECONDS = 5 * 60 # a job must report progress at least this often
+RETRY_DELAY = 30 # seconds before the first retry, doubled on every retry
+POLL_INTERVAL = 1.0 # seconds between queue checks of an idle worker
+
+logger = logging.getLogger(__name__)
+
+# kind -> (function, concurrency limit, max attempts)
+HANDLERS = {}
+
+# @brief: register a job handler. The function is called with the Job and the
+#         decoded arguments and returns a JSON serializable result
+# @type kind: string
+# @param concurrency: how many jobs of this kind may run at the same time
+# @param attempts: how often a job is tried before it fails, keep it at 1 for
+#                  jobs that cannot be repeated safely
+def handler(kind, concurrency=1, attempts=1):
+    def register(function):
+        HANDLERS[kind] = (function, concurrency, attempts)
+        return function
+    return register
+
+# @brief: add a job to the queue
+# @type kind: string
+# @param kind: a kind registered with @handler
+# @type owner: User
+# @param owner: the user that started the job and may see its status
+# @param args: arguments passed to the handler, must be JSON serializable
+# @returns: the new Job
+def enqueue(kind, owner, **args):
+    now = timezone.now()
+    return Job.objects.create(kind=kind, owner=owner, args=json.dumps(args),
+                              max_attempts=HANDLERS[kind][2],
+                              created_time=now, run_after=now)
+
+# @brief: report the progress of a running job. Also renews the lease of the
+#         job, so long jobs should call it regularly
+# @type job: Job
+# @param done: units of work done so far
+# @param total: total units of work, None to keep the previous total
+def set_progress(job, done, total=None):
+    job.progress = done
+    fields = {"progress": done,
+              "locked_until": timezone.now() + datetime.timedelta(seconds=LEASE_SECONDS)}
+    if total is not None:
+        job.total = total
+        fields["total"] = total
+    Job.objects.filter(id=job.id).update(**fields)
+
+# @brief: claim the next job that may run. A job is claimed with a conditional
+#         update, so two workers never run the same job. Running jobs whose
+#         lease expired were left by a dead worker and are claimed again
+# @returns: the claimed Job, or None if there is nothing to run
+def claim():
+    now = timezone.now()
+    ready = Q(status=Job.QUEUED, run_after__lte=now) | \
+            Q(status=Job.RUNNING, locked_until__lt=now)
+    running = dict((kind, n) for kind, n in
+                   Job.objects.filter(status=Job.RUNNING, locked_until__gte=now)
+                              .values_list('kind').annotate(n=Count('id')))
+    full = [kind for kind, (f, limit, a) in HANDLERS.items()
+            if running.get(kind, 0) >= limit]
+    for job in (Job.objects.filter(ready).exclude(kind__in=full)
+                           .order_by('run_after', 'id')[:10]):
+        if job.status == Job.RUNNING and job.attempts >= job.max_attempts:
+            # its worker died during the last attempt
+            Job.objects.filter(id=job.id, status=Job.RUNNING,
+                               attempts=job.attempts).update(
+                status=Job.FAILED, message="The worker running the job stopped",
+                locked_until=None, finished_time=now)
+            continue
+        claimed = (Job.objects.filter(id=job.id, status=job.status,
+                                      attempts=job.attempts)
+                              .update(status=Job.RUNNING,
+                                      attempts=F('attempts') + 1,
+                                      locked_until=now + datetime.timedelta(
+                                          seconds=LEASE_SECONDS)))
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+# @brief: run a claimed job and record its result. A failing job is queued
+#         again with a growing delay until it used up its attempts
+# @type job: Job
+def run(job):
+    function = HANDLERS[job.kind][0]
+    try:
+        result = function(job, **json.loads(job.args))
+    except Exception as e:
+        logger.exception("job %d (%s) failed", job.id, job.kind)
+        if job.attempts < job.max_attempts:
+            delay = RETRY_DELAY * 2 ** (job.attempts - 1)
+            Job.objects.filter(id=job.id).update(
+                status=Job.QUEUED, message=str(e)[:200], locked_until=None,
+                run_after=timezone.now() + datetime.timedelta(seconds=delay))
+        else:
+            Job.objects.filter(id=job.id).update(
+                status=Job.FAILED, message=str(e)[:200], locked_until=None,
+                finished_time=timezone.now())
+        return
+    Job.objects.filter(id=job.id).update(
+        status=Job.DONE, result=json.dumps(result), message="",
+        locked_until=None, finished_time=timezone.now())
+
+# @brief: worker loop, claims and runs jobs until stop is set
+# @type stop: threading.Event
+# @param once: return as soon as the queue has nothing to run
+def work(stop, once=False):
+    while not stop.is_set():
+        close_old_connections()
+        job = claim()
+        if job is None:
+            if once:
+                break
+            stop.wait(POLL_INTERVAL)
+            continue
+        run(job)
+    close_old_connections()
+
+
+# @brief: copy a calendar, see clone.clone_calendar. Not retried, a second
+#         attempt would make a second copy
+@handler('clone', concurrency=2)
+def _clone_job(job, cal_id, name, first, last, offset, copy_members):
+    from wasabicalendar import clone
+    cal = Calendar.objects.get(id=cal_id)
+    if first is not None:
+        first = datetime.date.fromisoformat(first)
+        last = datetime.date.fromisoformat(last)
+        total = sum(tasks.filter(taskDate__range=(first, last)).count()
+                    for tasks in (cal.tasks, cal.archived_tasks))
+        set_progress(job, 0, total)
+    new_cal = clone.clone_calendar(cal, job.owner, name, first, last, offset,
+                                   copy_members=copy_members,
+                                   progress=lambda n: set_progress(job, n))
+    return {"calendar_id": new_cal.id}
+
+# @brief: archive the old tasks and blocks of a calendar, see
+#         archive.archive_calendar. Archiving is safe to repeat. Progress is
+#         reported after every chunk, which keeps the lease of a long job
+@handler('archive', concurrency=1, attempts=3)
+def _archive_job(job, cal_id, cutoff):
+    from wasabicalendar import archive
+    cal = Calendar.objects.get(id=cal_id)
+    cutoff = datetime.date.fromisoformat(cutoff)
+    total = (cal.tasks.filter(taskDate__lt=cutoff).count() + 
+             cal.blocks.filter(date__lt=cutoff.strftime("%Y-%m-%d")).count())
+    set_progress(job, 0, total)
+    task_count, block_count = archive.archive_calendar(
+        cal, cutoff, progress=lambda n: set_progress(job, n))
+    return {"tasks": task_count, "blocks": block_count}
@@ -0,0 +1,42 @@
+# @file: layout.py
+# @brief: assign the tasks of each day of a week to the lanes of the calendar
+#         grid so that tasks sharing a 15 minute slot never share a lane
+
+import heapq
+
+# define macros
+LANE_COUNT = 5 # at most 5 tasks may overlap, see create_task
+
+# @brief: assign lanes to the tasks of one day in a single sweep over the
+#         tasks sorted by start slot. A task takes the lowest lane that is free
+#         over its whole interval; since tasks are swept by start, that is the
+#         lowest lane whose previous task already ended. This is an optimal
+#         coloring of the interval graph, so it never needs more lanes than
+#         the largest number of tasks overlapping in one slot
+# @type tasks: list
+# @param tasks: task dicts with at least "startBlock" and "endBlock"
+# @returns: the same task dicts, each with a "lane" key, ordered by start slot
+def layout_day(tasks):
+    tasks = sorted(tasks, key=lambda t: (t["startBlock"], t["endBlock"]))
+    free_lanes = list(range(LANE_COUNT)) # heap of lanes free right now
+    busy_lanes = [] # heap of (end slot, lane) of lanes in use
+    for task in tasks:
+        # release every lane whose task ended at or before this start
+        while busy_lanes and busy_lanes[0][0] <= task["startBlock"]:
+            heapq.heappush(free_lanes, heapq.heappop(busy_lanes)[1])
+        if free_lanes:
+            lane = heapq.heappop(free_lanes)
+        else:
+            # more overlaps than lanes can only come from data written before
+            # the overlap limit, share the lane that frees up first
+            lane = heapq.heappop(busy_lanes)[1]
+        task["lane"] = lane
+        heapq.heappush(busy_lanes, (task["endBlock"], lane))
+    return tasks
+
+# @brief: lay out a whole week
+# @type week_tasks: list
+# @param week_tasks: one list of task dicts per day of the week
+# @returns: one list of laid out task dicts per day, see layout_day
+def layout_week(week_tasks):
+    return [layout_day(day_tasks) for day_tasks in week_tasks]
@@ -0,0 +1,48 @@
+# @file: archive_history.py
+# @brief: management command that moves old tasks and availability blocks of
+#         every calendar into the archive tables
+#
+# usage: python manage.py archive_history [--days N] [--calendar ID] [--queue]
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from wasabicalendar.models import Calendar
+from wasabicalendar.archive import archive_calendar
+from wasabicalendar import jobs
+
+import datetime
+
+class Command(BaseCommand):
+    help = "Move tasks and blocks older than the archive horizon to the archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            default=settings.ARCHIVE_HORIZON_DAYS,
+                            help="archive data older than this many days")
+        parser.add_argument('--calendar', type=int, default=None,
+                            help="only archive the calendar with this id")
+        parser.add_argument('--queue', action='store_true',
+                            help="queue a job per calendar for run_workers "
+                                 "instead of archiving now")
+
+    def handle(self, *args, **options):
+        if options['days'] < 0:
+            raise CommandError("--days must not be negative")
+        cutoff = datetime.date.today() - datetime.timedelta(days=options['days'])
+
+        calendars = Calendar.objects.order_by('id')
+        if options['calendar'] is not None:
+            calendars = calendars.filter(id=options['calendar'])
+            if not calendars.exists():
+                raise CommandError("Calendar %d does not exist" % options['calendar'])
+
+        for cal in calendars:
+            if options['queue']:
+                job = jobs.enqueue('archive', cal.owner, cal_id=cal.id,
+                                   cutoff=cutoff.isoformat())
+                self.stdout.write("calendar %d: queued job %d" % (cal.id, job.id))
+                continue
+            task_count, block_count = archive_calendar(cal, cutoff)
+            self.stdout.write("calendar %d: archived %d tasks, %d blocks" %
+                              (cal.id, task_count, block_count))
@@ -0,0 +1,90 @@
+# @file: bench_encodings.py
+# @brief: management command that compares the encode time and the wire size
+#         of the week grid payload in every available response encoding
+#
+# usage: python manage.py bench_encodings [--tasks N] [--runs N]
+
+from django.core.management.base import BaseCommand
+
+from wasabicalendar import encoding, layout, timeslots
+
+import gzip
+import json
+import random
+import time
+
+# define macros
+WEEK_COUNT = 7
+
+class Command(BaseCommand):
+    help = "Benchmark the encodings of the calendar JSON responses"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=60,
+                            help="tasks in the generated week")
+        parser.add_argument('--runs', type=int, default=200,
+                            help="encodes timed per encoding")
+
+    def handle(self, *args, **options):
+        data = {"data": _make_week(options['tasks']),
+                "week": ["2026-10-%02d" % (19 + i) for i in range(WEEK_COUNT)],
+                "tags_version": "0" * 32}
+        encoders = [("json (before)", lambda d: json.dumps(d).encode())]
+        encoders.append(("orjson" if encoding.orjson else "json compact",
+                         encoding.dumps_json))
+        if encoding.msgpack is not None:
+            encoders.append(("msgpack", encoding.dumps_msgpack))
+
+        self.stdout.write("%-14s %9s %9s %9s %9s %9s" % (
+            "encoding", "encode ms", "bytes", "gzip", "br", "br ms"))
+        for name, dumps in encoders:
+            body = dumps(data)
+            encode_ms = _time(lambda: dumps(data), options['runs'])
+            gzipped = len(gzip.compress(body, compresslevel=encoding.GZIP_LEVEL))
+            if encoding.brotli is not None:
+                br = len(encoding.brotli.compress(body, quality=encoding.BROTLI_QUALITY))
+                br_ms = _time(lambda: encoding.brotli.compress(
+                    body, quality=encoding.BROTLI_QUALITY), options['runs'])
+                br, br_ms = str(br), "%.3f" % br_ms
+            else:
+                br = br_ms = "-"
+            self.stdout.write("%-14s %9.3f %9d %9d %9s %9s" % (
+                name, encode_ms, len(body), gzipped, br, br_ms))
+
+# @brief: time a function
+# @returns: mean time of one call in ms
+def _time(function, runs):
+    start = time.perf_counter()
+    for i in range(runs):
+        function()
+    return (time.perf_counter() - start) * 1000 / runs
+
+# @brief: make a week grid like _build_week_grid does, with tasks of 30
+#         minutes to 3 hours during the day and some availability blocks
+# @returns: a list of WEEK_COUNT lists of timeslots.DAY_COUNT slot dicts
+def _make_week(task_count):
+    rand = random.Random(0)
+    data = [[{"block": (0, False), "tasks": [[], [], [], [], []]}
+             for j in range(timeslots.DAY_COUNT)] for i in range(WEEK_COUNT)]
+    for i in range(WEEK_COUNT):
+        for j in range(32, 72):
+            if rand.random() < 0.3:
+                data[i][j]["block"] = (rand.randint(1, 8), rand.random() < 0.5)
+    week_tasks = [[] for i in range(WEEK_COUNT)]
+    for n in range(task_count):
+        start = rand.randint(32, 80)
+        end = min(start + rand.randint(2, 12), timeslots.LAST_SLOT)
+        week_tasks[rand.randrange(WEEK_COUNT)].append({
+            "id": n + 1,
+            "topic": "Task number %d" % (n + 1),
+            "startTime": timeslots.format_slot(start, seconds=True),
+            "endTime": timeslots.format_slot(end, seconds=True),
+            "startBlock": start,
+            "endBlock": end,
+            "color": "#BDCDEC",
+            "tag": "work"})
+    for day_i, day_tasks in enumerate(layout.layout_week(week_tasks)):
+        for task in day_tasks:
+            for j in range(task["startBlock"], task["endBlock"]):
+                data[day_i][j]["tasks"][task["lane"]] = [task]
+    return data
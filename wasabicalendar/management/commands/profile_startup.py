@@ -0,0 +1,134 @@
+# @file: profile_startup.py
+# @brief: management command that measures the cold start of the Django
+#         process in fresh interpreters: time per startup phase, import and
+#         ready() time per app, and the slowest imports by package. With
+#         --budget it fails when the median cold start is over the budget, so
+#         it can run as a regression check after deploys or in CI
+#
+# usage: python manage.py profile_startup [--runs N] [--top N] [--budget MS]
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+import collections
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# define macros
+# run in the fresh interpreter, prints the phase and app times as JSON
+PROBE = r"""
+import json, os, time
+start = time.perf_counter()
+marks = []
+def mark(name):
+    marks.append((name, (time.perf_counter() - start) * 1000))
+
+import django
+from django.apps import AppConfig
+mark("import django")
+from django.conf import settings
+settings.INSTALLED_APPS
+mark("settings")
+
+apps_ms = {}
+create = AppConfig.create.__func__
+def timed(label, kind, function):
+    def run(*args):
+        t = time.perf_counter()
+        function(*args)
+        apps_ms.setdefault(label, {})[kind] = (time.perf_counter() - t) * 1000
+    return run
+def timed_create(cls, entry):
+    t = time.perf_counter()
+    config = create(cls, entry)
+    apps_ms.setdefault(config.label, {})["import"] = (time.perf_counter() - t) * 1000
+    config.import_models = timed(config.label, "models", config.import_models)
+    config.ready = timed(config.label, "ready", config.ready)
+    return config
+AppConfig.create = classmethod(timed_create)
+django.setup()
+mark("apps")
+
+from django.core.handlers.wsgi import WSGIHandler
+WSGIHandler()
+mark("middleware")
+from django.urls import get_resolver
+get_resolver().url_patterns
+mark("urls")
+from django.contrib.auth import get_backends
+get_backends()
+mark("auth backends")
+print(json.dumps({"marks": marks, "apps": apps_ms}))
+"""
+
+class Command(BaseCommand):
+    help = "Profile the cold start of the Django process"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5,
+                            help="cold starts to measure, the median is reported")
+        parser.add_argument('--top', type=int, default=15,
+                            help="number of packages listed by import time")
+        parser.add_argument('--budget', type=float, default=None,
+                            help="fail if the median cold start takes longer, "
+                                 "in ms (default: STARTUP_BUDGET_MS)")
+
+    def handle(self, *args, **options):
+        if options['runs'] < 1:
+            raise CommandError("--runs must be at least 1")
+        budget = options['budget'] or settings.STARTUP_BUDGET_MS
+
+        results = [self._probe() for i in range(options['runs'])]
+        # the run with the median total stands for all of them
+        results.sort(key=lambda r: r[0]["marks"][-1][1])
+        probe, imports = results[len(results) // 2]
+        total = probe["marks"][-1][1]
+
+        self.stdout.write("phase               ms")
+        previous = 0
+        for name, at in probe["marks"]:
+            self.stdout.write("%-15s %6.1f" % (name, at - previous))
+            previous = at
+        self.stdout.write("%-15s %6.1f\n" % ("total", total))
+
+        self.stdout.write("app               import  models   ready")
+        for label, times in probe["apps"].items():
+            self.stdout.write("%-15s %8.1f %7.1f %7.1f" % (
+                label, times.get("import", 0), times.get("models", 0),
+                times.get("ready", 0)))
+
+        self.stdout.write("\npackage          import ms")
+        for package, us in imports.most_common(options['top']):
+            self.stdout.write("%-15s %10.1f" % (package, us / 1000))
+
+        if total > budget:
+            raise CommandError("cold start took %.0f ms, over the budget of "
+                               "%.0f ms" % (total, budget))
+        self.stdout.write("cold start %.0f ms, budget %.0f ms" % (total, budget))
+
+    # @brief: start a fresh interpreter with the settings of this process and
+    #         -X importtime, and run PROBE in it
+    # @returns: a tuple (PROBE output, Counter of import time in us by top
+    #           level package)
+    def _probe(self):
+        env = dict(os.environ)
+        env.setdefault("DJANGO_SETTINGS_MODULE", "webapps.settings")
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", PROBE],
+                              cwd=settings.BASE_DIR, env=env,
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise CommandError("startup failed:\n" + proc.stderr[-2000:])
+        imports = collections.Counter()
+        for line in proc.stderr.splitlines():
+            # "import time: self [us] | cumulative | imported package"
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            fields = line[len("import time:"):].split("|")
+            if not fields[0].strip().isdigit():
+                continue # the header line
+            package = fields[2].strip().split(".")[0]
+            imports[package] += int(fields[0])
+        return (json.loads(proc.stdout.splitlines()[-1]), imports)
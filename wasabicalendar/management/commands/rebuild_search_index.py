@@ -0,0 +1,18 @@
+# @file: rebuild_search_index.py
+# @brief: management command that rebuilds the full-text task search index
+#         from the task and archive tables
+#
+# usage: python manage.py rebuild_search_index
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from wasabicalendar import search
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text index used by the task search"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            search.rebuild_index()
+        self.stdout.write("search index rebuilt")
@@ -0,0 +1,41 @@
+# @file: run_workers.py
+# @brief: management command that runs the background job queue, see jobs.py
+#
+# usage: python manage.py run_workers [--workers N] [--once]
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wasabicalendar import jobs
+
+import threading
+
+class Command(BaseCommand):
+    help = "Run background jobs such as calendar copies and archiving"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2,
+                            help="number of jobs run at the same time")
+        parser.add_argument('--once', action='store_true',
+                            help="exit when the queue has nothing to run")
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError("--workers must be at least 1")
+        stop = threading.Event()
+        threads = [threading.Thread(target=jobs.work, args=(stop, options['once']),
+                                    daemon=True)
+                   for i in range(options['workers'])]
+        for thread in threads:
+            thread.start()
+        self.stdout.write("running %d workers" % len(threads))
+        try:
+            for thread in threads:
+                # join with a timeout so Ctrl-C is not blocked
+                while thread.is_alive():
+                    thread.join(1)
+        except KeyboardInterrupt:
+            # running jobs are finished before the workers exit
+            self.stdout.write("stopping after the running jobs")
+            stop.set()
+            for thread in threads:
+                thread.join()
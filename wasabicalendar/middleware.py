@@ -0,0 +1,103 @@
+# @file: middleware.py
+# @brief: auth fast path for the JSON endpoints polled by the calendar page.
+#         The user is resolved from the cache instead of the database, so a
+#         poll with a cached or signed-cookie session costs no session or user
+#         queries in steady state. Also rate limiting of the same endpoints
+
+from django.conf import settings
+from django.contrib.auth import get_user, SESSION_KEY, HASH_SESSION_KEY
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+from wasabicalendar import caches, ratelimit
+
+import json
+
+# define macros
+API_PATH = "wasabicalendar/" # all JSON endpoints live under this path
+
+# @brief: check whether a request goes to one of the JSON endpoints. The URL
+#         is resolved, so a path that only contains API_PATH (e.g. a static
+#         file) is not mistaken for one. The answer is kept on the request
+# @returns: True if the route of the request has an API_PATH segment
+def _is_api_request(request):
+    if not hasattr(request, '_api_request'):
+        try:
+            route = "/" + resolve(request.path_info).route
+        except Resolver404:
+            route = ""
+        request._api_request = "/" + API_PATH in route
+    return request._api_request
+
+# @brief: resolve the user of a request from the cache, falling back to the
+#         regular session lookup and caching its result
+# @returns: the User object, or an AnonymousUser
+def _get_cached_user(request):
+    user_id = request.session.get(SESSION_KEY)
+    if user_id is not None:
+        user = caches.get_user(user_id)
+        # same session hash check as django.contrib.auth.get_user, so a
+        # password change still logs out other sessions
+        if (user is not None and user.is_active and
+                constant_time_compare(request.session.get(HASH_SESSION_KEY, ""),
+                                      user.get_session_auth_hash())):
+            return user
+    user = get_user(request)
+    if user.is_authenticated:
+        caches.set_user(user)
+    return user
+
+# @brief: replace request.user on JSON endpoints with a user resolved by
+#         _get_cached_user. Must come after AuthenticationMiddleware
+class CachedUserMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if _is_api_request(request):
+            request.user = SimpleLazyObject(lambda: _get_cached_user(request))
+        return self.get_response(request)
+
+# @brief: answer a request that was refused by the rate limits
+# @param wait: seconds after which the client may try again
+# @returns: a 429 JSON error response with a Retry-After header
+def _too_many_requests(message, wait):
+    response = HttpResponse(json.dumps({"error": message}), status=429,
+                            content_type='application/json')
+    response['Retry-After'] = str(wait)
+    return response
+
+# @brief: refuse JSON requests beyond the token bucket limits of the user and
+#         of the calendar, and shed load when this process already runs too
+#         many requests (threaded and ASGI workers only, see
+#         ratelimit.admit). Must come after CachedUserMiddleware
+class RateLimitMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.RATE_LIMIT_ENABLED or not _is_api_request(request):
+            return self.get_response(request)
+
+        cal_id = request.GET.get('cal_id') or request.POST.get('cal_id') or ''
+        if request.user.is_authenticated:
+            user_key = str(request.user.id)
+            # only members spend the tokens of a calendar, the view refuses
+            # everyone else anyway
+            if cal_id.isdigit() and not caches.has_access(request.user.id, cal_id):
+                cal_id = ''
+        else:
+            user_key = request.META.get('REMOTE_ADDR', '')
+            cal_id = ''
+        wait = ratelimit.check(user_key, cal_id)
+        if wait:
+            return _too_many_requests("Too many requests", wait)
+
+        if not ratelimit.admit():
+            return _too_many_requests("Server busy", 1)
+        try:
+            return self.get_response(request)
+        finally:
+            ratelimit.release()
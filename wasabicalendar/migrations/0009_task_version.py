@@ -0,0 +1,21 @@
+# Generated by Django 4.1.13 on 2026-10-19 14:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wasabicalendar', '0008_alter_tag_color'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='version',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.DeleteModel(
+            name='Profile',
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.1.13 on 2026-10-19 14:22
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('wasabicalendar', '0009_task_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calendar',
+            name='archived_before',
+            field=models.DateField(default=None, null=True),
+        ),
+        migrations.CreateModel(
+            name='ArchivedTask',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('topic', models.CharField(max_length=200)),
+                ('taskDate', models.DateField()),
+                ('startTime', models.TimeField()),
+                ('endTime', models.TimeField()),
+                ('location', models.CharField(blank=True, max_length=200)),
+                ('link', models.CharField(blank=True, max_length=200)),
+                ('text', models.CharField(blank=True, max_length=500)),
+                ('creation_time', models.DateTimeField()),
+                ('update_time', models.DateTimeField()),
+                ('calendar', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_tasks', to='wasabicalendar.calendar')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_creators', to=settings.AUTH_USER_MODEL)),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_tsk', to='wasabicalendar.tag')),
+                ('updated_by', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_updaters', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.CharField(max_length=20)),
+                ('slot', models.IntegerField()),
+                ('calendar', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_blocks', to='wasabicalendar.calendar')),
+                ('select_user', models.ManyToManyField(related_name='archived_toblocks', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedtask',
+            index=models.Index(fields=['calendar', 'taskDate'], name='wasabicalen_calenda_721563_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedblock',
+            index=models.Index(fields=['calendar', 'date'], name='wasabicalen_calenda_f19646_idx'),
+        ),
+    ]
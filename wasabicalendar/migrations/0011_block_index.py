@@ -0,0 +1,17 @@
+# Generated by Django 4.1.13 on 2026-10-19 14:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wasabicalendar', '0010_archive'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='block',
+            index=models.Index(fields=['calendar', 'date', 'slot'], name='wasabicalen_calenda_6878e5_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.1.13 on 2026-10-19 14:24
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('wasabicalendar', '0011_block_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalendarAccess',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_accessed', models.DateTimeField()),
+                ('calendar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='accesses', to='wasabicalendar.calendar')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calendar_accesses', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'calendar')},
+            },
+        ),
+    ]
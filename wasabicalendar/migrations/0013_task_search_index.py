@@ -0,0 +1,64 @@
+from django.db import migrations
+
+# the index table of wasabicalendar/search.py as it was when this migration
+# was written, kept here so later changes to search.py do not change it
+INDEX_TABLE = "wasabicalendar_task_fts"
+
+
+def create_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE %s USING fts5(topic, text, location, link, "
+            "calendar_id UNINDEXED, tokenize = 'unicode61 remove_diacritics 2')"
+            % INDEX_TABLE)
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE TABLE %s (task_id bigint PRIMARY KEY, calendar_id bigint "
+            "NOT NULL, document tsvector NOT NULL)" % INDEX_TABLE)
+        schema_editor.execute("CREATE INDEX %s_document ON %s USING GIN "
+                              "(document)" % (INDEX_TABLE, INDEX_TABLE))
+        schema_editor.execute("CREATE INDEX %s_calendar ON %s (calendar_id)"
+                              % (INDEX_TABLE, INDEX_TABLE))
+    else:
+        return
+
+    # index the existing live and archived tasks
+    quote = schema_editor.quote_name
+    Task = apps.get_model('wasabicalendar', 'Task')
+    Description = apps.get_model('wasabicalendar', 'Description')
+    ArchivedTask = apps.get_model('wasabicalendar', 'ArchivedTask')
+    sources = [
+        "SELECT t.id, t.calendar_id, t.topic, d.text, d.location, d.link "
+        "FROM %s t JOIN %s d ON d.id = t.description_id"
+        % (quote(Task._meta.db_table), quote(Description._meta.db_table)),
+        "SELECT t.id, t.calendar_id, t.topic, t.text, t.location, t.link "
+        "FROM %s t" % quote(ArchivedTask._meta.db_table),
+    ]
+    for source in sources:
+        if vendor == 'sqlite':
+            schema_editor.execute("INSERT INTO %s (rowid, calendar_id, topic, "
+                                  "text, location, link) %s"
+                                  % (INDEX_TABLE, source))
+        else:
+            schema_editor.execute(
+                "INSERT INTO %s (task_id, calendar_id, document) SELECT s.id, "
+                "s.calendar_id, setweight(to_tsvector('simple', s.topic), 'A') "
+                "|| to_tsvector('simple', s.text || ' ' || s.location || ' ' "
+                "|| s.link) FROM (%s) s" % (INDEX_TABLE, source))
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute("DROP TABLE %s" % INDEX_TABLE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wasabicalendar', '0012_calendar_access'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.1.13 on 2026-10-19 14:38
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('wasabicalendar', '0013_task_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20)),
+                ('args', models.TextField(default='{}')),
+                ('result', models.TextField(default='{}')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('attempts', models.IntegerField(default=0)),
+                ('max_attempts', models.IntegerField(default=1)),
+                ('progress', models.IntegerField(default=0)),
+                ('total', models.IntegerField(default=0)),
+                ('message', models.CharField(blank=True, max_length=200)),
+                ('created_time', models.DateTimeField()),
+                ('run_after', models.DateTimeField()),
+                ('locked_until', models.DateTimeField(default=None, null=True)),
+                ('finished_time', models.DateTimeField(default=None, null=True)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['status', 'run_after'], name='wasabicalen_status_d7d212_idx'),
+        ),
+    ]
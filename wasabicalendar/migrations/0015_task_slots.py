@@ -0,0 +1,112 @@
+import datetime
+
+from django.db import migrations, models
+
+# define macros
+CHUNK_SIZE = 500
+
+
+# @brief: rewrite the tasks and archived tasks in chunks of CHUNK_SIZE
+# @param convert: function that sets the new fields of one task
+# @param fields: names of the fields convert sets
+def convert_tasks(apps, convert, fields):
+    for name in ('Task', 'ArchivedTask'):
+        model = apps.get_model('wasabicalendar', name)
+        last_id = 0
+        while True:
+            tasks = list(model.objects.filter(id__gt=last_id).order_by('id')[:CHUNK_SIZE])
+            if not tasks:
+                break
+            last_id = tasks[-1].id
+            for task in tasks:
+                convert(task)
+            model.objects.bulk_update(tasks, fields)
+
+
+# task times are on a 15 minute boundary, see create_task. Times that are not
+# are rounded like new tasks: the start down, the end up but to 23:45 at most
+def times_to_slots(apps, schema_editor):
+    def convert(task):
+        task.startSlot = task.startTime.hour * 4 + task.startTime.minute // 15
+        task.endSlot = min(95, task.endTime.hour * 4 + 
+                               (task.endTime.minute + 14) // 15)
+    convert_tasks(apps, convert, ['startSlot', 'endSlot'])
+
+
+def slots_to_times(apps, schema_editor):
+    def convert(task):
+        task.startTime = datetime.time(task.startSlot // 4, task.startSlot % 4 * 15)
+        task.endTime = datetime.time(task.endSlot // 4, task.endSlot % 4 * 15)
+    convert_tasks(apps, convert, ['startTime', 'endTime'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wasabicalendar', '0014_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='startSlot',
+            field=models.IntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='endSlot',
+            field=models.IntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='archivedtask',
+            name='startSlot',
+            field=models.IntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='archivedtask',
+            name='endSlot',
+            field=models.IntegerField(default=0),
+            preserve_default=False,
+        ),
+        # a default lets the times be added back when migrating backwards
+        migrations.AlterField(
+            model_name='task',
+            name='startTime',
+            field=models.TimeField(default=datetime.time(0, 0)),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='endTime',
+            field=models.TimeField(default=datetime.time(0, 0)),
+        ),
+        migrations.AlterField(
+            model_name='archivedtask',
+            name='startTime',
+            field=models.TimeField(default=datetime.time(0, 0)),
+        ),
+        migrations.AlterField(
+            model_name='archivedtask',
+            name='endTime',
+            field=models.TimeField(default=datetime.time(0, 0)),
+        ),
+        migrations.RunPython(times_to_slots, slots_to_times),
+        migrations.RemoveField(
+            model_name='task',
+            name='startTime',
+        ),
+        migrations.RemoveField(
+            model_name='task',
+            name='endTime',
+        ),
+        migrations.RemoveField(
+            model_name='archivedtask',
+            name='startTime',
+        ),
+        migrations.RemoveField(
+            model_name='archivedtask',
+            name='endTime',
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.13 on 2026-10-19 14:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wasabicalendar', '0015_task_slots'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['calendar', 'taskDate'], name='wasabicalen_calenda_db2650_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.db import migrations
+
+# the user table belongs to django.contrib.auth, so the indexes of the
+# case-insensitive prefix lookups of views.user_search are created here
+INDEXES = (
+    ('wasabicalendar_user_username_lower', 'username'),
+    ('wasabicalendar_user_email_lower', 'email'),
+)
+# backends that support indexes on expressions
+VENDORS = ('sqlite', 'postgresql', 'mysql')
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor not in VENDORS:
+        return
+    table = apps.get_model(settings.AUTH_USER_MODEL)._meta.db_table
+    for name, column in INDEXES:
+        schema_editor.execute("CREATE INDEX %s ON %s ((LOWER(%s)))" % (
+            name, schema_editor.quote_name(table),
+            schema_editor.quote_name(column)))
+
+
+def drop_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor not in VENDORS:
+        return
+    table = apps.get_model(settings.AUTH_USER_MODEL)._meta.db_table
+    for name, column in INDEXES:
+        if vendor == 'mysql':
+            schema_editor.execute("DROP INDEX %s ON %s" % (
+                name, schema_editor.quote_name(table)))
+        else:
+            schema_editor.execute("DROP INDEX %s" % name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('wasabicalendar', '0016_task_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -5,6 +5,8 @@
 from django.db import models
 from django.contrib.auth.models import User
 
+from wasabicalendar import timeslots
+
 # save optional fields including location, link and text description inside a 
 # description class
 class Description(models.Model):
@@ -16,6 +18,8 @@ class Calendar(models.Model):
     name = models.CharField(max_length=15)
     owner = models.ForeignKey(User, on_delete=models.PROTECT, related_name="owned_calendar")
     members = models.ManyToManyField(User, default=None, related_name="shared_calendar")
+    # tasks and blocks before this date may have been moved to the archive
+    archived_before = models.DateField(null=True, default=None)
 
 class Tag(models.Model):
     name = models.CharField(max_length=15)
@@ -28,15 +32,116 @@ class Task(models.Model):
     description = models.OneToOneField(Description, on_delete=models.PROTECT)
     calendar = models.ForeignKey(Calendar, default = None, on_delete=models.PROTECT, related_name="tasks")
     taskDate = models.DateField()
-    startTime = models.TimeField()
-    endTime = models.TimeField()
+    # first slot of the task and the slot after its last one, see timeslots
+    startSlot = models.IntegerField()
+    endSlot = models.IntegerField()
     created_by = models.ForeignKey(User, default = None, on_delete=models.PROTECT, related_name="creators")
     creation_time = models.DateTimeField()
     updated_by = models.ForeignKey(User, default = None, on_delete=models.PROTECT, related_name="updaters")
     update_time = models.DateTimeField()
+    # incremented on every edit, used for optimistic concurrency control
+    version = models.IntegerField(default=0)
+
+    class Meta:
+        # tasks are read by calendar and date, also across all calendars of
+        # a user by the personal conflict check
+        indexes = [models.Index(fields=['calendar', 'taskDate'])]
+
+    @property
+    def startTime(self):
+        return timeslots.to_time(self.startSlot)
+
+    @property
+    def endTime(self):
+        return timeslots.to_time(self.endSlot)
 
 class Block(models.Model):
     date = models.CharField(max_length=20)
     slot = models.IntegerField()
     select_user = models.ManyToManyField(User, related_name="toblocks")
-    calendar = models.ForeignKey(Calendar, on_delete=models.PROTECT, related_name="blocks")
\ No newline at end of file
+    calendar = models.ForeignKey(Calendar, on_delete=models.PROTECT, related_name="blocks")
+
+    class Meta:
+        # availability is always read by calendar and date, often by slot range
+        indexes = [models.Index(fields=['calendar', 'date', 'slot'])]
+
+# cold storage for tasks older than the archive horizon, moved here by the
+# archive_history management command. The id of the original task is kept so
+# links to the task keep working, and the description is stored inline
+class ArchivedTask(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    topic = models.CharField(max_length=200)
+    tag = models.ForeignKey(Tag, on_delete=models.PROTECT, related_name="archived_tsk")
+    calendar = models.ForeignKey(Calendar, on_delete=models.PROTECT, related_name="archived_tasks")
+    taskDate = models.DateField()
+    startSlot = models.IntegerField()
+    endSlot = models.IntegerField()
+    location = models.CharField(blank=True, max_length=200)
+    link = models.CharField(blank=True, max_length=200)
+    text = models.CharField(blank=True, max_length=500)
+    created_by = models.ForeignKey(User, on_delete=models.PROTECT, related_name="archived_creators")
+    creation_time = models.DateTimeField()
+    updated_by = models.ForeignKey(User, on_delete=models.PROTECT, related_name="archived_updaters")
+    update_time = models.DateTimeField()
+
+    class Meta:
+        indexes = [models.Index(fields=['calendar', 'taskDate'])]
+
+    @property
+    def startTime(self):
+        return timeslots.to_time(self.startSlot)
+
+    @property
+    def endTime(self):
+        return timeslots.to_time(self.endSlot)
+
+# cold storage for availability blocks older than the archive horizon
+class ArchivedBlock(models.Model):
+    date = models.CharField(max_length=20)
+    slot = models.IntegerField()
+    select_user = models.ManyToManyField(User, related_name="archived_toblocks")
+    calendar = models.ForeignKey(Calendar, on_delete=models.PROTECT, related_name="archived_blocks")
+
+    class Meta:
+        indexes = [models.Index(fields=['calendar', 'date'])]
+
+# when a user last opened a calendar, used to sort the home page gallery by
+# recently used calendars
+class CalendarAccess(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="calendar_accesses")
+    calendar = models.ForeignKey(Calendar, on_delete=models.CASCADE, related_name="accesses")
+    last_accessed = models.DateTimeField()
+
+    class Meta:
+        unique_together = [['user', 'calendar']]
+
+# a unit of background work, run by the run_workers management command. The
+# arguments and the result are JSON encoded, see jobs.py for the job kinds
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'),
+                      (DONE, 'Done'), (FAILED, 'Failed')]
+
+    kind = models.CharField(max_length=20)
+    args = models.TextField(default="{}")
+    result = models.TextField(default="{}")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="jobs")
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=1)
+    progress = models.IntegerField(default=0)
+    total = models.IntegerField(default=0)
+    message = models.CharField(blank=True, max_length=200)
+    created_time = models.DateTimeField()
+    # not run before this time, pushed back when a failed job is retried
+    run_after = models.DateTimeField()
+    # a running job whose worker did not report back by this time is taken
+    # over by another worker
+    locked_until = models.DateTimeField(null=True, default=None)
+    finished_time = models.DateTimeField(null=True, default=None)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_after'])]
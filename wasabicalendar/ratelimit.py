@@ -0,0 +1,98 @@
+# @file: ratelimit.py
+# @brief: token buckets kept in the shared cache, used by RateLimitMiddleware
+#         to limit the JSON requests of each user and each calendar, and a
+#         per-process count of running requests for admission control of
+#         threaded and ASGI workers
+
+from django.conf import settings
+from django.core.cache import cache
+
+import math
+import threading
+import time
+
+# define macros
+BUCKET_TIMEOUT = 10 * 60 # an idle bucket is full again long before this
+
+_inflight = 0
+_inflight_lock = threading.Lock()
+
+# @brief: get the tokens in a bucket now. A bucket holds up to burst tokens
+#         and gains rate tokens per second. Buckets live in the shared cache
+#         so all workers see the same bucket; the read and the later write
+#         are not atomic, so concurrent requests may each spend the same
+#         token, which only loosens the limit by a few requests
+# @type key: string
+# @param key: cache key of the bucket
+# @type rate: float
+# @param rate: tokens added per second
+# @type burst: int
+# @param burst: size of the bucket
+# @type now: float
+# @param now: the current time in seconds
+# @returns: the number of tokens, may be fractional
+def _level(key, rate, burst, now):
+    tokens, last = cache.get(key, (burst, now))
+    return min(burst, tokens + (now - last) * rate)
+
+# @brief: take one token from each of a list of buckets, or from none of
+#         them. A refused request costs nothing, so a request refused by one
+#         bucket does not drain the others
+# @type buckets: list
+# @param buckets: (key, rate, burst) tuples, see _level
+# @returns: 0 if the tokens were taken, otherwise the seconds until every
+#           bucket has one
+def _take_all(buckets):
+    now = time.time()
+    levels = []
+    wait = 0
+    for key, rate, burst in buckets:
+        tokens = _level(key, rate, burst, now)
+        if tokens < 1:
+            wait = max(wait, math.ceil((1 - tokens) / rate))
+        levels.append(tokens)
+    if wait:
+        return wait
+    for (key, rate, burst), tokens in zip(buckets, levels):
+        cache.set(key, (tokens - 1, now), BUCKET_TIMEOUT)
+    return 0
+
+# @brief: take one token from a bucket, see _level
+# @returns: 0 if a token was taken, otherwise the seconds until one is free
+def take(key, rate, burst):
+    return _take_all([(key, rate, burst)])
+
+# @brief: check the buckets of the user and the calendar of a request. A token
+#         is taken from both or, if one of them is empty, from neither
+# @type user_key: string
+# @param user_key: the user id, or the client address for anonymous requests
+# @type cal_id: string
+# @param cal_id: the calendar of the request, "" if it has none or the user is
+#                not a member, so outsiders cannot drain the calendar bucket
+# @returns: 0 if the request may run, otherwise the seconds to wait
+def check(user_key, cal_id):
+    buckets = [("rl_user_%s" % user_key, settings.RATE_LIMIT_USER_RATE,
+                settings.RATE_LIMIT_USER_BURST)]
+    if cal_id.isdigit():
+        buckets.append(("rl_cal_%s" % cal_id, settings.RATE_LIMIT_CALENDAR_RATE,
+                        settings.RATE_LIMIT_CALENDAR_BURST))
+    return _take_all(buckets)
+
+# @brief: count a request as running in this process unless the process
+#         already runs RATE_LIMIT_MAX_INFLIGHT requests. The count is per
+#         process, so it only sheds load with threaded or ASGI workers; a sync
+#         worker runs one request at a time and never reaches the limit
+# @returns: True if the request was admitted, it must then call release()
+def admit():
+    global _inflight
+    with _inflight_lock:
+        if _inflight >= settings.RATE_LIMIT_MAX_INFLIGHT:
+            return False
+        _inflight += 1
+        return True
+
+# @brief: count an admitted request as finished
+def release():
+    global _inflight
+    with _inflight_lock:
+        _inflight -= 1
@@ -0,0 +1,157 @@
+# @file: search.py
+# @brief: full-text index of task topics and descriptions. On SQLite the index
+#         is an FTS5 virtual table, on PostgreSQL a table of tsvectors with a
+#         GIN index; other backends fall back to icontains filters. The index
+#         is keyed by task id, which archived tasks keep, so archiving a task
+#         does not remove it from the index. The index table is created by
+#         migration 0013_task_search_index
+
+from django.db import connection
+from django.db.models import Q
+
+from wasabicalendar.models import Description, Task, ArchivedTask
+
+import re
+
+# define macros
+INDEX_TABLE = "wasabicalendar_task_fts"
+PAGE_SIZE = 20
+MAX_TERMS = 8 # longer queries only slow the search down
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# @brief: check whether the database has a native full-text index
+def _is_native():
+    return connection.vendor in ('sqlite', 'postgresql')
+
+# @brief: SQL that selects the indexed columns of live or archived tasks
+# @param archived: True to select from the archive, where descriptions are
+#                  stored on the task itself
+# @param where: condition on the task table, aliased "t"
+# @returns: a SELECT statement with columns id, calendar_id, topic, text,
+#           location, link
+def _source_sql(archived, where):
+    if archived:
+        return ("SELECT t.id, t.calendar_id, t.topic, t.text, t.location, "
+                "t.link FROM %s t WHERE %s" % (ArchivedTask._meta.db_table, where))
+    return ("SELECT t.id, t.calendar_id, t.topic, d.text, d.location, d.link "
+            "FROM %s t JOIN %s d ON d.id = t.description_id WHERE %s"
+            % (Task._meta.db_table, Description._meta.db_table, where))
+
+# @brief: insert the rows selected by _source_sql into the index
+def _insert(cursor, source_sql, params):
+    if connection.vendor == 'sqlite':
+        cursor.execute("INSERT INTO %s (rowid, calendar_id, topic, text, "
+                       "location, link) %s" % (INDEX_TABLE, source_sql), params)
+    else:
+        # the topic weighs more than the description in the ranking
+        cursor.execute(
+            "INSERT INTO %s (task_id, calendar_id, document) SELECT s.id, "
+            "s.calendar_id, setweight(to_tsvector('simple', s.topic), 'A') || "
+            "to_tsvector('simple', s.text || ' ' || s.location || ' ' || s.link) "
+            "FROM (%s) s" % (INDEX_TABLE, source_sql), params)
+
+# @brief: delete index rows by task id
+def _delete(cursor, task_ids):
+    key = 'rowid' if connection.vendor == 'sqlite' else 'task_id'
+    cursor.execute("DELETE FROM %s WHERE %s IN (%s)"
+                   % (INDEX_TABLE, key, ", ".join(["%s"] * len(task_ids))),
+                   task_ids)
+
+# @brief: (re)index live tasks, called after they are created or modified
+# @type task_ids: list
+# @param task_ids: ids of the tasks, their descriptions are indexed too
+def index_tasks(task_ids):
+    task_ids = [int(i) for i in task_ids]
+    if not task_ids or not _is_native():
+        return
+    with connection.cursor() as cursor:
+        _delete(cursor, task_ids)
+        _insert(cursor, _source_sql(False, "t.id IN (%s)"
+                                    % ", ".join(["%s"] * len(task_ids))),
+                task_ids)
+
+# @brief: remove deleted tasks from the index
+# @type task_ids: list
+def unindex_tasks(task_ids):
+    task_ids = [int(i) for i in task_ids]
+    if not task_ids or not _is_native():
+        return
+    with connection.cursor() as cursor:
+        _delete(cursor, task_ids)
+
+# @brief: (re)index every live and archived task of a calendar with one
+#         statement per table, used after bulk inserts that skip index_tasks
+# @type cal_id: int
+def index_calendar(cal_id):
+    if not _is_native():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM %s WHERE calendar_id = %%s" % INDEX_TABLE,
+                       [int(cal_id)])
+        for archived in (False, True):
+            _insert(cursor, _source_sql(archived, "t.calendar_id = %s"),
+                    [int(cal_id)])
+
+# @brief: rebuild the whole index from the task tables
+def rebuild_index():
+    if not _is_native():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM %s" % INDEX_TABLE)
+        for archived in (False, True):
+            _insert(cursor, _source_sql(archived, "1 = 1"), [])
+
+# @brief: search the tasks of some calendars. Every word of the query must
+#         match the start of a word of the topic, description, location or
+#         link of the task
+# @type cal_ids: list
+# @param cal_ids: ids of the calendars to search
+# @type query: string
+# @param query: the text typed by the user
+# @type page: int
+# @param page: 0 based page number
+# @returns: a tuple (list of task ids of the page, best match first, True if
+#           there are more pages)
+def search_task_ids(cal_ids, query, page=0):
+    words = WORD_RE.findall(query.lower())[:MAX_TERMS]
+    cal_ids = [int(i) for i in cal_ids]
+    if not words or not cal_ids:
+        return ([], False)
+    # one row more than a page tells whether there is a next page
+    limit = PAGE_SIZE + 1
+    offset = page * PAGE_SIZE
+    in_cals = ", ".join(["%s"] * len(cal_ids))
+    if connection.vendor == 'sqlite':
+        # quoted prefix terms, so no word is read as FTS5 query syntax
+        match = " ".join('"%s"*' % w for w in words)
+        sql = ("SELECT rowid FROM %s WHERE %s MATCH %%s AND calendar_id IN (%s) "
+               "ORDER BY bm25(%s, 4.0, 1.0, 1.0, 1.0), rowid LIMIT %%s OFFSET %%s"
+               % (INDEX_TABLE, INDEX_TABLE, in_cals, INDEX_TABLE))
+        params = [match] + cal_ids + [limit, offset]
+    elif connection.vendor == 'postgresql':
+        match = " & ".join("%s:*" % w for w in words)
+        sql = ("SELECT task_id FROM %s, to_tsquery('simple', %%s) q WHERE "
+               "document @@ q AND calendar_id IN (%s) ORDER BY "
+               "ts_rank(document, q) DESC, task_id LIMIT %%s OFFSET %%s"
+               % (INDEX_TABLE, in_cals))
+        params = [match] + cal_ids + [limit, offset]
+    else:
+        return _search_fallback(cal_ids, words, limit, offset)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        ids = [row[0] for row in cursor.fetchall()]
+    return (ids[:PAGE_SIZE], len(ids) > PAGE_SIZE)
+
+# @brief: search live tasks with icontains filters on backends without a
+#         full-text index. Newest tasks come first
+# @returns: same as search_task_ids
+def _search_fallback(cal_ids, words, limit, offset):
+    tasks = Task.objects.filter(calendar_id__in=cal_ids)
+    for w in words:
+        tasks = tasks.filter(Q(topic__icontains=w) |
+                             Q(description__text__icontains=w) |
+                             Q(description__location__icontains=w) |
+                             Q(description__link__icontains=w))
+    ids = list(tasks.order_by('-taskDate', 'id')
+                    .values_list('id', flat=True)[offset:offset + limit])
+    return (ids[:PAGE_SIZE], len(ids) > PAGE_SIZE)
@@ -0,0 +1,34 @@
+# @file: startup.py
+# @brief: warm up a web process before it serves requests. Called by wsgi.py
+#         and asgi.py, so under a preloading server (gunicorn --preload) the
+#         master pays for the imports once and every forked worker starts
+#         ready instead of paying for them on its first request
+
+from django.conf import settings
+from django.contrib.auth import get_backends
+from django.urls import get_resolver
+
+import os
+import sys
+
+# @brief: check whether this process is a gunicorn master started with
+#         --preload, whose imports are shared by all forked workers
+# @returns: True if the application is being preloaded
+def _preloading():
+    return ("--preload" in sys.argv or
+            "--preload" in os.environ.get("GUNICORN_CMD_ARGS", ""))
+
+# @brief: import the URLconf with all views, and the authentication backends
+#         such as the Google OAuth backend, which are otherwise imported on
+#         the first request. Opens no database connection, those must not be
+#         shared with forked workers. Without preloading every worker would
+#         pay for the imports before it can serve, so unless STARTUP_WARM_UP
+#         is set it only runs under gunicorn --preload
+def warm_up():
+    enabled = settings.STARTUP_WARM_UP
+    if enabled is None:
+        enabled = _preloading()
+    if not enabled:
+        return
+    get_resolver().url_patterns
+    get_backends()
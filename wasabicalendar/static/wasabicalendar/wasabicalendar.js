@@ -5,6 +5,10 @@
  * 
  * Functions include loading page with udpate of calendar and tag, switching
  * to prev/next week, and get task info.
+ *
+ * The calendar page keeps the weeks it showed and the changes the user made
+ * in IndexedDB. Changes are shown right away and saved in batches, so the
+ * page keeps working on a slow or lost connection.
  * 
  * The HTML to calendar are generated frequently based on server response.
  *
@@ -13,17 +17,117 @@
 
 "use strict"
 
+// poll delays in ms, the delay doubles on every unchanged poll
+const POLL_MIN = 1000
+const POLL_MAX = 60000
+var pollDelay = POLL_MIN
+var pollTimer = null
+
+/**
+ * @brief Start polling the calendar, called once by the calendar page.
+ * Polling pauses while the tab is hidden and resumes with a poll right
+ * away when it is shown again
+ */
+function startPolling() {
+    document.addEventListener("visibilitychange", function () {
+        window.clearTimeout(pollTimer)
+        pollTimer = null
+        if (!document.hidden) {
+            pollDelay = POLL_MIN
+            loadPage()
+        }
+    })
+    window.addEventListener("online", function () {
+        syncRetry = POLL_MIN
+        scheduleSync(0)
+        pollSoon()
+    })
+    let cid = document.getElementById("cal_id").value
+    let week = document.getElementById("week_info").value
+    openLocalStore(function () {
+        // show the stored copy of the week until the server answers, and
+        // send the changes left over from the last visit
+        loadWeek(cid, week, function (text) {
+            if (text != null && lastResponseText == null) showWeek(text)
+        })
+        loadOutbox(cid, function () {
+            renderLocal()
+            scheduleSync(0)
+        })
+    })
+    loadPage()
+}
+
+/**
+ * @brief Schedule the next poll after a poll response. A changed response
+ * polls again fast, an unchanged one backs off up to the interval the server
+ * suggests for the calendar, which is short while others are editing it
+ *
+ * @param[in] xhr: XHR response of the last poll
+ * @param[in] changed: true if the response differs from the previous one
+ */
+function schedulePoll(xhr, changed) {
+    let suggested = parseInt(xhr.getResponseHeader("X-Poll-Interval"))
+    if (isNaN(suggested)) suggested = POLL_MAX
+    if (xhr.status == 429) {
+        pollDelay = Math.max(pollDelay, retryAfter(xhr))
+    } else if (changed) {
+        pollDelay = POLL_MIN
+    } else {
+        pollDelay = Math.min(pollDelay * 2, Math.max(suggested, POLL_MIN), 
+                             POLL_MAX)
+    }
+    window.clearTimeout(pollTimer)
+    pollTimer = null
+    if (!document.hidden) {
+        pollTimer = window.setTimeout(loadPage, pollDelay)
+    }
+}
+
+/**
+ * @brief Get the time a rate limited client must wait before the next request
+ *
+ * @param[in] xhr: XHR response with status 429
+ * @return the wait in ms, at least POLL_MIN
+ */
+function retryAfter(xhr) {
+    let seconds = parseInt(xhr.getResponseHeader("Retry-After"))
+    if (isNaN(seconds)) return POLL_MIN
+    return Math.max(seconds * 1000, POLL_MIN)
+}
+
+/**
+ * @brief Go back to fast polling, called after local edits so changes of
+ * other members show up soon too
+ */
+function pollSoon() {
+    pollDelay = POLL_MIN
+    if (pollTimer != null) {
+        window.clearTimeout(pollTimer)
+        pollTimer = window.setTimeout(loadPage, pollDelay)
+    }
+}
+
 /**
  * @brief Send a new request to load all calendar info in response to
  * the function call in window.onload in calendar page view
  *
- * loadPage is called every 1000 ms to fetch calendar info
+ * loadPage is called by the poll scheduler, see schedulePoll
  */
 function loadPage() {
+    pollTimer = null
+    let nav = navSeq
+    let generation = syncGeneration
     let xhr = new XMLHttpRequest()
     xhr.onreadystatechange = function () {
         if (this.readyState != 4) return
-        updatePage(xhr)
+        let changed = (xhr.responseText != lastResponseText)
+        // the user moved to another week while the poll was out
+        if (nav == navSeq) {
+            if (xhr.status == 200) dropSyncedOps(generation)
+            updatePage(xhr)
+        }
+        schedulePoll(xhr, changed)
     }
 
     // fetch calendar json with current calendar id
@@ -31,7 +135,9 @@ function loadPage() {
     let cid = cal_id.value
     let week_info = document.getElementById("week_info")
     let week = week_info.value
-    xhr.open("GET", `wasabicalendar/get-cal-list?cal_id=${cid}&week=${week}`)
+    let tags_version = document.getElementById("tags_version").value
+    xhr.open("GET", `wasabicalendar/get-cal-list?cal_id=${cid}&week=${week}` +
+             `&tags_version=${tags_version}`)
     xhr.send()
 }
 
@@ -43,20 +149,29 @@ function loadPage() {
  * of calendar block info + task info for current week.
  */
 function updatePage(xhr) {
+    // rate limited, the poll scheduler waits as long as the server asks
+    if (xhr.status == 429) return
+
     if (xhr.status == 200) { // if status is normal
-        let response = JSON.parse(xhr.responseText)
-        updateTag(response)
-        updateCalendar(response)
-        // update week info
-        let week_info = document.getElementById("week_info")
-        let week = response['week']
-        week_info.value = week[0]
-        updateCalHead(week)
+        setOffline(false)
+        // nothing to render if neither the payload nor our own changes changed
+        if (xhr.responseText == lastResponseText && 
+                localVersion == lastLocalVersion) {
+            return
+        }
+        let fresh = (xhr.responseText != lastResponseText)
+        let response = showWeek(xhr.responseText)
+        if (fresh) {
+            saveWeek(document.getElementById("cal_id").value, 
+                     response['week'][0], xhr.responseText)
+        }
+        return
     }
 
-    // cannot connect to server
+    // cannot connect to server, keep showing what we have
     if (xhr.status == 0) {
-        displayError("Cannot connect to server")
+        setOffline(true)
+        return
     }
 
     // response in incorrect format
@@ -73,6 +188,37 @@ function updatePage(xhr) {
     }
 }
 
+/**
+ * @brief Render a week payload of get-cal-list, from the server or from the
+ * local copy, with the changes not saved yet on top
+ *
+ * @param[in] text: JSON text of the payload
+ * @return the parsed payload
+ */
+function showWeek(text) {
+    lastResponseText = text
+    lastLocalVersion = localVersion
+    let response = JSON.parse(text)
+    updateTag(response)
+    applyLocalChanges(response)
+    applyBusy(response)
+    updateCalendar(response)
+    // update week info
+    let week = response['week']
+    document.getElementById("week_info").value = week[0]
+    updateCalHead(week)
+    return response
+}
+
+/**
+ * @brief Render the week on screen again after a local change
+ */
+function renderLocal() {
+    localVersion += 1
+    updateSyncStatus()
+    if (lastResponseText != null) showWeek(lastResponseText)
+}
+
 /**
  * @brief Update calendar header by setting wkday innerHTML
  *
@@ -91,9 +237,12 @@ function updateCalHead(week) {
 }
 
 /*
-  @ brief: update HTML of tags list using AJAX
+  @ brief: update HTML of tags list using AJAX. The server only sends the
+  tags when they changed since the version we hold, so skip otherwise
 */
 function updateTag(response) {
+    if (!response.hasOwnProperty('tags')) return
+    document.getElementById("tags_version").value = response['tags_version']
     let tag_data = response['tags']
     let list = document.getElementById("my_tags_go_here")
     var tagHTML = ""
@@ -104,11 +253,47 @@ function updateTag(response) {
                 + item.name + "</li>"
     }
     list.innerHTML = tagHTML
+    let choices = ""
+    for (let i = 0; i < tag_data.length; i++) {
+        let item = tag_data[i]
+        choices += ("<option value=\"" + item.id + "\" data-color=\"" + 
+                    item.color + "\">" + item.name + "</option>")
+    }
+    document.getElementById("id_quick_tag").innerHTML = choices
 }
 
+/**
+ * @brief Find a tag of the calendar in the tag choices of the quick task form
+ *
+ * @param[in] id: id of the tag
+ * @return the option element of the tag, null if the tag is unknown
+ */
+function findTag(id) {
+    let options = document.getElementById("id_quick_tag").options
+    for (let i = 0; i < options.length; i++) {
+        if (options[i].value == id) return options[i]
+    }
+    return null
+}
+
+
+// last rendered poll response and local state, to skip unchanged polls
+var lastResponseText = null
+var lastLocalVersion = -1
+// bumped whenever our own unsaved changes change what the grid shows
+var localVersion = 0
+// bumped on every week change, responses for an older week are dropped
+var navSeq = 0
+// signature of every rendered cell, index of block in 96*7 blocks -> string
+var cellModel = null
+// cells changed since the last frame, index -> [signature, inner HTML]
+var pendingCells = {}
+var renderFrame = null
 
 /**
- * @brief Update calendar content by setting new innerHTML
+ * @brief Update calendar content. The whole grid is built once, after that
+ * only the cells whose blocks or tasks changed are rewritten, all in one
+ * animation frame.
  *
  * @param[in] response: entire JSON response from server
  * data field contains all list of blocks and tasks to display
@@ -116,9 +301,14 @@ function updateTag(response) {
 function updateCalendar(response) {
     // adds each new block to the list
     let taskBlocks = response['data'] // tasks
+    let week = response['week'][0]
+    let fullRender = (cellModel == null || 
+                      document.getElementById("id_grid_0") == null)
 
     var finalHTML = "<div class=\"week\">"
     finalHTML += makeHour() // make Hour for 4-15min time slots
+    let newModel = []
+    let titles = {} // block titles, set through the DOM after rendering
     for (let i = 0; i<taskBlocks.length; i++) {
         // access current block number
         var curDayBlock = taskBlocks[i]
@@ -140,15 +330,68 @@ function updateCalendar(response) {
             } catch {
                 curTasks = []
             }
-    
-            // add elements to list
-            var curGrid = makeCalendarGrid(i, 96*i+j, curNum, inBlock, curTasks)
-            finalHTML += curGrid;
+            let busy = curTimeBlock["busy"] || ""
+
+            let idx = 96*i+j
+            let sig = cellSignature(week, idx, curNum, inBlock, curTasks) + 
+                      "|" + busy
+            newModel.push(sig)
+            if (fullRender) {
+                // add elements to list
+                finalHTML += makeCalendarGrid(i, idx, curNum, inBlock, curTasks, 
+                                              busy)
+                titles[idx] = blockTitle(idx, curNum, busy)
+            } else if (sig != cellModel[idx]) {
+                pendingCells[idx] = [sig, makeBlock(idx, curNum, inBlock, busy) + 
+                                          makeTasks(i, idx, curTasks),
+                                     blockTitle(idx, curNum, busy)]
+            }
         }
     }
-    finalHTML += "</div>" // finish front calendar week div
-    let cal = document.getElementById("front_content")
-    cal.innerHTML = finalHTML
+
+    if (fullRender) {
+        finalHTML += "</div>" // finish front calendar week div
+        let cal = document.getElementById("front_content")
+        cal.innerHTML = finalHTML
+        for (let idx in titles) {
+            setBlockTitle(idx, titles[idx])
+        }
+        cellModel = newModel
+        pendingCells = {}
+        return
+    }
+    if (renderFrame == null && Object.keys(pendingCells).length > 0) {
+        renderFrame = window.requestAnimationFrame(renderPendingCells)
+    }
+}
+
+/**
+ * @brief Write all cells changed since the last frame to the DOM
+ */
+function renderPendingCells() {
+    renderFrame = null
+    for (let idx in pendingCells) {
+        let grid = document.getElementById("id_grid_" + idx)
+        grid.innerHTML = pendingCells[idx][1]
+        setBlockTitle(idx, pendingCells[idx][2])
+        cellModel[idx] = pendingCells[idx][0]
+    }
+    pendingCells = {}
+}
+
+/**
+ * @brief Signature of everything a cell displays, equal signatures mean the
+ * cell does not need to be rendered again
+ *
+ * @param[in] week: Monday of the week shown
+ * @param[in] idx: index of block in 96*7 blocks
+ * @param[in] counter: integer counter of number of selected user
+ * @param[in] inBlock: true if user in block false otherwise
+ * @param[in] tasks: list of task info
+ * @return signature string
+ */
+function cellSignature(week, idx, counter, inBlock, tasks) {
+    return week + "|" + counter + "|" + inBlock + "|" + JSON.stringify(tasks)
 }
 
 /**
@@ -178,18 +421,19 @@ function makeHour() {
  * @param[in] counter: integer counter of number of selected user
  * @param[in] inBlock: true if user in block false otherwise
  * @param[in] tasks: list of task info
+ * @param[in] busy: tasks of other calendars at this time, "" if none
  * @return HTML for time slot grid div
  */
-function makeCalendarGrid(dayIdx, idx, counter, inBlock, tasks){
+function makeCalendarGrid(dayIdx, idx, counter, inBlock, tasks, busy){
     var res = ""
     // if mod 4 = 0 then start of an hour
     if (idx % 4 == 0) {
         res += "<div class=\"hour\">"
     }
     // grid start
-    res += "<div class = \"grid\">"
+    res += "<div class = \"grid\" id=\"id_grid_" + idx + "\">"
     // make background block
-    res += makeBlock(idx, counter, inBlock)
+    res += makeBlock(idx, counter, inBlock, busy)
     // add tasks
     res += makeTasks(dayIdx, idx, tasks)
     // div end
@@ -207,10 +451,11 @@ function makeCalendarGrid(dayIdx, idx, counter, inBlock, tasks){
  * @param[in] dayIdx: integer index of current day in week
  * @param[in] counter: integer counter of number of selected user
  * @param[in] inBlock: true if user in block false otherwise
+ * @param[in] busy: tasks of other calendars at this time, "" if none
  * @return HTML for selected block div
  */
-function makeBlock(idx, counter, inBlock) {
-    var res = "<button class=\"cell_"
+function makeBlock(idx, counter, inBlock, busy) {
+    var res = "<button class=\"" + (busy ? "busy " : "") + "cell_"
     var curNumStr = ""
     if (counter <= 5) {
         curNumStr = counter.toString()
@@ -222,11 +467,94 @@ function makeBlock(idx, counter, inBlock) {
             inBlock.toString())
     // add id to block
     res += "\" id=\"id_block_"+ idx + "\" "
-    // add onclick function
-    res += "onclick=\"flip_block(" + idx + ")\"></button>"
+    // add onclick function and lazy hover details
+    res += "onclick=\"flip_block(" + idx + ")\" "
+    res += "onmouseenter=\"show_members(" + idx + ", " + counter + ")\" "
+    res += "></button>"
     return res
 }
 
+/**
+ * @brief Title of a block: the names of the available members if they were
+ * fetched, otherwise the busy times. It holds user text, so it is never put
+ * into HTML but set with setBlockTitle
+ *
+ * @param[in] idx: index of block in 96*7 blocks
+ * @param[in] counter: integer counter of number of selected user
+ * @param[in] busy: tasks of other calendars at this time, "" if none
+ * @return title text, "" if none
+ */
+function blockTitle(idx, counter, busy) {
+    return memberTitles[memberKey(idx, counter)] || busy
+}
+
+/**
+ * @brief Set the title of a rendered block through the DOM
+ *
+ * @param[in] idx: index of block in 96*7 blocks
+ * @param[in] title: title text, nothing is set if empty
+ */
+function setBlockTitle(idx, title) {
+    let block = document.getElementById("id_block_" + idx)
+    if (block && title) block.title = title
+}
+
+// hover details already fetched, memberKey -> title text
+var memberTitles = {}
+var memberTimer = null
+const MEMBER_DELAY = 250 // ms to hover before member names are fetched
+
+/**
+ * @brief Key of the hover details of a block. The count is part of the key
+ * so details are fetched again once the availability of the block changes.
+ */
+function memberKey(idx, counter) {
+    let week = document.getElementById("week_info").value
+    return week + "_" + idx + "_" + counter
+}
+
+/**
+ * @brief Show the names of the members available in a block as its title
+ * after the mouse rests on it, fetching them only once per block state
+ *
+ * @param[in] idx: index of block in 96*7 blocks
+ * @param[in] counter: integer counter of number of selected user
+ */
+function show_members(idx, counter) {
+    if (memberTimer != null) window.clearTimeout(memberTimer)
+    if (counter == 0 || memberTitles[memberKey(idx, counter)]) return
+    memberTimer = window.setTimeout(function () {
+        memberTimer = null
+        let key = memberKey(idx, counter)
+        let cid = document.getElementById("cal_id").value
+        let week = document.getElementById("week_info").value
+        let monday = new Date(week + "T00:00:00")
+        monday.setDate(monday.getDate() + Math.floor(idx / 96))
+        let date = monday.getFullYear() + "-" + 
+                   String(monday.getMonth() + 1).padStart(2, "0") + "-" + 
+                   String(monday.getDate()).padStart(2, "0")
+        let slot = idx % 96
+
+        let xhr = new XMLHttpRequest()
+        xhr.onreadystatechange = function () {
+            if (this.readyState != 4 || xhr.status != 200) return
+            let members = JSON.parse(xhr.responseText)['members']
+            let names = []
+            for (let i = 0; i < members.length; i++) {
+                let name = (members[i].first_name + " " + 
+                            members[i].last_name).trim()
+                names.push(name || members[i].username)
+            }
+            memberTitles[key] = names.join(", ")
+            let block = document.getElementById("id_block_" + idx)
+            setBlockTitle(idx, memberTitles[key])
+        }
+        xhr.open("GET", `wasabicalendar/availability-members?cal_id=${cid}` + 
+                 `&date=${date}&start_slot=${slot}&end_slot=${slot + 1}`)
+        xhr.send()
+    }, MEMBER_DELAY)
+}
+
 /**
  * @brief Make HTML for tasks 
  *
@@ -282,6 +610,15 @@ function makeTasks(dayIdx, idx, tasks) {
  * @param[in] id: id of task
  */
 function flip_task(id) {
+    if (id < 0) {
+        // a task created on this page that the server does not have yet
+        let op = outbox.find(function (op) { return op.seq == -id })
+        if (op == null) return
+        updateBack({id: id, topic: escapeHTML(op.task.topic), link: "", 
+                    location: "", description: "", date: op.task.taskDate, 
+                    startTime: op.task.startTime, endTime: op.task.endTime})
+        return
+    }
     let xhr = new XMLHttpRequest()
     xhr.onreadystatechange = function () {
         if (this.readyState != 4) return
@@ -306,8 +643,10 @@ function get_back(xhr) {
         updateBack(response)
     }
 
+    // cannot connect to server, the grid stays usable
     if (xhr.status == 0) {
-        displayError("Cannot connect to server")
+        setOffline(true)
+        return
     }
 
     if (!xhr.getResponseHeader('content-type') == 'application/json') {
@@ -330,6 +669,17 @@ function get_back(xhr) {
  * data field contains all task related field to be displayed
  */
 function updateBack(response) {
+    // our own edits the server does not have yet
+    for (let i = 0; i < outbox.length; i++) {
+        let op = outbox[i]
+        if (op.type == "modify" && op.task_id == response['id']) {
+            response['topic'] = escapeHTML(op.task.topic)
+            response['date'] = op.task.taskDate
+            response['startTime'] = op.task.startTime
+            response['endTime'] = op.task.endTime
+        }
+    }
+    backTask = response
     // get info from response
     let data = response
     let id = data['id']
@@ -344,6 +694,9 @@ function updateBack(response) {
     let back = document.getElementById("back_calendar") // 24*7 blocks 
     let backHTML = makeBackHTML(id, topic, description, location, link, 
                                 date, startTime, endTime)
+    if (data.hasOwnProperty('version')) {
+        backHTML += makeEditHTML(data)
+    }
     back.innerHTML = backHTML // set back HTML to result of makeBackHTML
     back.onclick=flip_back
     back.value = id
@@ -390,43 +743,654 @@ function makeBackHTML(id, topic, des, location, link, date, startTime, endTime){
 }
 
 
+// task shown on the back page, as sent by get-task
+var backTask = null
+
+/**
+ * @brief Make the HTML of the form that edits a task in place on the back
+ * page. Clicks in the form must not flip the page back
+ *
+ * @param[in] task: task dict from get-task
+ * @return HTML of the form
+ */
+function makeEditHTML(task) {
+    var res = "<form class=\"back_wrapper\" onclick=\"event.stopPropagation()\" "
+    res += "onsubmit=\"save_task(); return false\">"
+    res += ("<input id=\"id_edit_topic\" type=\"text\" class=\"invite_form\" " +
+            "value=\"" + task.topic + "\">")
+    res += ("<input id=\"id_edit_date\" type=\"date\" class=\"invite_form\" " +
+            "value=\"" + task.date + "\">")
+    res += ("<input id=\"id_edit_start\" type=\"time\" class=\"invite_form\" " +
+            "value=\"" + task.startTime.slice(0, 5) + "\">")
+    res += ("<input id=\"id_edit_end\" type=\"time\" class=\"invite_form\" " +
+            "value=\"" + task.endTime.slice(0, 5) + "\">")
+    res += "<button type=\"submit\" class=\"add_btn\">Save</button>"
+    res += ("<button type=\"button\" class=\"add_btn\" " +
+            "onclick=\"delete_task()\">Delete</button>")
+    res += "<div id=\"id_edit_message\"></div>"
+    res += "</form>"
+    return res
+}
+
+/**
+ * @brief Check the fields of a task before queueing it, the server checks
+ * them again when the change is saved
+ *
+ * @param[in] task: task fields, see TaskForm
+ * @return an error message, "" if the fields are fine
+ */
+function checkTask(task) {
+    if (task.topic.trim() == "" || task.taskDate == "" || 
+            task.startTime == "" || task.endTime == "") {
+        return "Please fill in topic, date and times."
+    }
+    if (task.startTime >= task.endTime) {
+        return "Start time must be before end time."
+    }
+    if (floorSlot(task.startTime) == ceilSlot(task.endTime)) {
+        return "Task cannot begin after 11:45PM"
+    }
+    return ""
+}
+
+/**
+ * @brief Save the changes of the edit form on the back page. The task moves
+ * at once, the change is saved with the next batch
+ */
+function save_task() {
+    let task = {
+        topic: document.getElementById("id_edit_topic").value,
+        tag: backTask.tag,
+        description: backTask.description,
+        location: backTask.location,
+        link: backTask.link,
+        taskDate: document.getElementById("id_edit_date").value,
+        startTime: document.getElementById("id_edit_start").value,
+        endTime: document.getElementById("id_edit_end").value
+    }
+    let message = checkTask(task)
+    if (message != "") {
+        document.getElementById("id_edit_message").innerHTML = message
+        return
+    }
+    let last = outbox[outbox.length - 1]
+    if (last && last.type == "modify" && last.task_id == backTask.id && 
+            !last.sending && last.synced == null) {
+        // edited again before the first edit was saved
+        last.task = task
+        storeOp(last)
+    } else {
+        queueOp({type: "modify", task_id: backTask.id, 
+                 version: backTask.version, task: task})
+    }
+    renderLocal()
+    scheduleSync(0)
+    flip_back()
+}
+
+/**
+ * @brief Delete the task on the back page. It disappears at once, the
+ * change is saved with the next batch
+ */
+function delete_task() {
+    queueOp({type: "delete", task_id: backTask.id, version: backTask.version})
+    renderLocal()
+    scheduleSync(0)
+    flip_back()
+}
+
+/**
+ * @brief Create a task from the quick task form in the side bar. The task
+ * shows up at once, the change is saved with the next batch
+ */
+function quick_task() {
+    let task = {
+        topic: document.getElementById("id_quick_topic").value,
+        tag: document.getElementById("id_quick_tag").value,
+        description: "",
+        location: "",
+        link: "",
+        taskDate: document.getElementById("id_quick_date").value,
+        startTime: document.getElementById("id_quick_start").value,
+        endTime: document.getElementById("id_quick_end").value
+    }
+    let message = checkTask(task)
+    document.getElementById("id_quick_message").innerHTML = message
+    if (message != "") return
+    queueOp({type: "create", task: task})
+    document.getElementById("id_quick_topic").value = ""
+    renderLocal()
+    scheduleSync(0)
+}
+
 /**
  * @brief Flip the selected field for current block slot
  * If previously selected, now unselect the block.
  * Otherwise, select the block.
  *
+ * The block changes on screen right away. The new state is queued and saved
+ * with the other changes of the next SYNC_DELAY ms, so sweeping across the
+ * grid costs a single write on the server.
+ *
  * @param[in] id: id of the block to be flipped
  */
 function flip_block(id) {
     // get current block
     let block = document.getElementById("id_block_"+id)
-    let blockSelectVal = block.value
-    if (blockSelectVal == "true") {
-        block.value = "false"
+    let wanted = (block.value != "true")
+    block.value = wanted.toString() // flip the value
+
+    let week = document.getElementById("week_info").value
+    let last = outbox[outbox.length - 1]
+    if (last && last.type == "blocks" && last.week == week && 
+            !last.sending && last.synced == null) {
+        // add to the batch of blocks that is still waiting
+        last.blocks[id] = wanted
+        storeOp(last)
     } else {
-        block.value = "true"
-    } // flip the value
+        let blocks = {}
+        blocks[id] = wanted
+        queueOp({type: "blocks", week: week, blocks: blocks})
+    }
+    renderLocal()
+    scheduleSync(SYNC_DELAY)
+    pollSoon()
+}
+
 
-    let calid = document.getElementById("cal_id")
-    try {
-        var cal_id = parseInt(calid.value)
-    } catch {
-        var cal_id = 0 // invalid calendar id
+// IndexedDB database with the weeks shown before ("weeks") and the changes
+// not saved on the server yet ("outbox"). Without IndexedDB, e.g. in some
+// private windows, the page keeps both in memory only
+const LOCAL_DB_NAME = "wasabicalendar"
+const LOCAL_DB_VERSION = 1
+const LOCAL_WEEKS_MAX = 50 // weeks kept, the least recently saved go first
+var localDB = null
+
+/**
+ * @brief Open the local database, creating its stores on first use
+ *
+ * @param[in] done: called once the database is open or failed to open
+ */
+function openLocalStore(done) {
+    if (!window.indexedDB) {
+        done()
+        return
+    }
+    let request = window.indexedDB.open(LOCAL_DB_NAME, LOCAL_DB_VERSION)
+    request.onupgradeneeded = function () {
+        let db = request.result
+        let weeks = db.createObjectStore("weeks", {keyPath: "key"})
+        weeks.createIndex("saved", "saved")
+        db.createObjectStore("outbox", {keyPath: "id"})
+    }
+    request.onsuccess = function () {
+        localDB = request.result
+        done()
+    }
+    request.onerror = function () {
+        done()
+    }
+}
+
+/**
+ * @brief Keep the payload of a week for the next time it is shown
+ *
+ * @param[in] cid: id of the calendar
+ * @param[in] week: Monday of the week
+ * @param[in] text: JSON text of the get-cal-list payload
+ */
+function saveWeek(cid, week, text) {
+    if (localDB == null) return
+    let store = localDB.transaction("weeks", "readwrite").objectStore("weeks")
+    store.put({key: cid + "|" + week, text: text, saved: Date.now()})
+    let count = store.count()
+    count.onsuccess = function () {
+        let extra = count.result - LOCAL_WEEKS_MAX
+        if (extra <= 0) return
+        store.index("saved").openCursor().onsuccess = function (event) {
+            let cursor = event.target.result
+            if (cursor == null || extra <= 0) return
+            cursor.delete()
+            extra -= 1
+            cursor.continue()
+        }
+    }
+}
+
+/**
+ * @brief Get the stored payload of a week
+ *
+ * @param[in] cid: id of the calendar
+ * @param[in] week: Monday of the week
+ * @param[in] done: called with the JSON text, null if the week is not stored
+ */
+function loadWeek(cid, week, done) {
+    if (localDB == null) {
+        done(null)
+        return
+    }
+    let request = localDB.transaction("weeks").objectStore("weeks")
+                         .get(cid + "|" + week)
+    request.onsuccess = function () {
+        done(request.result ? request.result.text : null)
+    }
+    request.onerror = function () {
+        done(null)
+    }
+}
+
+
+// changes of this calendar not saved on the server yet, in the order they
+// were made. Every change is a dict with the fields the sync endpoint takes,
+// plus "seq" for the order, "cal_id", and while a batch is out "sending".
+// Saved changes stay until a poll sent after the save, "synced" is the
+// syncGeneration of the save
+var outbox = []
+var outboxSeq = 0
+// bumped whenever a batch of changes was saved
+var syncGeneration = 0
+var syncTimer = null
+var syncing = false
+var syncRetry = POLL_MIN
+var offline = false
+const SYNC_DELAY = 300 // ms to collect changes before saving them
+const SYNC_MAX_OPS = 100 // changes saved in one request
+
+/**
+ * @brief Load the changes of a calendar left in the local database by an
+ * earlier visit
+ *
+ * @param[in] cid: id of the calendar
+ * @param[in] done: called once the changes are in the outbox
+ */
+function loadOutbox(cid, done) {
+    if (localDB == null) {
+        done()
+        return
+    }
+    let request = localDB.transaction("outbox").objectStore("outbox").getAll()
+    request.onsuccess = function () {
+        let ops = request.result.filter(function (op) {
+            return op.cal_id == cid
+        })
+        ops.sort(function (a, b) { return a.seq - b.seq })
+        for (let i = 0; i < ops.length; i++) {
+            ops[i].sending = false
+            outboxSeq = Math.max(outboxSeq, ops[i].seq)
+        }
+        // changes made while the database was opening come last
+        outbox = ops.concat(outbox)
+        done()
+    }
+    request.onerror = function () {
+        done()
+    }
+}
+
+/**
+ * @brief Add a change to the outbox and the local database
+ *
+ * @param[in] op: the change, see outbox
+ * @return the change
+ */
+function queueOp(op) {
+    outboxSeq = Math.max(outboxSeq + 1, Date.now())
+    op.seq = outboxSeq
+    op.id = op.seq.toString(36) + Math.random().toString(36).slice(2, 10)
+    op.cal_id = document.getElementById("cal_id").value
+    outbox.push(op)
+    storeOp(op)
+    return op
+}
+
+/**
+ * @brief Write a change of the outbox to the local database again
+ *
+ * @param[in] op: the change
+ */
+function storeOp(op) {
+    if (localDB == null) return
+    let record = Object.assign({}, op)
+    delete record.sending
+    localDB.transaction("outbox", "readwrite").objectStore("outbox").put(record)
+}
+
+/**
+ * @brief Remove a saved change from the local database, it stays in the
+ * outbox until dropSyncedOps
+ *
+ * @param[in] op: the change
+ */
+function forgetOp(op) {
+    if (localDB == null) return
+    localDB.transaction("outbox", "readwrite").objectStore("outbox")
+           .delete(op.id)
+}
+
+/**
+ * @brief Drop the saved changes a poll response already includes
+ *
+ * @param[in] generation: syncGeneration when the poll was sent
+ */
+function dropSyncedOps(generation) {
+    let kept = outbox.filter(function (op) {
+        return op.synced == null || op.synced > generation
+    })
+    if (kept.length != outbox.length) {
+        outbox = kept
+        localVersion += 1
+        updateSyncStatus()
+    }
+}
+
+/**
+ * @brief Save the outbox after a delay, unless a save is planned already
+ *
+ * @param[in] delay: ms to wait
+ */
+function scheduleSync(delay) {
+    if (syncTimer != null) return
+    syncTimer = window.setTimeout(flushOutbox, delay)
+}
+
+/**
+ * @brief Send the oldest changes of the outbox to the server in one batch.
+ * Changes stay queued while the server cannot be reached. Edits of a task
+ * somebody else changed in the meantime are dropped and listed as conflicts.
+ */
+function flushOutbox() {
+    syncTimer = null
+    if (syncing) return
+    let batch = outbox.filter(function (op) {
+        return op.synced == null
+    }).slice(0, SYNC_MAX_OPS)
+    if (batch.length == 0) return
+    syncing = true
+    let ops = []
+    for (let i = 0; i < batch.length; i++) {
+        batch[i].sending = true
+        let op = Object.assign({}, batch[i])
+        delete op.sending
+        delete op.seq
+        delete op.cal_id
+        ops.push(op)
     }
 
-    // get week info
-    let week_info = document.getElementById("week_info")
-    let week = week_info.value
-   
     let xhr = new XMLHttpRequest()
     xhr.onreadystatechange = function () {
-        return 
+        if (this.readyState != 4) return
+        syncing = false
+        for (let i = 0; i < batch.length; i++) {
+            batch[i].sending = false
+        }
+        if (xhr.status == 200) {
+            setOffline(false)
+            syncRetry = POLL_MIN
+            syncGeneration += 1
+            let results = JSON.parse(xhr.responseText)['results']
+            for (let i = 0; i < results.length; i++) {
+                finishOp(batch[i], results[i])
+            }
+            renderLocal()
+            pollSoon()
+            scheduleSync(0) // the rest of a long queue
+        } else if (xhr.status == 429) {
+            scheduleSync(retryAfter(xhr))
+        } else if (xhr.status == 0 || xhr.status >= 500) {
+            // keep the changes and try again, later every time
+            setOffline(xhr.status == 0)
+            scheduleSync(syncRetry)
+            syncRetry = Math.min(syncRetry * 2, POLL_MAX)
+        } else {
+            // the server refuses the whole batch, e.g. access was revoked
+            for (let i = 0; i < batch.length; i++) {
+                finishOp(batch[i], {status: "error", 
+                                    message: "Change could not be saved"})
+            }
+            renderLocal()
+        }
     }
-    // send info back to server to flip availability
-    xhr.open("POST", "wasabicalendar/flip-block", true)
+    xhr.open("POST", "wasabicalendar/sync", true)
     xhr.setRequestHeader("Content-type", "application/x-www-form-urlencoded")
-    xhr.send("csrfmiddlewaretoken="+getCSRFToken()+"&id="+id+"&cal_id="+
-            cal_id+"&week="+week)
+    xhr.send("csrfmiddlewaretoken=" + getCSRFToken() + "&cal_id=" + 
+             batch[0].cal_id + "&ops=" + encodeURIComponent(JSON.stringify(ops)))
+}
+
+/**
+ * @brief Handle the result of a change the server answered
+ *
+ * @param[in] op: the change
+ * @param[in] result: result dict from the sync endpoint
+ */
+function finishOp(op, result) {
+    forgetOp(op)
+    if (result.status != "ok") {
+        // the server keeps its version, nothing to show for the change
+        outbox.splice(outbox.indexOf(op), 1)
+        showSyncProblem(op, result.message)
+        return
+    }
+    op.synced = syncGeneration
+    if (op.type == "modify") {
+        // later edits of the task were made on top of this one
+        for (let i = 0; i < outbox.length; i++) {
+            let other = outbox[i]
+            if (other.synced == null && other.task_id == op.task_id) {
+                other.version = result.version
+                storeOp(other)
+            }
+        }
+    }
+}
+
+/**
+ * @brief List a change the server did not take in the side bar
+ *
+ * @param[in] op: the change
+ * @param[in] message: the reason from the server
+ */
+function showSyncProblem(op, message) {
+    var res = "<li>" + escapeHTML(message)
+    if (op.type != "blocks" && op.task) {
+        res += " (" + escapeHTML(op.task.topic) + ")"
+    }
+    if (op.task_id) {
+        res += " <a href=\"/modify_task/" + op.task_id + "\">Open</a>"
+    }
+    res += "</li>"
+    document.getElementById("id_sync_problems")
+            .insertAdjacentHTML("beforeend", res)
+}
+
+/**
+ * @brief Remember whether the server could be reached
+ *
+ * @param[in] value: true if the last request failed to connect
+ */
+function setOffline(value) {
+    if (offline == value) return
+    offline = value
+    updateSyncStatus()
+}
+
+/**
+ * @brief Show how many changes are waiting to be saved
+ */
+function updateSyncStatus() {
+    let status = document.getElementById("id_sync_status")
+    if (status == null) return
+    let waiting = outbox.filter(function (op) {
+        return op.synced == null
+    }).length
+    if (offline) {
+        status.innerHTML = "Offline, " + waiting + " changes not saved yet"
+    } else if (waiting > 0) {
+        status.innerHTML = "Saving " + waiting + " changes"
+    } else {
+        status.innerHTML = ""
+    }
+}
+
+/**
+ * @brief Show the changes of the outbox in a week payload before rendering
+ * it, so they are on screen before the server has them
+ *
+ * @param[in] response: parsed get-cal-list payload, changed in place
+ */
+function applyLocalChanges(response) {
+    let days = response['week']
+    let data = response['data']
+    for (let n = 0; n < outbox.length; n++) {
+        let op = outbox[n]
+        if (op.type != "blocks") {
+            applyLocalTask(days, data, op)
+            continue
+        }
+        if (op.week != days[0]) continue
+        for (let idx in op.blocks) {
+            let cell = data[Math.floor(idx / 96)][idx % 96]
+            let wanted = op.blocks[idx]
+            if (cell['block'][1] != wanted) {
+                cell['block'] = [cell['block'][0] + (wanted ? 1 : -1), wanted]
+            }
+        }
+    }
+}
+
+/**
+ * @brief Show a task change of the outbox in the grid of a week payload. The
+ * task leaves its old place and takes the first lane free over its new time
+ *
+ * @param[in] days: dates of the week of the payload
+ * @param[in] data: grid of the payload, changed in place
+ * @param[in] op: create, modify or delete change
+ */
+function applyLocalTask(days, data, op) {
+    if (op.task_id) {
+        for (let i = 0; i < data.length; i++) {
+            for (let j = 0; j < data[i].length; j++) {
+                let lanes = data[i][j]['tasks']
+                for (let k = 0; k < lanes.length; k++) {
+                    if (lanes[k].length > 0 && lanes[k][0]['id'] == op.task_id) {
+                        lanes[k] = []
+                    }
+                }
+            }
+        }
+    }
+    if (op.type == "delete") return
+    let dayIdx = days.indexOf(op.task.taskDate)
+    if (dayIdx < 0) return
+    let start = floorSlot(op.task.startTime)
+    let end = ceilSlot(op.task.endTime)
+    let day = data[dayIdx]
+    for (let k = 0; k < 5; k++) {
+        let free = true
+        for (let j = start; j < end && free; j++) {
+            free = (day[j]['tasks'][k].length == 0)
+        }
+        if (!free) continue
+        let tag = findTag(op.task.tag)
+        let task = {
+            // tasks not created on the server yet are opened from the outbox
+            id: op.task_id || -op.seq,
+            topic: escapeHTML(op.task.topic),
+            startBlock: start,
+            endBlock: end,
+            color: tag ? tag.dataset.color : "gray"
+        }
+        for (let j = start; j < end; j++) {
+            day[j]['tasks'][k] = [task]
+        }
+        return
+    }
+}
+
+// tasks of the user's other calendars in the week on screen, as sent by
+// busy-times, null while the busy overlay is off or loading
+var busyWeek = null
+var busyLoading = null
+
+/**
+ * @brief Turn the busy overlay of the grid on or off
+ */
+function toggle_busy() {
+    busyWeek = null
+    renderLocal()
+}
+
+/**
+ * @brief Mark the blocks of a week payload in which the user has tasks in
+ * other calendars, loading those tasks first if the overlay is on
+ *
+ * @param[in] response: parsed get-cal-list payload, changed in place
+ */
+function applyBusy(response) {
+    let toggle = document.getElementById("id_show_busy")
+    if (toggle == null || !toggle.checked) return
+    let week = response['week'][0]
+    if (busyWeek == null || busyWeek['week'] != week) {
+        loadBusy(week)
+        return
+    }
+    let data = response['data']
+    for (let i = 0; i < busyWeek['days'].length; i++) {
+        let tasks = busyWeek['days'][i]
+        for (let k = 0; k < tasks.length; k++) {
+            let task = tasks[k]
+            // plain text, block titles are set through the DOM
+            let label = task.topic + " (" + task.calendar + ")"
+            for (let j = task.startBlock; j < task.endBlock; j++) {
+                let cell = data[i][j]
+                cell['busy'] = cell['busy'] ? cell['busy'] + ", " + label : 
+                                              "Busy: " + label
+            }
+        }
+    }
+}
+
+/**
+ * @brief Load the tasks of the user's other calendars in a week and render
+ * the grid again with them
+ *
+ * @param[in] week: Monday of the week
+ */
+function loadBusy(week) {
+    if (busyLoading == week) return
+    busyLoading = week
+    let cid = document.getElementById("cal_id").value
+    let xhr = new XMLHttpRequest()
+    xhr.onreadystatechange = function () {
+        if (this.readyState != 4) return
+        busyLoading = null
+        // offline or rate limited, the overlay stays empty for this week
+        // until it is turned on again
+        let response = {week: week, days: []}
+        if (xhr.status == 200) response = JSON.parse(xhr.responseText)
+        if (response['week'] != document.getElementById("week_info").value) return
+        busyWeek = response
+        renderLocal()
+    }
+    xhr.open("GET", `wasabicalendar/busy-times?cal_id=${cid}&week=${week}`)
+    xhr.send()
+}
+
+/**
+ * @brief Get the slot a "H:M" time falls in, see timeslots.floor_slot
+ */
+function floorSlot(time) {
+    let parts = time.split(":")
+    return parseInt(parts[0]) * 4 + Math.floor(parseInt(parts[1]) / 15)
+}
+
+/**
+ * @brief Get the slot that starts at or after a "H:M" time, see
+ * timeslots.ceil_slot
+ */
+function ceilSlot(time) {
+    let slot = floorSlot(time)
+    if (parseInt(time.split(":")[1]) % 15 > 0) slot += 1
+    return Math.min(slot, 95)
 }
 
 /**
@@ -436,7 +1400,8 @@ function flip_back() {
     let back = document.getElementById("back_calendar")
     let backVal = back.value
     let task = document.getElementById("id_task_" + backVal)
-    task.scrollIntoView()
+    // tasks opened from search results may not be in the week on screen
+    if (task != null) task.scrollIntoView()
     $("#calendar_container").flip('toggle');
 }
 
@@ -444,45 +1409,323 @@ function flip_back() {
  * @brief Send GET request to fetch previous week's data
  */
 function left_click() {
-    let xhr = new XMLHttpRequest()
-    xhr.onreadystatechange = function () {
-        if (this.readyState != 4) return
-        updatePage(xhr)
-    }
+    changeWeek(-7, "prev-week")
+}
+
+/**
+ * @brief Send GET request to fetch next week's data
+ */
+function right_click() {
+    changeWeek(7, "next-week")
+}
+
+/**
+ * @brief Move to another week. The stored copy of the week is shown at once
+ * if there is one, the server's answer replaces it
+ *
+ * @param[in] days: days from the week on screen to the new week
+ * @param[in] action: endpoint that answers with the new week
+ */
+function changeWeek(days, action) {
+    let nav = ++navSeq
     let week_info = document.getElementById("week_info")
     let week = week_info.value
     let cal = document.getElementById("cal_id")
-    let cid=  cal.value
+    let cid = cal.value
+
+    let monday = new Date(week + "T00:00:00")
+    monday.setDate(monday.getDate() + days)
+    let target = monday.getFullYear() + "-" + 
+                 String(monday.getMonth() + 1).padStart(2, "0") + "-" + 
+                 String(monday.getDate()).padStart(2, "0")
+    loadWeek(cid, target, function (text) {
+        // the server was faster, or the user moved on
+        if (text == null || nav != navSeq || week_info.value != week) return
+        showWeek(text)
+    })
 
-    xhr.open("GET", `wasabicalendar/prev-week?cal_id=${cid}&week=${week}`)
+    let xhr = new XMLHttpRequest()
+    xhr.onreadystatechange = function () {
+        if (this.readyState != 4 || nav != navSeq) return
+        updatePage(xhr)
+    }
+    xhr.open("GET", `wasabicalendar/${action}?cal_id=${cid}&week=${week}`)
     xhr.send()
+    // the new week may be busier than the old one
+    pollSoon()
 }
 
+// ms between checks of a background job started from the page
+const JOB_POLL = 2000
+
 /**
- * @brief Send GET request to fetch next week's data
+ * @brief Show the progress of the background job started from this page, if
+ * any, until it is done or failed
  */
-function right_click() {
+function watchJob() {
+    let job = document.getElementById("id_job")
+    if (job == null) return
     let xhr = new XMLHttpRequest()
     xhr.onreadystatechange = function () {
         if (this.readyState != 4) return
-        updatePage(xhr)
+        if (xhr.status != 200) return
+        let response = JSON.parse(xhr.responseText)
+        let status = document.getElementById("id_job_status")
+        if (response.status == "done") {
+            status.innerHTML = "<a href=\"/get_calendar/" + 
+                response.result.calendar_id + "\">Open the copy</a>"
+            return
+        }
+        if (response.status == "failed") {
+            status.innerHTML = "Copy failed: " + escapeHTML(response.message)
+            return
+        }
+        if (response.status == "queued") {
+            status.innerHTML = "Waiting to copy"
+        } else if (response.total > 0) {
+            status.innerHTML = "Copied " + response.progress + " of " + 
+                               response.total + " tasks"
+        } else {
+            status.innerHTML = "Copying"
+        }
+        window.setTimeout(watchJob, JOB_POLL)
     }
-    let week_info = document.getElementById("week_info")
-    let week = week_info.value
-    let cal = document.getElementById("cal_id")
-    let cid = cal.value
+    xhr.open("GET", `wasabicalendar/job-status?id=${job.value}`)
+    xhr.send()
+}
+
+// query and next page of the task search shown in the side bar
+var searchQuery = ""
+var searchPage = 0
+
+/**
+ * @brief Search the tasks for the text in the search box, replacing the
+ * results of the previous search
+ */
+function search_tasks() {
+    searchQuery = document.getElementById("id_search_text").value.trim()
+    searchPage = 0
+    document.getElementById("id_search_results").innerHTML = ""
+    document.getElementById("id_search_more").style.display = "none"
+    if (searchQuery == "") return
+    load_search_page()
+}
 
-    xhr.open("GET", `wasabicalendar/next-week?cal_id=${cid}&week=${week}`)
+/**
+ * @brief Load the next page of results of the current search
+ */
+function load_search_page() {
+    let xhr = new XMLHttpRequest()
+    let query = searchQuery
+    xhr.onreadystatechange = function () {
+        if (this.readyState != 4) return
+        // a newer search was started while this one was loading
+        if (query != searchQuery) return
+        // a failed search only leaves the results empty
+        if (xhr.status != 200) return
+        let response = JSON.parse(xhr.responseText)
+        let list = document.getElementById("id_search_results")
+        for (let i = 0; i < response.tasks.length; i++) {
+            list.insertAdjacentHTML("beforeend", makeSearchResult(response.tasks[i]))
+        }
+        searchPage += 1
+        document.getElementById("id_search_more").style.display = 
+            response.more ? "" : "none"
+    }
+    var url = `wasabicalendar/search-tasks?q=${encodeURIComponent(query)}` +
+              `&page=${searchPage}`
+    if (!document.getElementById("id_search_all").checked) {
+        url += `&cal_id=${document.getElementById("cal_id").value}`
+    }
+    xhr.open("GET", url)
     xhr.send()
 }
 
+/**
+ * @brief Make the list item of one search result, clicking it shows the task
+ *
+ * @param[in] task: task dict from search-tasks
+ * @return HTML of the list item
+ */
+function makeSearchResult(task) {
+    var res = "<li style=\"color:" + task.color + 
+              ";text-shadow:-1px 0 black, 0 1px black, 1px 0 black, 0 -1px black;" +
+              "cursor:pointer\" onclick=\"flip_task(" + task.id + ")\">"
+    res += escapeHTML(task.topic) + " (" + task.date + " " + 
+           task.startTime.slice(0, 5)
+    if (document.getElementById("id_search_all").checked) {
+        res += ", " + escapeHTML(task.calendar)
+    }
+    res += ")</li>"
+    return res
+}
+
+// users matching the prefixes typed into the invite box, prefix -> list
+var memberSuggestions = {}
+var suggestTimer = null
+const SUGGEST_DELAY = 200 // ms without typing before users are looked up
+const SUGGEST_MIN_LENGTH = 2 // the server ignores shorter prefixes
+
+/**
+ * @brief Look up the users matching the text of the invite box once the
+ * user stops typing, and offer them as choices of the box
+ */
+function suggest_members() {
+    if (suggestTimer != null) window.clearTimeout(suggestTimer)
+    suggestTimer = window.setTimeout(function () {
+        suggestTimer = null
+        let prefix = document.getElementById("id_invite_member").value
+                             .trim().toLowerCase()
+        if (prefix.length < SUGGEST_MIN_LENGTH) return
+        if (memberSuggestions[prefix]) {
+            showMemberSuggestions(memberSuggestions[prefix])
+            return
+        }
+        let xhr = new XMLHttpRequest()
+        xhr.onreadystatechange = function () {
+            if (this.readyState != 4 || xhr.status != 200) return
+            memberSuggestions[prefix] = JSON.parse(xhr.responseText)['users']
+            // the box changed while the request was out
+            let current = document.getElementById("id_invite_member").value
+            if (current.trim().toLowerCase() != prefix) return
+            showMemberSuggestions(memberSuggestions[prefix])
+        }
+        xhr.open("GET", `wasabicalendar/user-search?q=${encodeURIComponent(prefix)}`)
+        xhr.send()
+    }, SUGGEST_DELAY)
+}
+
+/**
+ * @brief Replace the choices of the invite box
+ *
+ * @param[in] users: user dicts from user-search
+ */
+function showMemberSuggestions(users) {
+    var res = ""
+    for (let i = 0; i < users.length; i++) {
+        let name = (users[i].first_name + " " + users[i].last_name).trim()
+        res += "<option value=\"" + escapeHTML(users[i].username) + "\">" + 
+               escapeHTML(name) + "</option>"
+    }
+    document.getElementById("id_invite_suggestions").innerHTML = res
+}
+
+/**
+ * @brief Open the server rendered print page of the current week
+ */
 function print_page() {
-    document.body.innerHTML =  ("<div class= \"wkdays\" >" + 
-    document.getElementById("current_week").innerHTML + "</div>" + 
-    "<div class= \"print\" >" + 
-    document.getElementById("front_content").innerHTML + "</div>")
-    window.print()
-    location.reload()
+    let cid = document.getElementById("cal_id").value
+    let week = document.getElementById("week_info").value
+    window.open(`/print_week/${cid}?week=${week}`)
+}
+
+// next page cursor of each gallery list, null once the last page is loaded
+var galleryCursors = {}
+// gallery lists with a page request in flight
+var galleryLoading = {}
+
+/**
+ * @brief Load the first page of a calendar list of the home page gallery and
+ * load further pages when the list is scrolled near its end
+ *
+ * @param[in] listId: id of the gallery list element, its data-kind is
+ * "owned" or "shared"
+ */
+function loadGallery(listId) {
+    let list = document.getElementById(listId)
+    galleryCursors[listId] = ""
+    list.onscroll = function () {
+        if (list.scrollTop + list.clientHeight >= list.scrollHeight - 50) {
+            loadGalleryPage(listId)
+        }
+    }
+    loadGalleryPage(listId)
+}
+
+/**
+ * @brief Fetch the next page of a gallery list and append its calendars
+ *
+ * @param[in] listId: id of the gallery list element
+ */
+function loadGalleryPage(listId) {
+    let cursor = galleryCursors[listId]
+    if (cursor == null || galleryLoading[listId]) return
+    galleryLoading[listId] = true
+    let list = document.getElementById(listId)
+
+    let xhr = new XMLHttpRequest()
+    xhr.onreadystatechange = function () {
+        if (this.readyState != 4) return
+        galleryLoading[listId] = false
+        if (xhr.status != 200) return
+        let response = JSON.parse(xhr.responseText)
+        galleryCursors[listId] = response['cursor']
+        let shared = list.dataset.kind == "shared"
+        for (let i = 0; i < response['calendars'].length; i++) {
+            list.appendChild(makeGalleryButton(response['calendars'][i], shared))
+        }
+        // keep loading while the list does not fill its box yet
+        if (list.scrollHeight <= list.clientHeight) {
+            loadGalleryPage(listId)
+        }
+    }
+    xhr.open("GET", `wasabicalendar/calendar-list?kind=${list.dataset.kind}` + 
+             `&cursor=${encodeURIComponent(cursor)}`)
+    xhr.send()
+}
+
+/**
+ * @brief Make the button of one calendar in the home page gallery
+ *
+ * @param[in] cal: calendar info from calendar-list
+ * @param[in] shared: true to show the owner of the calendar
+ * @return the button element
+ */
+function makeGalleryButton(cal, shared) {
+    let icon = document.getElementById("calendar_icon").value
+    let button = document.createElement("button")
+    button.type = "button"
+    button.id = "id_calendar_" + cal.id
+    button.className = "calendar-button"
+    button.title = cal.member_count + " members, " + cal.task_count + " tasks"
+    let res = "<div class='logo_img'><img class=\"icon\" src=\"" + icon + 
+              "\"></div>"
+    res += "<div class='cal_name'>" + escapeHTML(cal.name) + "</div>"
+    if (shared) {
+        res += "<div class='owner_info'>from " + escapeHTML(cal.owner) + "</div>"
+    }
+    button.innerHTML = res
+    button.onclick = function () {
+        location.href = "/get_calendar/" + cal.id
+    }
+    return button
+}
+
+/**
+ * @brief Escape text before putting it into HTML, also inside quoted
+ * attribute values
+ *
+ * @param[in] text: raw text
+ * @return text with HTML special characters escaped
+ */
+function escapeHTML(text) {
+    let div = document.createElement("div")
+    div.textContent = text
+    return div.innerHTML.replace(/"/g, "&quot;").replace(/'/g, "&#39;")
+}
+
+/**
+ * @brief Fill the task form with a free time suggested by the server after
+ * the overlap limit was hit
+ *
+ * @param[in] date: suggested date in "Y-M-D" format
+ * @param[in] startTime: suggested start time in "H:M" format
+ * @param[in] endTime: suggested end time in "H:M" format
+ */
+function use_suggestion(date, startTime, endTime) {
+    document.getElementById("id_taskDate").value = date
+    document.getElementById("id_startTime").value = startTime
+    document.getElementById("id_endTime").value = endTime
 }
 
 /**
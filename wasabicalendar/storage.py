@@ -0,0 +1,46 @@
+# @file: storage.py
+# @brief: static files storage that writes content hashed file names (so the
+#         files can be cached forever) plus precompressed gzip and brotli
+#         variants that the web server can send as they are
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# define macros
+COMPRESSIBLE = ('.css', '.js', '.svg', '.ttf', '.ico', '.json', '.txt')
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+
+    # @brief: hash the files like ManifestStaticFilesStorage, then write
+    #         name.gz and name.br next to every compressible hashed file
+    def post_process(self, paths, dry_run=False, **options):
+        hashed_names = []
+        for name, hashed_name, processed in super().post_process(
+                paths, dry_run, **options):
+            yield name, hashed_name, processed
+            if hashed_name and not isinstance(processed, Exception):
+                hashed_names.append(hashed_name)
+        if dry_run:
+            return
+        for hashed_name in set(hashed_names):
+            if hashed_name.endswith(COMPRESSIBLE):
+                self._write_compressed(hashed_name)
+
+    # @brief: write the compressed variants of one file, skipping variants
+    #         that would not be smaller than the file itself
+    def _write_compressed(self, name):
+        with self.open(name) as f:
+            content = f.read()
+        variants = [('.gz', gzip.compress(content, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(content)))
+        for suffix, compressed in variants:
+            if len(compressed) < len(content):
+                with open(self.path(name + suffix), 'wb') as f:
+                    f.write(compressed)
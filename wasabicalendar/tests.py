@@ -1,3 +1,853 @@
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import F
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
 
-# Create your tests here.
+from wasabicalendar.models import Block, Calendar, Job, Tag, Task
+from wasabicalendar import (archive, caches, encoding, jobs, layout, ratelimit,
+                            search, timeslots, views)
+
+from unittest import mock
+
+import datetime
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+# @brief: a calendar owned by alice, shared with bob, with one tag and the
+#         Monday of the current week
+class CalendarTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'pw')
+        self.bob = User.objects.create_user('bob', 'bob@example.com', 'pw')
+        self.client.force_login(self.alice)
+        self.client.post('/create_calendar', {'text': 'team'})
+        self.cal = Calendar.objects.get(name='team')
+        self.cal.members.add(self.bob)
+        self.tag = Tag.objects.get(calendar=self.cal)
+        today = datetime.date.today()
+        self.monday = (today - datetime.timedelta(days=today.weekday())
+                      ).strftime("%Y-%m-%d")
+
+    # @brief: create a task in the calendar through the create task page
+    def create_task(self, topic='standup', start='09:00', end='10:00',
+                    description=''):
+        self.client.post('/create_task/%d' % self.cal.id, {
+            'topic': topic, 'tag': self.tag.id, 'description': description,
+            'location': '', 'link': '', 'taskDate': self.monday,
+            'startTime': start, 'endTime': end})
+
+
+@override_settings(RATE_LIMIT_ENABLED=False)
+class EncodingTests(CalendarTestCase):
+    # @brief: request every JSON endpoint and record the data each one
+    #         passed to encode_response
+    def collect_payloads(self):
+        payloads = []
+        real = encoding.encode_response
+        def record(request, data, status=200):
+            payloads.append((request.path, data))
+            return real(request, data, status)
+        cid = self.cal.id
+        week = self.monday
+        self.create_task()
+        task_id = self.cal.tasks.get().id
+        with mock.patch.object(encoding, 'encode_response', record):
+            for url in ('/wasabicalendar/get-cal-list?cal_id=%d&week=%s' % (cid, week),
+                        '/wasabicalendar/prev-week?cal_id=%d&week=%s' % (cid, week),
+                        '/wasabicalendar/next-week?cal_id=%d&week=%s' % (cid, week),
+                        '/wasabicalendar/get-task?id=%d' % task_id,
+                        '/wasabicalendar/availability-heatmap?cal_id=%d&start=%s' % (cid, week),
+                        '/wasabicalendar/availability-members?cal_id=%d&date=%s'
+                        '&start_slot=0&end_slot=4' % (cid, week),
+                        '/wasabicalendar/busy-times?cal_id=%d&week=%s' % (cid, week),
+                        '/wasabicalendar/calendar-list?kind=owned',
+                        '/wasabicalendar/search-tasks?q=standup',
+                        '/wasabicalendar/user-search?q=bo'):
+                self.assertEqual(self.client.get(url).status_code, 200, url)
+            response = self.client.post('/wasabicalendar/sync', {
+                'cal_id': cid, 'ops': json.dumps([
+                    {'id': 'a', 'type': 'blocks', 'week': week,
+                     'blocks': {'3': True}}])})
+            self.assertEqual(response.status_code, 200)
+            self.client.post('/clone_calendar/%d' % cid, {'text': 'copy'})
+            job_id = self.client.session.get('job')
+            self.client.get('/get_calendar/%d' % cid)
+            self.assertEqual(self.client.get(
+                '/wasabicalendar/job-status?id=%s' % job_id).status_code, 200)
+        return payloads
+
+    def test_encoders_agree_on_every_endpoint(self):
+        payloads = self.collect_payloads()
+        self.assertGreaterEqual(len(payloads), 12)
+        for path, data in payloads:
+            expected = json.loads(json.dumps(data))
+            with mock.patch.object(encoding, 'orjson', None):
+                self.assertEqual(json.loads(encoding.dumps_json(data)), 
+                                 expected, path)
+            if encoding.orjson is not None:
+                self.assertEqual(json.loads(encoding.dumps_json(data)), 
+                                 expected, path)
+            if msgpack is not None:
+                self.assertEqual(msgpack.unpackb(encoding.dumps_msgpack(data)),
+                                 expected, path)
+
+    def test_int_keys(self):
+        data = {"blocks": {5: (1, True)}}
+        self.assertEqual(json.loads(encoding.dumps_json(data)), 
+                         {"blocks": {"5": [1, True]}})
+
+    def test_compressed_response(self):
+        url = '/wasabicalendar/get-cal-list?cal_id=%d&week=%s' % (
+            self.cal.id, self.monday)
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+
+class TaskVersionTests(CalendarTestCase):
+    CONFLICT = "Another user has modified this task. Please re-enter."
+
+    def setUp(self):
+        super().setUp()
+        self.create_task()
+        self.task = self.cal.tasks.get()
+
+    def modify(self, version, topic='review'):
+        return self.client.post('/modify_helper/%d' % self.task.id, {
+            'topic': topic, 'tag': self.tag.id, 'description': '',
+            'location': '', 'link': '', 'taskDate': self.monday,
+            'startTime': '09:00', 'endTime': '10:00',
+            'hidden_version_modify': version})
+
+    def test_modify(self):
+        response = self.modify(self.task.version)
+        self.assertRedirects(response, '/get_calendar/%d' % self.cal.id,
+                             fetch_redirect_response=False)
+        task = Task.objects.get(id=self.task.id)
+        self.assertEqual(task.topic, 'review')
+        self.assertEqual(task.version, self.task.version + 1)
+
+    def test_stale_modify(self):
+        self.modify(self.task.version)
+        response = self.modify(self.task.version, 'retro')
+        self.assertRedirects(response, '/modify_task/%d' % self.task.id,
+                             fetch_redirect_response=False)
+        self.assertEqual(self.client.session['message'], self.CONFLICT)
+        task = Task.objects.get(id=self.task.id)
+        self.assertEqual((task.topic, task.version),
+                         ('review', self.task.version + 1))
+
+    def test_stale_delete(self):
+        self.modify(self.task.version)
+        response = self.client.post('/delete_helper/%d' % self.task.id, {
+            'hidden_version_delete': self.task.version})
+        self.assertRedirects(response, '/modify_task/%d' % self.task.id,
+                             fetch_redirect_response=False)
+        self.assertEqual(self.client.session['message'], self.CONFLICT)
+        self.assertEqual(Task.objects.get(id=self.task.id).topic, 'review')
+
+        self.client.post('/delete_helper/%d' % self.task.id, {
+            'hidden_version_delete': self.task.version + 1})
+        self.assertFalse(Task.objects.filter(id=self.task.id).exists())
+
+    # @brief: another edit commits between the version check of the view and
+    #         the write, only the conditional update can notice
+    def test_conditional_write(self):
+        stale = self.task
+        Task.objects.filter(id=stale.id).update(topic='retro',
+                                                version=F('version') + 1)
+        data = {'topic': 'review', 'taskDate': self.monday, 'description': '',
+                'location': '', 'link': ''}
+        self.assertFalse(views._update_task(self.alice, stale, stale.version,
+                                            self.tag, data, 36, 40))
+        self.assertFalse(views._delete_task(stale, stale.version))
+        task = Task.objects.get(id=stale.id)
+        self.assertEqual((task.topic, task.version), ('retro', stale.version + 1))
+        self.assertTrue(views._update_task(self.alice, stale, stale.version + 1,
+                                           self.tag, data, 36, 40))
+        self.assertEqual(Task.objects.get(id=stale.id).version, stale.version + 2)
+
+
+@override_settings(RATE_LIMIT_ENABLED=False)
+class SyncTests(CalendarTestCase):
+    # @brief: send a batch of changes to the sync endpoint
+    # @returns: the response
+    def sync(self, ops, cal=None):
+        return self.client.post('/wasabicalendar/sync', {
+            'cal_id': (cal or self.cal).id, 'ops': json.dumps(ops)})
+
+    # @brief: the task form fields of a change
+    def fields(self, topic='standup', start='09:00', end='10:00'):
+        return {'topic': topic, 'tag': self.tag.id, 'description': '',
+                'location': '', 'link': '', 'taskDate': self.monday,
+                'startTime': start, 'endTime': end}
+
+    def test_create(self):
+        response = self.sync([{'id': 'a', 'type': 'create', 'task': self.fields()}])
+        result = response.json()['results'][0]
+        task = self.cal.tasks.get()
+        self.assertEqual(result, {'status': 'ok', 'id': 'a', 'task_id': task.id,
+                                  'version': task.version})
+
+    def test_replayed_change_is_applied_once(self):
+        ops = [{'id': 'a', 'type': 'create', 'task': self.fields()},
+               {'id': 'b', 'type': 'blocks', 'week': self.monday,
+                'blocks': {'3': True}}]
+        first = self.sync(ops).json()
+        # the client sends the batch again after the response was lost
+        self.assertEqual(self.sync(ops).json(), first)
+        self.assertEqual(self.cal.tasks.count(), 1)
+        self.assertEqual(Block.objects.get(calendar=self.cal).select_user.count(), 1)
+
+    def test_stale_modify_is_a_conflict(self):
+        self.create_task()
+        task = self.cal.tasks.get()
+        result = self.sync([{'id': 'a', 'type': 'modify', 'task_id': task.id,
+                             'version': task.version - 1,
+                             'task': self.fields('review')}]).json()['results'][0]
+        self.assertEqual(result['status'], 'conflict')
+        self.assertEqual(self.cal.tasks.get().topic, 'standup')
+
+        result = self.sync([{'id': 'b', 'type': 'modify', 'task_id': task.id,
+                             'version': task.version,
+                             'task': self.fields('review')}]).json()['results'][0]
+        self.assertEqual(result['status'], 'ok')
+        self.assertEqual(result['version'], task.version + 1)
+        self.assertEqual(self.cal.tasks.get().topic, 'review')
+
+    def test_stale_delete_is_a_conflict(self):
+        self.create_task()
+        task = self.cal.tasks.get()
+        result = self.sync([{'id': 'a', 'type': 'delete', 'task_id': task.id,
+                             'version': task.version + 1}]).json()['results'][0]
+        self.assertEqual(result['status'], 'conflict')
+        self.assertTrue(self.cal.tasks.exists())
+        result = self.sync([{'id': 'b', 'type': 'delete', 'task_id': task.id,
+                             'version': task.version}]).json()['results'][0]
+        self.assertEqual(result['status'], 'ok')
+        self.assertFalse(self.cal.tasks.exists())
+
+    def test_task_of_another_calendar_is_refused(self):
+        self.create_task()
+        task = self.cal.tasks.get()
+        self.client.post('/create_calendar', {'text': 'other'})
+        other = Calendar.objects.get(name='other')
+        for op in ({'id': 'a', 'type': 'modify', 'task_id': task.id,
+                    'version': task.version, 'task': self.fields('review')},
+                   {'id': 'b', 'type': 'delete', 'task_id': task.id,
+                    'version': task.version}):
+            result = self.sync([op], cal=other).json()['results'][0]
+            self.assertNotEqual(result['status'], 'ok')
+        task.refresh_from_db()
+        self.assertEqual(task.topic, 'standup')
+
+    def test_calendar_of_outsider_is_refused(self):
+        outsider = User.objects.create_user('carol', 'carol@example.com', 'pw')
+        self.client.force_login(outsider)
+        response = self.sync([{'id': 'a', 'type': 'create', 'task': self.fields()}])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(self.cal.tasks.exists())
+
+    def test_too_many_changes(self):
+        ops = [{'id': str(i), 'type': 'create', 'task': self.fields()}
+               for i in range(views.SYNC_MAX_OPS + 1)]
+        self.assertEqual(self.sync(ops).status_code, 400)
+        self.assertFalse(self.cal.tasks.exists())
+
+
+@override_settings(RATE_LIMIT_ENABLED=False)
+class ArchivedBlockTests(CalendarTestCase):
+    def setUp(self):
+        super().setUp()
+        self.week = (datetime.datetime.strptime(self.monday, "%Y-%m-%d")
+                     - datetime.timedelta(days=28)).strftime("%Y-%m-%d")
+
+    # @brief: set the availability of alice in block 3 of the old week
+    def set_block(self, wanted, op_id):
+        # the cached grid is invalidated once the write commits
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/wasabicalendar/sync', {
+                'cal_id': self.cal.id, 'ops': json.dumps([
+                    {'id': op_id, 'type': 'blocks', 'week': self.week,
+                     'blocks': {'3': wanted}}])})
+        self.assertEqual(response.json()['results'][0]['status'], 'ok')
+
+    def get_block(self):
+        response = self.client.get('/wasabicalendar/get-cal-list?cal_id=%d&week=%s'
+                                   % (self.cal.id, self.week))
+        return response.json()['data'][0][3]['block']
+
+    def test_change_archived_block(self):
+        self.set_block(True, 'a')
+        archive.archive_calendar(self.cal, datetime.date.today()
+                                           - datetime.timedelta(days=7))
+        self.assertEqual(self.cal.archived_blocks.count(), 1)
+        self.assertEqual(self.get_block(), [1, True])
+
+        self.set_block(False, 'b')
+        self.assertEqual(self.get_block(), [0, False])
+        self.assertEqual(self.cal.archived_blocks.count(), 0)
+        self.set_block(True, 'c')
+        self.assertEqual(self.get_block(), [1, True])
+
+    def test_counts_of_both_tables_are_merged(self):
+        self.set_block(True, 'a')
+        archive.archive_calendar(self.cal, datetime.date.today()
+                                           - datetime.timedelta(days=7))
+        # bob selects the same slot in a hot row next to the archived one
+        block = Block.objects.create(date=self.week, slot=3, calendar=self.cal)
+        block.select_user.add(self.bob)
+        cache.clear()
+        self.assertEqual(self.get_block(), [2, True])
+
+
+    def test_members_of_both_tables_are_merged(self):
+        # alice is available in slots 3 and 4, one of them archived
+        self.set_block(True, 'a')
+        archive.archive_calendar(self.cal, datetime.date.today()
+                                           - datetime.timedelta(days=7))
+        block = Block.objects.create(date=self.week, slot=4, calendar=self.cal)
+        block.select_user.add(self.alice, self.bob)
+        response = self.client.get('/wasabicalendar/availability-members', {
+            'cal_id': self.cal.id, 'date': self.week, 'start_slot': 0,
+            'end_slot': 8})
+        members = sorted((m['username'], m['slots'])
+                         for m in response.json()['members'])
+        self.assertEqual(members, [('alice', 2), ('bob', 1)])
+
+class ArchiveJobTests(CalendarTestCase):
+    def test_lease_is_renewed_after_every_chunk(self):
+        old = datetime.date.today() - datetime.timedelta(days=60)
+        for slot in range(5):
+            Block.objects.create(date=old.strftime("%Y-%m-%d"), slot=slot,
+                                 calendar=self.cal)
+        job = jobs.enqueue('archive', self.alice, cal_id=self.cal.id,
+                           cutoff=(old + datetime.timedelta(days=1)).isoformat())
+        self.assertEqual(jobs.claim().id, job.id)
+        with mock.patch.object(archive, 'CHUNK_SIZE', 2), \
+             mock.patch.object(jobs, 'set_progress', 
+                               side_effect=jobs.set_progress) as set_progress:
+            jobs.run(Job.objects.get(id=job.id))
+        self.assertEqual([c.args[1] for c in set_progress.call_args_list],
+                         [0, 2, 4, 5])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress, job.total), (Job.DONE, 5, 5))
+        self.assertEqual(self.cal.archived_blocks.count(), 5)
+
+
+@override_settings(RATE_LIMIT_ENABLED=False)
+class CloneTests(CalendarTestCase):
+    def clone(self, offset, start=None, end=None):
+        data = {'text': 'copy', 'offset': offset}
+        if start is not None:
+            data.update(start=start, end=end)
+        response = self.client.post('/clone_calendar/%d' % self.cal.id, data)
+        self.assertRedirects(response, '/get_calendar/%d' % self.cal.id,
+                             fetch_redirect_response=False)
+        return self.client.session.get('message')
+
+    def test_invalid_offset(self):
+        for offset in ('--5', '-', '5d', '1e3'):
+            self.assertEqual(self.clone(offset), 
+                             "Offset must be a number of days.", offset)
+        self.assertEqual(self.clone('99999999999'), 
+                         "Offset must be at most 36600 days.")
+        self.assertEqual(self.clone('-36000', '0010-01-01', '0010-01-02'),
+                         "Offset moves the tasks out of range.")
+        self.assertFalse(Job.objects.exists())
+
+    def test_offset(self):
+        self.assertEqual(self.clone('-7', self.monday, self.monday),
+                         "Copying calendar")
+        self.assertEqual(json.loads(Job.objects.get().args)['offset'], -7)
+
+
+class TagCacheTests(CalendarTestCase):
+    def test_tags_survive_other_writes(self):
+        tags = caches.get_tags(self.cal.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_task()
+            caches.bump_revision(self.cal.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(caches.get_tags(self.cal.id), tags)
+
+    def test_new_tag_is_listed(self):
+        version = caches.get_tags(self.cal.id)['version']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/add_tag/%d' % self.cal.id, {'text': 'urgent'})
+        tags = caches.get_tags(self.cal.id)
+        self.assertNotEqual(tags['version'], version)
+        self.assertEqual([t['name'] for t in tags['tags']], ['team', 'urgent'])
+
+
+class PrintWeekTests(CalendarTestCase):
+    def test_print_week(self):
+        response = self.client.get('/print_week/%d?week=%s' % (self.cal.id,
+                                                               self.monday))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(self.monday, b''.join(response.streaming_content).decode())
+
+    def test_invalid_week(self):
+        for week in ('someday', '2026-10-20'):
+            response = self.client.get('/print_week/%d?week=%s' % (self.cal.id,
+                                                                   week))
+            self.assertRedirects(response, '/get_calendar/%d' % self.cal.id,
+                                 fetch_redirect_response=False)
+            self.assertEqual(self.client.session['message'],
+                             "You must choose a valid week")
+
+
+@override_settings(RATE_LIMIT_ENABLED=False)
+class SearchTests(CalendarTestCase):
+    # @brief: search the tasks of alice
+    # @returns: the topics found, best match first
+    def search(self, query):
+        response = self.client.get('/wasabicalendar/search-tasks',
+                                   {'q': query})
+        return [task['topic'] for task in response.json()['tasks']]
+
+    def test_index_follows_task_writes(self):
+        self.create_task('standup')
+        self.assertEqual(self.search('stand'), ['standup'])
+        task = self.cal.tasks.get()
+        self.client.post('/modify_helper/%d' % task.id, {
+            'topic': 'review', 'tag': self.tag.id, 'description': 'weekly',
+            'location': '', 'link': '', 'taskDate': self.monday,
+            'startTime': '09:00', 'endTime': '10:00',
+            'hidden_version_modify': task.version})
+        self.assertEqual(self.search('stand'), [])
+        self.assertEqual(self.search('week rev'), ['review'])
+        self.client.post('/delete_helper/%d' % task.id, {
+            'hidden_version_delete': task.version + 1})
+        self.assertEqual(self.search('review'), [])
+
+    def test_archived_and_cloned_tasks_are_found(self):
+        self.create_task('standup')
+        task = self.cal.tasks.get()
+        archive.archive_calendar(self.cal, task.taskDate + datetime.timedelta(days=1))
+        self.assertEqual(self.search('standup'), ['standup'])
+        self.client.post('/clone_calendar/%d' % self.cal.id, {
+            'text': 'copy', 'start': self.monday, 'end': self.monday})
+        jobs.run(jobs.claim())
+        response = self.client.get('/wasabicalendar/search-tasks', {'q': 'standup'})
+        self.assertEqual(sorted(t['calendar'] for t in response.json()['tasks']),
+                         ['copy', 'team'])
+
+    def test_topic_ranks_above_description(self):
+        self.create_task('planning', description='budget')
+        self.create_task('budget', start='11:00', end='12:00')
+        self.assertEqual(self.search('budget'), ['budget', 'planning'])
+
+
+# @brief: tests of data migrations. The database is migrated back to an old
+#         state, filled with the historical models and migrated forward
+class MigrationTestCase(TransactionTestCase):
+    # @brief: migrate the database of the app to a migration
+    # @returns: the historical apps at that migration
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.migrate([('wasabicalendar', target)])
+        return executor.loader.project_state(('wasabicalendar', target)).apps
+
+    # @brief: migrate the database back to the latest state
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes('wasabicalendar'))
+        # the index is no model table, so the flush after the test skips it
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM %s" % search.INDEX_TABLE)
+        super().tearDown()
+
+    # @brief: create a task with the historical models of apps
+    def create_task(self, apps, topic, start, end, archived=False, **fields):
+        User = apps.get_model('auth', 'User')
+        Calendar = apps.get_model('wasabicalendar', 'Calendar')
+        Tag = apps.get_model('wasabicalendar', 'Tag')
+        user = User.objects.get_or_create(username='alice')[0]
+        cal = Calendar.objects.get_or_create(name='team', owner=user)[0]
+        tag = Tag.objects.get_or_create(name='team', calendar=cal)[0]
+        now = datetime.datetime.now(datetime.timezone.utc)
+        fields.update(topic=topic, tag=tag, calendar=cal, startTime=start,
+                      endTime=end, taskDate=datetime.date(2026, 1, 5),
+                      created_by=user, creation_time=now, updated_by=user,
+                      update_time=now)
+        if archived:
+            model = apps.get_model('wasabicalendar', 'ArchivedTask')
+            return model.objects.create(id=fields.pop('id'), **fields)
+        Description = apps.get_model('wasabicalendar', 'Description')
+        fields['description'] = Description.objects.create(
+            text=fields.pop('text', ''), location='', link='')
+        return apps.get_model('wasabicalendar', 'Task').objects.create(**fields)
+
+
+class SearchMigrationTests(MigrationTestCase):
+    def test_existing_tasks_are_indexed(self):
+        apps = self.migrate('0012_calendar_access')
+        live = self.create_task(apps, 'standup', datetime.time(9),
+                                datetime.time(10), text='daily')
+        old = self.create_task(apps, 'retro', datetime.time(9),
+                               datetime.time(10), archived=True, id=live.id + 1,
+                               text='sprint')
+        self.migrate('0013_task_search_index')
+        self.assertEqual(search.search_task_ids([live.calendar_id], 'daily'),
+                         ([live.id], False))
+        self.assertEqual(search.search_task_ids([live.calendar_id], 'sprint retro'),
+                         ([old.id], False))
+
+
+class TaskSlotMigrationTests(MigrationTestCase):
+    def test_times_to_slots(self):
+        apps = self.migrate('0014_job')
+        times = [(datetime.time(9), datetime.time(10, 15), (36, 41)),
+                 (datetime.time(0), datetime.time(0, 15), (0, 1)),
+                 (datetime.time(23, 30), datetime.time(23, 45), (94, 95)),
+                 (datetime.time(9, 10), datetime.time(9, 50), (36, 40))]
+        live = [self.create_task(apps, 'live', start, end).id
+                for start, end, slots in times]
+        archived = [self.create_task(apps, 'old', start, end, archived=True,
+                                     id=1000 + i).id
+                    for i, (start, end, slots) in enumerate(times)]
+        apps = self.migrate('0015_task_slots')
+        for name, ids in (('Task', live), ('ArchivedTask', archived)):
+            model = apps.get_model('wasabicalendar', name)
+            for id, (start, end, slots) in zip(ids, times):
+                task = model.objects.get(id=id)
+                self.assertEqual((task.startSlot, task.endSlot), slots, name)
+
+        # and back, times on a slot boundary come back unchanged
+        apps = self.migrate('0014_job')
+        Task = apps.get_model('wasabicalendar', 'Task')
+        for id, (start, end, slots) in zip(live[:3], times):
+            task = Task.objects.get(id=id)
+            self.assertEqual((task.startTime, task.endTime), (start, end))
+
+
+class RevisionTests(CalendarTestCase):
+    def test_revision_changes_after_commit(self):
+        rev = caches.get_revision(self.cal.id)
+        with self.captureOnCommitCallbacks() as callbacks:
+            caches.bump_revision(self.cal.id)
+            # other workers must not cache uncommitted data under a new token
+            self.assertEqual(caches.get_revision(self.cal.id), rev)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(caches.get_revision(self.cal.id), rev)
+
+
+class RateLimitTests(CalendarTestCase):
+    def test_take(self):
+        with mock.patch.object(ratelimit.time, 'time', return_value=1000.0) as now:
+            for i in range(3):
+                self.assertEqual(ratelimit.take('bucket', 0.5, 3), 0)
+            # empty, one token comes back after 2 seconds
+            self.assertEqual(ratelimit.take('bucket', 0.5, 3), 2)
+            now.return_value = 1001.0
+            self.assertEqual(ratelimit.take('bucket', 0.5, 3), 1)
+            now.return_value = 1002.0
+            self.assertEqual(ratelimit.take('bucket', 0.5, 3), 0)
+            # a full bucket holds no more than burst tokens
+            now.return_value = 2000.0
+            for i in range(3):
+                self.assertEqual(ratelimit.take('bucket', 0.5, 3), 0)
+            self.assertEqual(ratelimit.take('bucket', 0.5, 3), 2)
+
+    @override_settings(RATE_LIMIT_USER_RATE=1, RATE_LIMIT_USER_BURST=2,
+                       RATE_LIMIT_CALENDAR_RATE=1, RATE_LIMIT_CALENDAR_BURST=3)
+    def test_check(self):
+        with mock.patch.object(ratelimit.time, 'time', return_value=1000.0):
+            # requests without a calendar only count for the user
+            self.assertEqual(ratelimit.check('1', ''), 0)
+            self.assertEqual(ratelimit.check('1', '7'), 0)
+            self.assertEqual(ratelimit.check('1', '7'), 1)
+            # other users share the bucket of the calendar
+            self.assertEqual(ratelimit.check('2', '7'), 0)
+            self.assertEqual(ratelimit.check('3', '7'), 0)
+            self.assertEqual(ratelimit.check('4', '7'), 1)
+            # the refused request did not spend the token of the user
+            self.assertEqual(ratelimit.check('4', '8'), 0)
+            self.assertEqual(ratelimit.check('4', ''), 0)
+            self.assertEqual(ratelimit.check('4', ''), 1)
+
+    @override_settings(RATE_LIMIT_CALENDAR_RATE=0.01, RATE_LIMIT_CALENDAR_BURST=3)
+    def test_outsiders_do_not_drain_the_calendar(self):
+        url = '/wasabicalendar/get-cal-list?cal_id=%d&week=%s' % (self.cal.id,
+                                                                 self.monday)
+        for i in range(6):
+            outsider = User.objects.create_user('outsider%d' % i, '', 'pw')
+            client = self.client_class()
+            client.force_login(outsider)
+            self.assertEqual(client.get(url).status_code, 400)
+        for i in range(3):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        # members do share the bucket
+        self.assertEqual(self.client.get(url).status_code, 429)
+
+    @override_settings(RATE_LIMIT_USER_RATE=0.01, RATE_LIMIT_USER_BURST=1)
+    def test_only_json_endpoints_are_limited(self):
+        for i in range(3):
+            response = self.client.get('/static/wasabicalendar/wasabicalendar.js')
+            self.assertNotEqual(response.status_code, 429)
+        url = 'wasabicalendar/get-cal-list?cal_id=%d&week=%s' % (self.cal.id,
+                                                                self.monday)
+        self.assertEqual(self.client.get('/' + url).status_code, 200)
+        self.assertEqual(self.client.get('/get_calendar/' + url).status_code, 429)
+
+    @override_settings(RATE_LIMIT_MAX_INFLIGHT=1)
+    def test_admit(self):
+        self.assertTrue(ratelimit.admit())
+        self.assertFalse(ratelimit.admit())
+        ratelimit.release()
+        self.assertTrue(ratelimit.admit())
+        ratelimit.release()
+
+    @override_settings(RATE_LIMIT_USER_RATE=0.5, RATE_LIMIT_USER_BURST=2)
+    def test_too_many_requests(self):
+        url = '/wasabicalendar/get-cal-list?cal_id=%d&week=%s' % (self.cal.id,
+                                                                 self.monday)
+        with mock.patch.object(ratelimit.time, 'time', return_value=1000.0):
+            for i in range(2):
+                self.assertEqual(self.client.get(url).status_code, 200)
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '2')
+        self.assertEqual(response.json(), {"error": "Too many requests"})
+
+    @override_settings(RATE_LIMIT_MAX_INFLIGHT=0)
+    def test_server_busy(self):
+        response = self.client.get('/wasabicalendar/get-cal-list?cal_id=%d&week=%s'
+                                   % (self.cal.id, self.monday))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+
+    # @brief: polls of other users are never refused while one user floods
+    #         the server with requests of their own
+    def test_flood_does_not_refuse_other_users(self):
+        carol = User.objects.create_user('carol', 'carol@example.com', 'pw')
+        self.client.post('/create_calendar', {'text': 'flood'})
+        flood_cal = Calendar.objects.get(name='flood')
+        flood_cal.members.add(carol)
+        flooder = self.client_class()
+        flooder.force_login(carol)
+        other = self.client_class()
+        other.force_login(self.bob)
+        flood_url = '/wasabicalendar/get-cal-list?cal_id=%d&week=%s' % (
+                        flood_cal.id, self.monday)
+        url = '/wasabicalendar/get-cal-list?cal_id=%d&week=%s' % (self.cal.id,
+                                                                 self.monday)
+        refused = 0
+        # the clock stands still, so no bucket refills during the test
+        with mock.patch.object(ratelimit.time, 'time', return_value=1000.0):
+            for i in range(10):
+                for j in range(10):
+                    refused += flooder.get(flood_url).status_code == 429
+                self.assertEqual(other.get(url).status_code, 200)
+        self.assertEqual(refused, 100 - settings.RATE_LIMIT_USER_BURST)
+
+
+class LayoutTests(SimpleTestCase):
+    # (name, [(startBlock, endBlock), ...], lanes in start order)
+    CASES = [
+        ("empty", [], []),
+        ("single", [(36, 40)], [0]),
+        ("overlap", [(0, 4), (2, 6)], [0, 1]),
+        ("touching", [(0, 4), (4, 8)], [0, 0]),
+        ("nested", [(0, 10), (2, 4), (4, 6)], [0, 1, 1]),
+        ("lowest free lane", [(0, 4), (1, 8), (2, 3), (5, 9)], [0, 1, 2, 0]),
+        ("unsorted input", [(8, 12), (0, 10), (4, 6)], [0, 1, 1]),
+        ("five lanes", [(0, 4)] * 5, [0, 1, 2, 3, 4]),
+        # more overlaps than lanes, the lane that frees up first is shared
+        ("over the cap", [(0, 8), (0, 8), (0, 2), (0, 8), (0, 8), (1, 9)],
+         [0, 1, 2, 3, 4, 0]),
+    ]
+
+    def test_layout_day(self):
+        for name, ranges, lanes in self.CASES:
+            with self.subTest(name):
+                tasks = layout.layout_day([{"startBlock": start, "endBlock": end}
+                                           for start, end in ranges])
+                self.assertEqual([t["lane"] for t in tasks], lanes)
+                starts = [t["startBlock"] for t in tasks]
+                self.assertEqual(starts, sorted(starts))
+                if len(ranges) <= layout.LANE_COUNT:
+                    for i, t in enumerate(tasks):
+                        for u in tasks[i + 1:]:
+                            if (t["lane"] == u["lane"] and 
+                                    u["startBlock"] < t["endBlock"]):
+                                self.fail("%s: %s and %s share a lane" % (name, t, u))
+
+    def test_layout_week(self):
+        week = layout.layout_week([[{"startBlock": 0, "endBlock": 4}]] + 
+                                  [[] for i in range(6)])
+        self.assertEqual(len(week), 7)
+        self.assertEqual(week[0][0]["lane"], 0)
+
+
+class TimeSlotTests(SimpleTestCase):
+    # (start, end, expected slots)
+    CASES = [
+        ("09:00", "10:00", (36, 40)),
+        ("09:07", "09:52", (36, 40)),
+        ("09:14", "09:16", (36, 38)),
+        ("00:00", "00:01", (0, 1)),
+        ("22:59", "23:46", (91, 95)),
+        # a task that starts at 23:45 or later has no slot left
+        ("23:45", "23:59", (95, 95)),
+        ("23:50", "23:59", (95, 95)),
+    ]
+
+    def test_round_range(self):
+        for start, end, slots in self.CASES:
+            with self.subTest(start=start, end=end):
+                self.assertEqual(timeslots.round_range(
+                    datetime.time.fromisoformat(start),
+                    datetime.time.fromisoformat(end)), slots)
+
+    def test_slot_times(self):
+        for slot in range(timeslots.DAY_COUNT):
+            time = timeslots.to_time(slot)
+            self.assertEqual(timeslots.floor_slot(time), slot)
+            self.assertEqual(timeslots.ceil_slot(time), slot)
+            self.assertEqual(timeslots.format_slot(slot), time.strftime("%H:%M"))
+            self.assertEqual(timeslots.format_slot(slot, seconds=True),
+                             time.strftime("%H:%M:%S"))
+
+
+class TaskTimeTests(CalendarTestCase):
+    def test_task_after_last_slot(self):
+        response = self.client.post('/create_task/%d' % self.cal.id, {
+            'topic': 'late', 'tag': self.tag.id, 'description': '',
+            'location': '', 'link': '', 'taskDate': self.monday,
+            'startTime': '23:50', 'endTime': '23:59'})
+        self.assertContains(response, "Task cannot begin after 11:45PM")
+        self.assertFalse(self.cal.tasks.exists())
+
+    def test_times_are_rounded(self):
+        self.create_task(start='09:07', end='09:52')
+        task = self.cal.tasks.get()
+        self.assertEqual((task.startSlot, task.endSlot), (36, 40))
+
+
+class StartupTests(SimpleTestCase):
+    def test_profile_startup_budget(self):
+        out = io.StringIO()
+        call_command('profile_startup', '--runs', '1', '--budget', '60000',
+                     stdout=out)
+        self.assertIn("budget 60000 ms", out.getvalue())
+        with self.assertRaisesMessage(CommandError, "over the budget"):
+            call_command('profile_startup', '--runs', '1', '--budget', '0.001',
+                         stdout=io.StringIO())
+
+    def test_views_do_not_import_rarely_used_modules(self):
+        code = ("import django, sys; django.setup(); "
+                "import wasabicalendar.views; "
+                "print(sorted(m for m in ('jobs', 'clone', 'archive', 'search') "
+                "if 'wasabicalendar.' + m in sys.modules))")
+        proc = subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR,
+                              env=dict(os.environ,
+                                       DJANGO_SETTINGS_MODULE='webapps.settings'),
+                              capture_output=True, text=True)
+        self.assertEqual(proc.stdout.strip(), '[]', proc.stderr)
+
+
+# a worker process of the consistency test. It runs the app on the sqlite
+# database and file cache in the directory given as second argument, like a
+# worker of a deployment with a shared cache
+WORKER = """
+import os, sys, json, time, datetime, django
+os.environ['DJANGO_SETTINGS_MODULE'] = 'webapps.settings'
+role, shared = sys.argv[1], sys.argv[2]
+from django.conf import settings
+settings.DATABASES['default']['NAME'] = os.path.join(shared, 'db.sqlite3')
+settings.CACHES = {'default': {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': os.path.join(shared, 'cache')}}
+settings.RATE_LIMIT_ENABLED = False
+django.setup()
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import Client
+from django.test.utils import setup_test_environment
+setup_test_environment()
+from wasabicalendar.models import Calendar
+BLOCKS = int(sys.argv[3])
+progress = os.path.join(shared, 'progress')
+today = datetime.date.today()
+week = (today - datetime.timedelta(days=today.weekday())).strftime('%Y-%m-%d')
+
+if role == 'setup':
+    call_command('migrate', verbosity=0)
+    alice = User.objects.create_user('alice', 'alice@example.com', 'pw')
+    bob = User.objects.create_user('bob', 'bob@example.com', 'pw')
+    client = Client()
+    client.force_login(alice)
+    client.post('/create_calendar', {'text': 'team'})
+    Calendar.objects.get(name='team').members.add(bob)
+    open(progress, 'w').write('0')
+    sys.exit(0)
+
+cal = Calendar.objects.get(name='team')
+client = Client()
+client.force_login(User.objects.get(username=role == 'writer' and 'alice' or 'bob'))
+if role == 'writer':
+    for i in range(BLOCKS):
+        client.post('/wasabicalendar/sync', {'cal_id': cal.id, 'ops': json.dumps(
+            [{'id': str(i), 'type': 'blocks', 'week': week, 'blocks': {str(i): True}}])})
+        # tell the poller this write is done
+        open(progress + '.tmp', 'w').write(str(i + 1))
+        os.replace(progress + '.tmp', progress)
+        time.sleep(0.05)
+    sys.exit(0)
+
+deadline = time.time() + 60
+while time.time() < deadline:
+    done = int(open(progress).read())
+    data = client.get('/wasabicalendar/get-cal-list?cal_id=%d&week=%s'
+                      % (cal.id, week)).json()['data']
+    seen = sum(data[0][i]['block'][0] for i in range(BLOCKS))
+    if seen < done:
+        print('poll saw %d of %d finished writes' % (seen, done))
+        sys.exit(1)
+    if seen == BLOCKS:
+        sys.exit(0)
+print('writes never showed up')
+sys.exit(1)
+"""
+
+
+# @brief: several worker processes sharing the file cache. A poll that starts
+#         after a write returned in another process must see it, which needs
+#         the revision token to be shared and bumped after the commit
+class MultiWorkerTests(SimpleTestCase):
+    BLOCKS = 20
+
+    def run_worker(self, role, shared):
+        return subprocess.Popen([sys.executable, '-c', WORKER, role, shared,
+                                 str(self.BLOCKS)],
+                                cwd=settings.BASE_DIR, stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, text=True)
+
+    def test_polls_see_writes_of_other_workers(self):
+        with tempfile.TemporaryDirectory() as shared:
+            setup = self.run_worker('setup', shared)
+            self.assertEqual(setup.wait(), 0, setup.stdout.read())
+            poller = self.run_worker('poller', shared)
+            writer = self.run_worker('writer', shared)
+            self.assertEqual(writer.wait(), 0, writer.stdout.read())
+            self.assertEqual(poller.wait(), 0, poller.stdout.read())
@@ -0,0 +1,51 @@
+# @file: timeslots.py
+# @brief: conversion between times of day and the 15 minute slots tasks and
+#         availability blocks are stored in. Slot n starts n * 15 minutes
+#         after midnight, so a day has DAY_COUNT slots
+
+import datetime
+
+# define macros
+SLOT_MINUTES = 15
+DAY_COUNT = 96
+LAST_SLOT = DAY_COUNT - 1 # a task ends at 23:45 at the latest
+
+# @brief: get the slot a time falls in, i.e. round the time down
+# @type time: datetime.time
+# @returns: int slot
+def floor_slot(time):
+    return time.hour * 4 + time.minute // SLOT_MINUTES
+
+# @brief: get the slot that starts at or after a time, i.e. round the time up.
+#         Times after 23:45 give LAST_SLOT
+# @type time: datetime.time
+# @returns: int slot
+def ceil_slot(time):
+    slot = floor_slot(time)
+    if time.minute % SLOT_MINUTES > 0:
+        slot += 1
+    return min(slot, LAST_SLOT)
+
+# @brief: round the times a user entered for a task to slots, the start down
+#         and the end up
+# @type start: datetime.time
+# @type end: datetime.time
+# @returns: a tuple (start slot, end slot), the end slot is not included in
+#           the task and the two are equal if the task starts after 23:45
+def round_range(start, end):
+    return (floor_slot(start), ceil_slot(end))
+
+# @brief: get the time a slot starts at
+# @type slot: int
+# @returns: datetime.time
+def to_time(slot):
+    return datetime.time(slot // 4, slot % 4 * SLOT_MINUTES)
+
+# @brief: format the time a slot starts at
+# @type slot: int
+# @param seconds: True for "HH:MM:SS", False for "HH:MM"
+# @returns: string
+def format_slot(slot, seconds=False):
+    if seconds:
+        return "%02d:%02d:00" % (slot // 4, slot % 4 * SLOT_MINUTES)
+    return "%02d:%02d" % (slot // 4, slot % 4 * SLOT_MINUTES)
@@ -3,30 +3,63 @@
 
 # start import
 from django.shortcuts import render, redirect
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.core.cache import cache
 
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.db import transaction
-
-from wasabicalendar.models import Description, Tag, Task, Calendar, Block
-from wasabicalendar.forms import TaskForm
-
+from django.db.models import (Count, F, Q, Value, OuterRef, Subquery, 
+                              DateTimeField, IntegerField)
+from django.db.models.functions import Coalesce, Lower
+
+from wasabicalendar.models import (Description, Tag, Task, Calendar, Block,
+                                   ArchivedTask, ArchivedBlock, CalendarAccess,
+                                   Job)
+from wasabicalendar.forms import TaskForm, NewTaskForm
+from wasabicalendar import caches, layout, timeslots, encoding
+# jobs, archive and search pull in rarely used code and are imported by the
+# views that need them, which keeps the cold start of a web process short
+
+import base64
+import collections
+import csv
 import datetime
+import hashlib
+import io
 import random
 
 import json
 # finish import
 
 # define macros
-DAY_COUNT = 96
+DAY_COUNT = timeslots.DAY_COUNT
 WEEK_COUNT = 7
+PRINT_CHUNK_SIZE = 8192
+HEATMAP_MAX_DAYS = 42 # six weeks, enough for any month view
+ACCESS_WRITE_INTERVAL = 5 * 60
+GALLERY_PAGE_SIZE = 24
+GALLERY_MAX_PAGE_SIZE = 100
+NEVER_ACCESSED = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+SUGGESTION_COUNT = 3
+SUGGESTION_DAYS = 3 # the requested day and the two following days
+SEARCH_MAX_PAGE = 50 # ranked results that deep are never looked at
+SYNC_MAX_OPS = 100 # the client sends larger queues in several batches
+SYNC_RESULT_TIMEOUT = 24 * 60 * 60 # seconds a sync result is remembered
+INVITE_MAX = 1000 # usernames or emails invited at once
+INVITE_MAX_FILE_SIZE = 64 * 1024
+INVITE_REPORT_MAX = 20 # unknown entries listed in the message
+TYPEAHEAD_MIN_LENGTH = 2 # shorter prefixes match too many users to be useful
+TYPEAHEAD_LIMIT = 8
+TYPEAHEAD_TIMEOUT = 30 # seconds the users matching a prefix are cached
+CLONE_MAX_OFFSET = 100 * 366 # days a cloned task can be moved by
 
 # @brief: json error response function from AJAX example in class
 # @message: an error message string that will be displayed in the html
 def _my_json_error_response(message, status=200):
-    response_json = '{ "error": "' + message + '" }'
+    response_json = encoding.dumps_json({"error": message})
     return HttpResponse(response_json, content_type='application/json', 
                         status=status)
 
@@ -61,7 +94,7 @@ def add_member(request, id):
         user_to_add = User.objects.get(username=(request.POST['text']))
         if user_to_add != request.user:
             cal.members.add(user_to_add)
-            cal.save()
+            caches.bump_revision(cal.id)
         # if the invited user is the user themself, display the message without 
         # adding them to the member of calendar (just like what google 
         # calendar does)
@@ -72,6 +105,116 @@ def add_member(request, id):
     request.session['message'] = message
     return redirect('get_calendar', id=id)
 
+# @brief: share the calendar with many members at once. The usernames or
+#         emails come from a text box, separated by commas or new lines, or
+#         from an uploaded CSV file, one or more per row. All of them are
+#         looked up with one query and added with one insert
+# @type id: string
+# @param id: id of the calendar to which the members are invited
+# @return: redirect to calendar page with a message listing the entries that
+#          matched no user
+@login_required
+def invite_members(request, id):
+    if request.method != 'POST':
+        request.session["message"] = ("You must use a POST request " + 
+                                     "for this operation.")
+        return redirect('get_calendar', id=id)
+    try:
+        cal = Calendar.objects.get(id=id)
+    except:
+        request.session["message"] = 'No access to the calendar'
+        return redirect('home')
+    if request.user != cal.owner:
+        request.session["message"] = ("Only the owner of this calendar can " + 
+                                     "invite members.")
+        return redirect('get_calendar', id=id)
+
+    entries = request.POST.get('names', '').replace(',', '\n').split()
+    upload = request.FILES.get('file')
+    if upload is not None:
+        if upload.size > INVITE_MAX_FILE_SIZE:
+            request.session["message"] = "The file is too large"
+            return redirect('get_calendar', id=id)
+        try:
+            rows = csv.reader(io.StringIO(upload.read().decode('utf-8-sig')))
+            entries += [cell.strip() for row in rows for cell in row]
+        except (UnicodeDecodeError, csv.Error):
+            request.session["message"] = "The file is not a CSV file"
+            return redirect('get_calendar', id=id)
+    # keep the order of the input for the message, drop repeats and blanks
+    entries = list(dict.fromkeys(entry for entry in entries if entry))
+    if not entries:
+        request.session["message"] = 'No username input'
+        return redirect('get_calendar', id=id)
+    if len(entries) > INVITE_MAX:
+        request.session["message"] = ("You can invite up to %d members at once" 
+                                      % INVITE_MAX)
+        return redirect('get_calendar', id=id)
+
+    emails = set(entry for entry in entries if '@' in entry)
+    found = {} # entry -> ids of the users it matches
+    for user_id, username, email in (User.objects
+            .filter(Q(username__in=entries) | Q(email__in=emails))
+            .values_list('id', 'username', 'email')):
+        found.setdefault(username, set()).add(user_id)
+        if email in emails:
+            found.setdefault(email, set()).add(user_id)
+    # an email shared by several accounts does not tell who to invite
+    unknown = [entry for entry in entries if len(found.get(entry, ())) != 1]
+    user_ids = set(next(iter(found[entry])) for entry in entries 
+                   if len(found.get(entry, ())) == 1)
+    user_ids.discard(cal.owner_id)
+
+    through = Calendar.members.through
+    members = set(through.objects.filter(calendar=cal, user_id__in=user_ids)
+                                 .values_list('user_id', flat=True))
+    through.objects.bulk_create([through(calendar_id=cal.id, user_id=user_id)
+                                 for user_id in user_ids 
+                                 if user_id not in members],
+                                ignore_conflicts=True)
+    caches.bump_revision(cal.id)
+
+    message = "invited %d members successfully" % (len(entries) - len(unknown))
+    if unknown:
+        message += ", unknown: " + ", ".join(unknown[:INVITE_REPORT_MAX])
+        if len(unknown) > INVITE_REPORT_MAX:
+            message += " and %d more" % (len(unknown) - INVITE_REPORT_MAX)
+    request.session['message'] = message
+    return redirect('get_calendar', id=id)
+
+# @brief: get the users whose username or email starts with a prefix, for the
+# typeahead of the invite box. Both lookups are range scans of an index on the
+# lower-cased column, see migration 0017, and results are cached briefly
+# @return: HttpResponse with JSON {"users": [...]} of at most TYPEAHEAD_LIMIT
+# users ordered by username
+@login_required
+def user_search(request):
+    if request.method != 'GET':
+        return _my_json_error_response("You must use a GET request for this operation", 
+                                        status=405)
+    prefix = request.GET.get('q', '').strip().lower()
+    if not TYPEAHEAD_MIN_LENGTH <= len(prefix) <= 150:
+        return encoding.encode_response(request, {"users": []})
+
+    key = "typeahead_%s" % hashlib.sha1(prefix.encode()).hexdigest()
+    users = cache.get(key)
+    if users is None:
+        found = {}
+        for column in ('username', 'email'):
+            rows = (User.objects.annotate(key=Lower(column))
+                        .filter(key__gte=prefix, key__lt=prefix + '\U0010ffff',
+                                key__startswith=prefix, is_active=True)
+                        .order_by('key')
+                        .values_list('username', 'first_name', 'last_name')
+                        [:TYPEAHEAD_LIMIT])
+            for username, first_name, last_name in rows:
+                found[username] = {"username": username, 
+                                   "first_name": first_name,
+                                   "last_name": last_name}
+        users = [found[username] for username in sorted(found)][:TYPEAHEAD_LIMIT]
+        cache.set(key, users, TYPEAHEAD_TIMEOUT)
+    return encoding.encode_response(request, {"users": users})
+
 # @brief: add a new tag for catogorize tasks with a random generated color
 # @type id: int
 # @param id: id of the calendar to which tag should be added
@@ -108,6 +251,8 @@ def add_tag(request, id):
     new_tag.save()
     cal.tags.add(new_tag)
     cal.save()
+    caches.bump_revision(cal.id)
+    caches.bump_tags(cal.id)
     return redirect('get_calendar', id=id)
 
 # @brief: get all the dates in the current week given the date of a Monday
@@ -128,6 +273,181 @@ def get_current_week(week):
         res.append(endDate.strftime("%Y-%m-%d"))
     return res
 
+# @brief: get the tasks of a calendar that fall in the given week, ordered by
+#         start slot. Shared by the live grid and the print renderer so both
+#         read exactly the same data. Plain rows are read instead of model
+#         objects since the grid only needs a few columns
+# @type cal: Calendar
+# @param cal: calendar whose tasks we want to get
+# @type days: list
+# @param days: the dates of the week in YY-mm-dd format, from get_current_week
+# @returns: a list of (id, topic, date, start slot, end slot, tag color,
+#           tag name) tuples
+def _get_week_tasks(cal, days):
+    fields = ('id', 'topic', 'taskDate', 'startSlot', 'endSlot', 'tag__color',
+              'tag__name')
+    tasks = list(cal.tasks.filter(taskDate__range=(days[0], days[-1]))
+                          .values_list(*fields))
+    if _is_archived(cal, days[0]):
+        tasks += list(cal.archived_tasks.filter(taskDate__range=(days[0], days[-1]))
+                                        .values_list(*fields))
+    tasks.sort(key=lambda t: (t[2], t[3]))
+    return tasks
+
+# @brief: count the members available in every block of a calendar between
+#         two dates with one aggregate query (and one more for archived weeks)
+# @type first: string
+# @param first: first date in YY-mm-dd format
+# @type last: string
+# @param last: last date in YY-mm-dd format, included
+# @param user: if given, also report whether this user selected the block
+# @returns: a list of (date, slot, count, selected by user) tuples
+def _get_block_counts(cal, first, last, user=None):
+    sources = [cal.blocks]
+    if _is_archived(cal, first):
+        sources.append(cal.archived_blocks)
+    # a slot may have a row in both tables while a week is being archived or
+    # restored, merge them instead of letting the last one win
+    res = {}
+    for blocks in sources:
+        rows = blocks.filter(date__range=(first, last)).annotate(
+                    count=Count('select_user'))
+        if user is not None:
+            rows = rows.annotate(
+                    mine=Count('select_user', filter=Q(select_user=user)))
+        else:
+            rows = rows.annotate(mine=Value(0))
+        for date, slot, count, mine in rows.values_list('date', 'slot', 
+                                                        'count', 'mine'):
+            old_count, old_mine = res.get((date, slot), (0, False))
+            res[(date, slot)] = (old_count + count, old_mine or mine > 0)
+    return [(date, slot, count, mine) 
+            for (date, slot), (count, mine) in res.items()]
+
+# @brief: get the tasks of a calendar between two dates, used by the overlap
+#         checks
+# @type first: datetime.date
+# @type last: datetime.date
+# @param last: last date, included
+# @returns: a list of (id, date, start slot, end slot) tuples
+def _get_range_tasks(cal, first, last):
+    fields = ('id', 'taskDate', 'startSlot', 'endSlot')
+    tasks = list(cal.tasks.filter(taskDate__range=(first, last))
+                          .values_list(*fields))
+    if _is_archived(cal, first.strftime("%Y-%m-%d")):
+        tasks += list(cal.archived_tasks.filter(taskDate__range=(first, last))
+                                        .values_list(*fields))
+    return tasks
+
+# @brief: check that a task from startSlot to endSlot on date keeps every 15
+#         minute slot at no more than LANE_COUNT overlapped tasks. If it does
+#         not, suggest the nearest feasible start times of the same length on
+#         the same and the following days, computed in the same pass from a
+#         per-day occupancy array
+# @type date: datetime.date
+# @type startSlot: int
+# @param startSlot: first slot of the task
+# @type endSlot: int
+# @param endSlot: slot after the last slot of the task
+# @param exclude_id: id of the task being modified, so it does not count
+# @returns: None if the task fits, otherwise a list of suggestion dicts with
+#           "date", "startTime" and "endTime" strings
+def _check_overlap(cal, date, startSlot, endSlot, exclude_id=None):
+    dates = [date + datetime.timedelta(days=i) for i in range(SUGGESTION_DAYS)]
+    occupancy = [[0] * DAY_COUNT for d in dates]
+    for id, taskDate, start, end in _get_range_tasks(cal, dates[0], dates[-1]):
+        if id != exclude_id:
+            day = (taskDate - date).days
+            for slot in range(start, end):
+                occupancy[day][slot] += 1
+
+    length = endSlot - startSlot
+    # the rounded end time is at most 23:45
+    lastStart = DAY_COUNT - 1 - length
+    def fits(day, start):
+        return max(occupancy[day][start:start + length]) < layout.LANE_COUNT
+    if fits(0, startSlot):
+        return None
+
+    starts = []
+    # on the requested day, the nearest start before and after the request
+    before = [s for s in range(startSlot - 1, -1, -1) if fits(0, s)]
+    after = [s for s in range(startSlot + 1, lastStart + 1) if fits(0, s)]
+    starts += [(0, s) for s in sorted(before[:1] + after[:1], 
+                                      key=lambda s: abs(s - startSlot))]
+    # on the following days, the start nearest to the requested one
+    for day in range(1, SUGGESTION_DAYS):
+        candidates = [s for s in range(lastStart + 1) if fits(day, s)]
+        if candidates:
+            starts.append((day, min(candidates, 
+                                    key=lambda s: (abs(s - startSlot), s))))
+
+    suggestions = []
+    for day, start in starts[:SUGGESTION_COUNT]:
+        end = start + length
+        suggestions.append({
+            "date": dates[day].strftime("%Y-%m-%d"),
+            "startTime": timeslots.format_slot(start),
+            "endTime": timeslots.format_slot(end)
+        })
+    return suggestions
+
+# @brief: get the tasks of all calendars a user owns or is a member of between
+#         two dates, for the personal conflict check and the busy overlay of
+#         the grid. One query, which reads the (calendar, taskDate) index once
+#         per calendar. Archived days are in the past and not included
+# @type first: datetime.date
+# @type last: datetime.date
+# @param last: last date, included
+# @param exclude_cal: a calendar whose tasks are left out, usually the one on
+#                     screen
+# @returns: a list of (date, start slot, end slot, topic, calendar name) tuples
+def _get_busy_tasks(user, first, last, exclude_cal=None):
+    # the union keeps both lookups of the calendar ids on their index
+    owned = Calendar.objects.filter(owner=user).values('id')
+    shared = (Calendar.members.through.objects.filter(user=user)
+                                              .values('calendar_id'))
+    tasks = Task.objects.filter(calendar_id__in=owned.union(shared), 
+                                taskDate__range=(first, last))
+    if exclude_cal is not None:
+        tasks = tasks.exclude(calendar=exclude_cal)
+    return list(tasks.order_by('taskDate', 'startSlot').values_list(
+                    'taskDate', 'startSlot', 'endSlot', 'topic', 'calendar__name'))
+
+# @brief: get the task dicts of a week with their grid lanes, cached per
+#         calendar revision and week. Shared by the grid and the print page
+# @type days: list
+# @param days: the dates of the week in YY-mm-dd format
+# @returns: one list per day of task dicts ordered by start, see layout_day
+def _get_week_layout(cal, days):
+    key = caches.week_key("layout", cal.id, days[0])
+    week_layout = cache.get(key)
+    if week_layout is None:
+        week_tasks = [[] for i in range(WEEK_COUNT)]
+        for id, topic, date, start, end, color, tag in _get_week_tasks(cal, days):
+            day_i = date.weekday() # the week starts on Monday
+            week_tasks[day_i].append({
+                "id": id,
+                "topic": topic,
+                "startTime": timeslots.format_slot(start, seconds=True),
+                "endTime": timeslots.format_slot(end, seconds=True),
+                "startBlock": start,
+                "endBlock": end,
+                "color": color,
+                "tag": tag
+            })
+        week_layout = layout.layout_week(week_tasks)
+        cache.set(key, week_layout, caches.RENDER_TIMEOUT)
+    return week_layout
+
+# @brief: check whether data of a calendar on a date may be in the archive
+# @type date: string
+# @param date: date in YY-mm-dd format
+# @returns: True if the archive tables have to be read too
+def _is_archived(cal, date):
+    return (cal.archived_before is not None and 
+            date < cal.archived_before.strftime("%Y-%m-%d"))
+
 # @brief: get all the tasks & tag information in a given calendar and a given 
 # week, pass tasks, tags, and week information in a json file for JavaScript
 # @type id: int
@@ -137,75 +457,96 @@ def get_current_week(week):
 # @rtype: HttpResponse object
 # @returns: a list of strings representing the header columns
 def _get_cal_list_helper(request, id, week):
-    try:
-        cal = Calendar.objects.get(id=id)
-    except:
-        # handle the case that calendar object with the id doesn't exist
-        message ='No access to the calendar'
-        request.session["message"] = message
-        return redirect('home')
+    # cached access check, a steady state poll does not touch the database
+    if not caches.has_access(request.user.id, id):
+        return _my_json_error_response("No access to the calendar", status = 400)
 
     days = get_current_week(week)
+    # the grid differs per user only in the "selected" flag of the blocks, so
+    # it is cached per user until the next write to the calendar
+    key = caches.week_key("grid_%d" % request.user.id, id, week)
+    data = cache.get(key)
+    if data is None:
+        data = _build_week_grid(request.user, Calendar.objects.get(id=id), days)
+        cache.set(key, data, caches.RENDER_TIMEOUT)
+    # pass tag data to json file only if the client's copy is out of date
+    tag_entry = caches.get_tags(id)
+    res = {'data':data, 'week':days, 'tags_version':tag_entry['version']}
+    if request.GET.get('tags_version') != tag_entry['version']:
+        res['tags'] = tag_entry['tags']
+    response = encoding.encode_response(request, res)
+    # sent as a header so the body stays the same while nothing changes
+    response['X-Poll-Interval'] = caches.get_poll_interval(id)
+    return response
+    
+# @brief: build the grid of a calendar week with the block counts and the
+#         task lanes of every 15 minute slot
+# @type days: list
+# @param days: the dates of the week in YY-mm-dd format
+# @returns: a list of WEEK_COUNT lists of DAY_COUNT slot dicts
+def _build_week_grid(user, cal, days):
     data = [[], [], [], [], [], [], []]
     # initailize all block = (0, false) tasks = 5 * []
     for i in range(WEEK_COUNT):
         for j in range(DAY_COUNT):
             data[i].append({"block":(0, False), "tasks":[[],[],[],[],[]]})
     # put block data
-    for block_item in cal.blocks.all():
-        if block_item.date in days:
-            day_i = days.index(block_item.date)
-            users_in_block = block_item.select_user.all()
-            curr_user_in_block = False
-            if request.user in users_in_block:
-                curr_user_in_block = True
-            data[day_i][block_item.slot]["block"] = (len(users_in_block), 
-                                                    curr_user_in_block)
-    # put task items in task_data in the order of start time
-    for task_item in cal.tasks.order_by('startTime'):
-        tDate = task_item.taskDate
-        parsedDate = tDate.strftime("%Y-%m-%d")
-        # if task in current week
-        if parsedDate in days:
-            day_i = days.index(parsedDate)
-            start = task_item.startTime
-            end = task_item.endTime
-            parsedStart = start.strftime("%H:%M:%S")
-            startList = parsedStart.split(":")
-            parsedEnd = end.strftime("%H:%M:%S")
-            endList = parsedEnd.split(":")
-            startBlock = int(startList[0]) * 4 + int(startList[1]) // 15
-            endBlock = int(endList[0]) * 4 + int(endList[1]) // 15
-            color = task_item.tag.color
-            # create task info dict
-            taskDict = {
-                "id": task_item.id,
-                "topic": task_item.topic,
-                "startTime": parsedStart,
-                "endTime": parsedEnd,
-                "startBlock": startBlock,
-                "endBlock": endBlock,
-                "color":color
-            }
-            avIdx = 0 # available index
-            while (avIdx < 4):
-                if data[day_i][startBlock]['tasks'][avIdx] == []:
-                    break # correct avIdx
-                avIdx += 1
-            for j in range(startBlock, endBlock):
+    for date, slot, count, curr_user_in_block in _get_block_counts(
+            cal, days[0], days[-1], user):
+        data[days.index(date)][slot]["block"] = (count, curr_user_in_block)
+    # put task items in the lanes computed by the layout engine
+    for day_i, day_tasks in enumerate(_get_week_layout(cal, days)):
+        for taskDict in day_tasks:
+            for j in range(taskDict["startBlock"], taskDict["endBlock"]):
                 curTasks = data[day_i][j]['tasks'] # list of 5 lists
-                curTasks[avIdx] = [taskDict]
-    # pass tag data to json file
-    tag_data = []
-    for t in cal.tags.all():
-        tag_item = {"name": t.name,
-                    "color": t.color}
-        tag_data.append(tag_item)
-    
-    res = {'data':data, 'week':days, 'tags':tag_data}
-    response_json = json.dumps(res)
-    return HttpResponse(response_json, content_type='application/json')
-    
+                curTasks[taskDict["lane"]] = [taskDict]
+    return data
+
+# @brief: render a print-ready page of one week of a calendar on the server.
+#         The page is built from the same task query as the live grid, cached
+#         per calendar revision and week, and streamed to the client in chunks
+# @type id: int
+# @param id: id of the calendar to print
+# @returns: a streamed html page, or redirect to home if there is an error
+@login_required
+def print_week(request, id):
+    try:
+        cal = Calendar.objects.get(id=id)
+    except:
+        # handle the case where calendar object with the id doesn't exist
+        request.session["message"] = 'No access to the calendar'
+        return redirect('home')
+    if request.user not in cal.members.all() and request.user != cal.owner:
+        request.session["message"] = "No access to the calendar"
+        return redirect('home')
+
+    if 'week' in request.GET and request.GET['week']:
+        week = request.GET['week']
+    else:
+        today = datetime.date.today()
+        week = (today - datetime.timedelta(days=today.weekday())).strftime("%Y-%m-%d")
+    days = get_current_week(week)
+    if isinstance(days, HttpResponse):
+        # invalid week info, this is a page so go back to the calendar
+        request.session["message"] = "You must choose a valid week"
+        return redirect('get_calendar', id=id)
+
+    key = caches.week_key("print", cal.id, week)
+    page = cache.get(key)
+    if page is None:
+        weekdays = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday',
+                    'Saturday', 'Sunday']
+        week_layout = _get_week_layout(cal, days)
+        columns = [{"name": weekdays[i], "date": days[i], 
+                    "tasks": week_layout[i]} for i in range(WEEK_COUNT)]
+        context = {"calendar": cal, "week": days, "columns": columns}
+        page = render_to_string('wasabicalendar/print_week.html', context)
+        cache.set(key, page, caches.RENDER_TIMEOUT)
+
+    chunks = (page[i:i + PRINT_CHUNK_SIZE]
+              for i in range(0, len(page), PRINT_CHUNK_SIZE))
+    return StreamingHttpResponse(chunks, content_type='text/html')
+
 #
 # @brief: the action that renders back to the home page
 # @returns: render to the home page html with message if in request.session
@@ -255,9 +596,87 @@ def create_calendar(request):
     tag.name = request.POST['text']
     tag.calendar = cal
     tag.save()
+    caches.bump_revision(cal.id)
+    caches.bump_tags(cal.id)
     return redirect('get_calendar', id=cal.id)
 
 
+# @brief: copy the tags, members and a date range of tasks of a calendar into
+#         a new calendar owned by the user, moving the tasks by an offset. The
+#         copy is made by a background job, whose progress the calendar page
+#         shows
+# @type id: int
+# @param id: id of the calendar to copy
+# @return: redirect back to the calendar page of the copied calendar
+@login_required
+def clone_calendar(request, id):
+    if request.method != 'POST':
+        request.session["message"] = ("You must use a POST request for " + 
+                                    "this operation.")
+        return redirect('get_calendar', id=id)
+    try:
+        cal = Calendar.objects.get(id=id)
+    except:
+        request.session["message"] = 'No access to the calendar'
+        return redirect('home')
+    if request.user not in cal.members.all() and request.user != cal.owner:
+        request.session["message"] = "No access to the calendar"
+        return redirect('home')
+
+    # same name rules as create_calendar
+    if not 'text' in request.POST or not request.POST['text']:
+        request.session["message"] = "You must enter a name for the calendar."
+        return redirect('get_calendar', id=id)
+    if not request.POST['text'].isalnum():
+        request.session["message"] = ("Calendar name should contain numbers" + 
+                                    " and letters only.")
+        return redirect('get_calendar', id=id)
+    if len(request.POST['text']) > 30:
+        request.session["message"] = ("Calendar name should be less" + 
+                                    " than 10 characters.")
+        return redirect('get_calendar', id=id)
+
+    # the task range is optional, without it only tags and members are copied
+    first = last = None
+    if request.POST.get('start') or request.POST.get('end'):
+        try:
+            first = datetime.datetime.strptime(request.POST['start'], "%Y-%m-%d").date()
+            last = datetime.datetime.strptime(request.POST['end'], "%Y-%m-%d").date()
+        except:
+            request.session["message"] = "Invalid date range"
+            return redirect('get_calendar', id=id)
+        if first > last:
+            request.session["message"] = "Start date must be before end date."
+            return redirect('get_calendar', id=id)
+    try:
+        offset = int(request.POST.get('offset') or 0)
+    except ValueError:
+        request.session["message"] = "Offset must be a number of days."
+        return redirect('get_calendar', id=id)
+    if abs(offset) > CLONE_MAX_OFFSET:
+        request.session["message"] = ("Offset must be at most %d days." % 
+                                    CLONE_MAX_OFFSET)
+        return redirect('get_calendar', id=id)
+    if first is not None:
+        # the moved tasks must still have valid dates
+        try:
+            first + datetime.timedelta(days=offset)
+            last + datetime.timedelta(days=offset)
+        except OverflowError:
+            request.session["message"] = "Offset moves the tasks out of range."
+            return redirect('get_calendar', id=id)
+
+    from wasabicalendar import jobs
+    job = jobs.enqueue('clone', request.user, cal_id=cal.id,
+                       name=request.POST['text'],
+                       first=first and first.isoformat(),
+                       last=last and last.isoformat(),
+                       offset=offset,
+                       copy_members='members' in request.POST)
+    request.session["message"] = "Copying calendar"
+    request.session["job"] = job.id
+    return redirect('get_calendar', id=id)
+
 # @brief: get the calendar model with the input cal id and get the current date
 #         time to put into the context. If the user is not the owner of the user
 #         and is not invited to the calendar, the error message would appear and
@@ -278,19 +697,39 @@ def get_calendar(request, id):
 
     d = monday.strftime("%Y-%m-%d")
 
-    context = {"id": id, "week_info": d, "calendar": cal}
+    tag_entry = caches.get_tags(cal.id)
+    context = {"id": id, "week_info": d, "calendar": cal,
+               "tags": tag_entry['tags'], "tags_version": tag_entry['version']}
 
     # if the user does not get access to the calendar, will redirect to home
     if request.user not in cal.members.all() and request.user != cal.owner:
         request.session['message'] = "No access to the calendar"
         return redirect('home')
 
+    _record_access(request.user, cal)
+
     if 'message' in request.session:
         message = request.session['message']
         del request.session['message']
         context["message"] = message
+    # a background job started from this page, e.g. a copy
+    if 'job' in request.session:
+        context["job_id"] = request.session['job']
+        del request.session['job']
     return render(request, 'wasabicalendar/cal_page.html', context)
 
+# @brief: remember that the user opened the calendar, for the "recently used"
+#         order of the home page. The row is written at most once every
+#         ACCESS_WRITE_INTERVAL seconds per user and calendar
+def _record_access(user, cal):
+    if not user.id:
+        return
+    # cache.add only succeeds when the key is absent, i.e. the interval passed
+    if cache.add("cal_access_%d_%d" % (user.id, cal.id), True, 
+                 ACCESS_WRITE_INTERVAL):
+        CalendarAccess.objects.update_or_create(
+            user=user, calendar=cal, defaults={"last_accessed": timezone.now()})
+
 # @brief: function called after clicking on "create task" button
 # @param id: the id of the calendar that will be used to create task in
 # @type id: int
@@ -312,7 +751,7 @@ def new_task(request, id):
             request.session['message'] = "No access to the calendar"
             return redirect('home')
         # create a task form with the given calendar to initialize tag choices
-        form = TaskForm(calendar=calendar)
+        form = NewTaskForm(calendar=calendar)
         context = {'form': form, 'calendar': calendar}
         # display message in request.session
         if 'message' in request.session:
@@ -362,7 +801,7 @@ def modify_task(request, id):
                         'endTime': task.endTime}, calendar=calendar)
 
     # store update time in an hidden field for time stamp
-    context = {"form": form, "task": task, "update_time": str(task.update_time)}
+    context = {"form": form, "task": task, "version": task.version}
     
     # display message in request.session
     if 'message' in request.session:
@@ -397,81 +836,55 @@ def create_task(request, id):
         request.session['message'] = "No access to the calendar"
         return redirect('home')
 
-    form = TaskForm(request.POST, calendar=calendar)
+    form = NewTaskForm(request.POST, calendar=calendar)
     context = {"form": form, "calendar": calendar}
     if not form.is_valid():
         context["message"] = "Invalid Form"
         return render(request, 'wasabicalendar/createtask.html', context)
     
-    # round minutes to multiple of 15
-    startTime = form.cleaned_data['startTime']
-    endTime = form.cleaned_data['endTime']
-    roundedStartTime = datetime.time(startTime.hour,(startTime.minute//15)*15,0)
-    
-    if endTime.minute % 15 > 0:
-        newMin = ((endTime.minute//15)+1)*15
-        newHour = endTime.hour
-        if newMin >= 60:
-            newMin -= 60
-            newHour += 1
-    else:
-        newMin = endTime.minute
-        newHour = endTime.hour
-    if newHour == 24:
-        newHour = 23
-        newMin = 45
-    roundedEndTime = datetime.time(newHour,newMin,0)
+    # round the times to 15 minute slots
+    startSlot, endSlot = timeslots.round_range(form.cleaned_data['startTime'],
+                                               form.cleaned_data['endTime'])
 
     # case that task only occupied the last block
-    if roundedStartTime == roundedEndTime:
-        context["message"] = "Task cannot begin after 11:45PM"
-        return render(request, 'wasabicalendar/modifytask.html', context)
+    if startSlot == endSlot:
+        context["createmessage"] = "Task cannot begin after 11:45PM"
+        return render(request, 'wasabicalendar/createtask.html', context)
     
     # count overlap, if any 15 minutes slot has > 5 tasks, create an error message 
-    # and let user reenter the infotmation
-    timeblock = dict()
-    for t in calendar.tasks.all():
-        if t.id != id:
-            if t.taskDate == form.cleaned_data['taskDate']:
-                # check overlap block:
-                block = datetime.timedelta(minutes=15)
-                st = datetime.datetime.combine(t.taskDate, roundedStartTime)
-                et = datetime.datetime.combine(t.taskDate, roundedEndTime)
-                while (st != et):
-                    if t.startTime <= st.time() and t.endTime > st.time():
-                        if st not in timeblock:
-                            timeblock[st] = 1
-                        else:
-                            timeblock[st] += 1
-                    st += block
-    for key in timeblock:
-        if timeblock[key] >= 5:
-            context = {'createmessage': "You can only create up to 5 overlapped tasks.", 
-                        "form": form, "calendar": calendar}
+    # and let user reenter the infotmation with suggested free times
+    suggestions = _check_overlap(calendar, form.cleaned_data['taskDate'],
+                                 startSlot, endSlot)
+    if suggestions is not None:
+        context = {'createmessage': "You can only create up to 5 overlapped tasks.", 
+                    "form": form, "calendar": calendar, 
+                    "suggestions": suggestions}
+        return render(request, 'wasabicalendar/createtask.html', context)
+
+    # if asked for, warn about tasks at the same time in the other calendars
+    # of the user, submitting again without the check creates the task
+    if form.cleaned_data['check_conflicts']:
+        date = form.cleaned_data['taskDate']
+        conflicts = ["%s in %s (%s - %s)" % (topic, cal_name, 
+                                             timeslots.format_slot(start),
+                                             timeslots.format_slot(end))
+                     for d, start, end, topic, cal_name in 
+                     _get_busy_tasks(request.user, date, date, exclude_cal=calendar)
+                     if start < endSlot and startSlot < end]
+        if conflicts:
+            context['createmessage'] = ("You are busy at this time: " + 
+                                        "; ".join(conflicts) + ". Uncheck \"Check " + 
+                                        "My Other Calendars\" to create " + 
+                                        "the task anyway.")
             return render(request, 'wasabicalendar/createtask.html', context)
-    description = Description(text=form.cleaned_data["description"],
-                              location = form.cleaned_data["location"],
-                              link = form.cleaned_data["link"])
-    
     try:
         tag = Tag.objects.get(id=form.cleaned_data['tag'])
     except:
         # handle the case where tag doesn't exist
         request.session['message'] = 'Invalid tag'
         return redirect('new_task', id=id)
-    task = Task(topic=form.cleaned_data['topic'], 
-                tag=tag,
-                taskDate=form.cleaned_data['taskDate'],
-                startTime=roundedStartTime,
-                endTime=roundedEndTime,
-                description=description)
-    description.save()
-    task.created_by = request.user
-    task.calendar = calendar
-    task.creation_time = timezone.now()
-    task.updated_by = request.user
-    task.update_time = timezone.now()
-    task.save()
+    _insert_task(request.user, calendar, tag, form.cleaned_data, 
+                 startSlot, endSlot)
     request.session['message'] = 'Task Created'
     return redirect('get_calendar', id=id)
 
@@ -487,11 +900,9 @@ def back(request, id):
 # @returns: render back to calendar page or display error message in the 
 #           modify calendar page
 @login_required
-@transaction.atomic
 def modify_helper(request, id):
     try:
-        task = Task.objects.select_for_update().get(id=id)
-        db_update_time = task.update_time
+        task = Task.objects.get(id=id)
     except:
         # handle the case when task object with the id doesn't exist
         message = 'Task does not exist'
@@ -513,85 +924,48 @@ def modify_helper(request, id):
 
     form = TaskForm(request.POST, calendar=calendar)
 
-    # get update time stored in hidden field for time stamp
-    hidden_update_time = request.POST['hidden_update_time_modify']
+    # get the task version stored in hidden field when the page was opened
+    hidden_version = request.POST.get('hidden_version_modify', '')
 
-    # need to go back three directory to access the css file
-    context = {"form": form, 'task': task, "useanothercss": True, 
-            "update_time": hidden_update_time}
+    context = {"form": form, 'task': task, "version": hidden_version}
     if not form.is_valid():
         context["message"] = "Invalid Form"
         return render(request, 'wasabicalendar/modifytask.html', context)
 
-    # check whether other users have update the task after opening the page
-    if str(db_update_time) != str(hidden_update_time):
+    # check whether other users have update the task after opening the page,
+    # the conditional update below is what finally decides
+    if not hidden_version.isdigit() or int(hidden_version) != task.version:
         request.session["message"] = ("Another user has modified this task." + 
                                     " Please re-enter.")
         return redirect('modify_task', id=task.id)
 
-    # round minutes to multiple of 15
-    startTime = form.cleaned_data['startTime']
-    endTime = form.cleaned_data['endTime']
-    roundedStartTime = datetime.time(startTime.hour,(startTime.minute//15)*15,0)
-    
-    if endTime.minute % 15 > 0:
-        newMin = ((endTime.minute//15)+1)*15
-        newHour = endTime.hour
-        if newMin >= 60:
-            newMin -= 60
-            newHour += 1
-    else:
-        newMin = endTime.minute
-        newHour = endTime.hour
-    if newHour == 24:
-        newHour = 23
-        newMin = 45
-    roundedEndTime = datetime.time(newHour,newMin,0)
+    # round the times to 15 minute slots
+    startSlot, endSlot = timeslots.round_range(form.cleaned_data['startTime'],
+                                               form.cleaned_data['endTime'])
 
     # case that task only occupied the last block
-    if roundedStartTime == roundedEndTime:
+    if startSlot == endSlot:
         context["message"] = "Task cannot begin after 11:45PM"
         return render(request, 'wasabicalendar/modifytask.html', context)
 
     # count overlap, if any 15 minutes slot has > 5 tasks, create an error message 
-    # and let user reenter the infotmation
-    timeblock = dict()
-    for t in calendar.tasks.all():
-        if t.id != id:
-            if t.taskDate == form.cleaned_data['taskDate']:
-                block = datetime.timedelta(minutes=15)
-                st = datetime.datetime.combine(t.taskDate, roundedStartTime)
-                et = datetime.datetime.combine(t.taskDate, roundedEndTime)
-                while (st != et):
-                    if t.startTime <= st.time() and t.endTime > st.time():
-                        if st not in timeblock:
-                            timeblock[st] = 1
-                        else:
-                            timeblock[st] += 1
-                    st += block
-    for key in timeblock:
-        if timeblock[key] >= 5:
-            context['createmessage'] = "You can only create up to 5 overlapped tasks."
-            return render(request, 'wasabicalendar/modifytask.html', context)
+    # and let user reenter the infotmation with suggested free times
+    suggestions = _check_overlap(calendar, form.cleaned_data['taskDate'],
+                                 startSlot, endSlot, exclude_id=task.id)
+    if suggestions is not None:
+        context['createmessage'] = "You can only create up to 5 overlapped tasks."
+        context['suggestions'] = suggestions
+        return render(request, 'wasabicalendar/modifytask.html', context)
     try:
         tag = Tag.objects.get(id=form.cleaned_data['tag'])
     except:
         request.session['message'] = 'Invalid tag'
         return redirect('modify_task', id=task.id)
-    description = task.description
-    description.text = form.cleaned_data["description"]
-    description.location = form.cleaned_data["location"]
-    description.link = form.cleaned_data["link"]
-    task.topic = form.cleaned_data['topic']
-    task.tag = tag
-    task.taskDate = form.cleaned_data['taskDate']
-    task.startTime = roundedStartTime
-    task.endTime = roundedEndTime
-    task.description = description
-    description.save()
-    task.updated_by = request.user
-    task.update_time = timezone.now()
-    task.save()
+    if not _update_task(request.user, task, int(hidden_version), tag, 
+                        form.cleaned_data, startSlot, endSlot):
+        request.session["message"] = ("Another user has modified this " + 
+                                    "task. Please re-enter.")
+        return redirect('modify_task', id=task.id)
     request.session['message'] = "Task updated"
     return redirect('get_calendar', id=calendar.id)
 
@@ -602,11 +976,9 @@ def modify_helper(request, id):
 # @returns: render back to calendar page or display error message in the 
 #           modify calendar page
 @login_required
-@transaction.atomic
 def delete_helper(request, id):
     try:
-        task = Task.objects.select_for_update().get(id=id)
-        db_update_time = task.update_time
+        task = Task.objects.get(id=id)
     except:
         # handle case when task with the id doesn't exist
         message = 'Task does not exist'
@@ -624,19 +996,85 @@ def delete_helper(request, id):
         request.session['message'] = "Please access this page with a GET request"
         return redirect('get_calendar', id=calendar.id)
     
-    # get update time stored in hidden field for time stamp
-    hidden_update_time = request.POST['hidden_update_time_delete']
+    # get the task version stored in hidden field when the page was opened
+    hidden_version = request.POST.get('hidden_version_delete', '')
     
-    # check whether other users have update the task after opening the page
-    if str(db_update_time) != str(hidden_update_time):
+    if (not hidden_version.isdigit() or 
+            not _delete_task(task, int(hidden_version))):
         request.session["message"] = ("Another user has modified this task." + 
                                     " Please re-enter.")
         return redirect('modify_task', id=task.id)
-        
-    task.delete()
     request.session['message'] = "Task deleted"
     return redirect('get_calendar', id=calendar.id)
 
+# @brief: create a task from the cleaned data of a task form
+# @type tag: Tag
+# @type data: dict
+# @param data: cleaned data of a valid TaskForm
+# @param startSlot, endSlot: the task times rounded to slots
+# @returns: the new Task
+def _insert_task(user, calendar, tag, data, startSlot, endSlot):
+    description = Description(text=data["description"],
+                              location=data["location"],
+                              link=data["link"])
+    description.save()
+    task = Task(topic=data['topic'], 
+                tag=tag,
+                taskDate=data['taskDate'],
+                startSlot=startSlot,
+                endSlot=endSlot,
+                description=description)
+    task.created_by = user
+    task.calendar = calendar
+    task.creation_time = timezone.now()
+    task.updated_by = user
+    task.update_time = timezone.now()
+    task.save()
+    from wasabicalendar import search
+    search.index_tasks([task.id])
+    caches.bump_revision(calendar.id)
+    return task
+
+# @brief: overwrite a task with the cleaned data of a task form, but only if
+#         nobody changed it since the version the form was filled from
+# @type version: int
+# @param version: the version of the task the user saw
+# @returns: True if the task was updated, False on a conflict
+def _update_task(user, task, version, tag, data, startSlot, endSlot):
+    with transaction.atomic():
+        updated = Task.objects.filter(id=task.id, version=version).update(
+                    topic=data['topic'],
+                    tag=tag,
+                    taskDate=data['taskDate'],
+                    startSlot=startSlot,
+                    endSlot=endSlot,
+                    updated_by=user,
+                    update_time=timezone.now(),
+                    version=F('version') + 1)
+        if updated == 0:
+            return False
+        Description.objects.filter(id=task.description_id).update(
+                    text=data["description"],
+                    location=data["location"],
+                    link=data["link"])
+        from wasabicalendar import search
+        search.index_tasks([task.id])
+    caches.bump_revision(task.calendar_id)
+    return True
+
+# @brief: delete a task, but only if nobody changed it since the version the
+#         user saw
+# @type version: int
+# @returns: True if the task was deleted, False on a conflict
+def _delete_task(task, version):
+    deleted, _ = Task.objects.filter(id=task.id, version=version).delete()
+    if deleted == 0:
+        return False
+    from wasabicalendar import search
+    search.unindex_tasks([task.id])
+    caches.bump_revision(task.calendar_id)
+    return True
+
 def get_cal_list_wrapper(request):
     if not request.user.id:
         return _my_json_error_response("You must log in", status = 401)
@@ -650,10 +1088,6 @@ def get_cal_list_wrapper(request):
     if not request.GET['cal_id'].isdigit() or int(request.GET['cal_id']) <= 0:
         return _my_json_error_response("You must use a valid calendar.", status = 400)
     
-    if (not request.GET['cal_id'].isdigit() or 
-            int(request.GET['cal_id']) > Calendar.objects.all().count()):
-        return _my_json_error_response("You must use a valid calendar.", status = 400)
-    
     if not 'week' in request.GET or not request.GET['week']:
         return _my_json_error_response("You must choose a valid week", status = 400)
     
@@ -672,84 +1106,211 @@ def get_cal_list_wrapper(request):
     return _get_cal_list_helper(request, cid, week)
 
 
+# @brief: apply availability flips of one user in one week of a calendar as a
+# single transaction. A block flipped an even number of times ends up where it
+# started, so such pairs cancel out and are never written
+# @type beginDate: datetime
+# @param beginDate: the Monday of the week the block ids refer to
+# @type ids: list
+# @param ids: block ids in the week (day * DAY_COUNT + slot), may repeat
+# @returns: a dict from block id to (count, current_user_selected) after the write
+@transaction.atomic
+def _apply_block_flips(user, cal, beginDate, ids):
+    counter = collections.Counter(ids)
+    # map (date, slot) of every block that really changes to its id in the week
+    keys = {}
+    for blockid in counter:
+        if counter[blockid] % 2 == 0:
+            continue
+        date = beginDate + datetime.timedelta(days=blockid // DAY_COUNT)
+        keys[(date.strftime("%Y-%m-%d"), blockid % DAY_COUNT)] = blockid
+    if not keys:
+        return {}
+
+    dates = set(key[0] for key in keys)
+    # archived blocks are read only, move them back to change them
+    archived_dates = [date for date in dates if _is_archived(cal, date)]
+    if archived_dates:
+        from wasabicalendar import archive
+        archive.restore_blocks(cal, archived_dates)
+
+    blocks = {}
+    for block_item in cal.blocks.filter(date__in=dates):
+        key = (block_item.date, block_item.slot)
+        if key in keys and key not in blocks:
+            blocks[key] = block_item
+    # create all missing blocks with one insert
+    missing = [Block(date=key[0], slot=key[1], calendar=cal) 
+               for key in keys if key not in blocks]
+    for block_item in Block.objects.bulk_create(missing):
+        blocks[(block_item.date, block_item.slot)] = block_item
+
+    # flip the selection of the user with one delete and one insert
+    through = Block.select_user.through
+    block_ids = [block_item.id for block_item in blocks.values()]
+    selected = set(through.objects.filter(user=user, block_id__in=block_ids)
+                                  .values_list('block_id', flat=True))
+    through.objects.filter(user=user, block_id__in=selected).delete()
+    through.objects.bulk_create([through(block_id=block_id, user_id=user.id) 
+                                 for block_id in block_ids 
+                                 if block_id not in selected])
+    caches.bump_revision(cal.id)
+
+    counts = dict(through.objects.filter(block_id__in=block_ids)
+                                 .values('block_id')
+                                 .annotate(n=Count('user'))
+                                 .values_list('block_id', 'n'))
+    states = {}
+    for key, block_item in blocks.items():
+        states[keys[key]] = (counts.get(block_item.id, 0), 
+                             block_item.id not in selected)
+    return states
+    
 
-# @brief: flip the "selected_user" field in Model for request.user
-# and current block - used for availability feature
-# @return: HttpRresponse with JSON data upon success execution
+# @brief: set the availability of one user in blocks of one week of a calendar.
+# Unlike a flip, setting a block to the state it already has changes nothing,
+# so a batch the client sends again after a lost response does no harm
+# @type beginDate: datetime
+# @param beginDate: the Monday of the week the block ids refer to
+# @type states: dict
+# @param states: block id in the week -> True to be available in the block
+# @returns: a dict from block id to (count, current_user_selected) of the
+#           blocks that changed
+@transaction.atomic
+def _set_block_states(user, cal, beginDate, states):
+    dates = [(beginDate + datetime.timedelta(days=i)).strftime("%Y-%m-%d") 
+             for i in range(WEEK_COUNT)]
+    # the state of archived blocks is only seen once they are moved back
+    if _is_archived(cal, dates[0]):
+        from wasabicalendar import archive
+        archive.restore_blocks(cal, [date for date in dates 
+                                     if _is_archived(cal, date)])
+    selected = set(Block.select_user.through.objects
+                        .filter(user=user, block__calendar=cal, 
+                                block__date__in=dates)
+                        .values_list('block__date', 'block__slot'))
+    ids = [blockid for blockid, wanted in states.items()
+           if ((dates[blockid // DAY_COUNT], blockid % DAY_COUNT) in selected) 
+              != wanted]
+    return _apply_block_flips(user, cal, beginDate, ids)
+
+
+# @brief: apply a batch of changes the calendar page queued while the user
+# worked on it, possibly offline. Every change is a dict with a client chosen
+# "id" and a "type":
+#   blocks: "week" and "blocks", a dict from block id to the wanted state
+#   create: "task", the fields of the task form
+#   modify: "task_id", "version" and "task", the fields of the task form
+#   delete: "task_id" and "version"
+# Modify and delete only apply to the version of the task the user saw, an
+# edit of a task that changed in the meantime is reported as a conflict.
+# Results are remembered per change id for a while, so a batch sent again
+# after a lost response is not applied twice
+# @return: HttpResponse with a list of results in the order of the changes
 @login_required
-def flip_block(request):
-    # mark the 
+def sync(request):
     if not request.user.id:
         return _my_json_error_response("You must log in", status = 401)
     if request.method != 'POST':
-        return HttpResponse({}, content_type='application/json', status=200)
-    
-    if not request.POST['cal_id'].isdigit() or int(request.POST['cal_id']) <= 0:
-        return _my_json_error_response("You must use a valid calendar.", status = 400)
-    
-    calid = int(request.POST['cal_id'])
-
-    if not 'id' in request.POST or not request.POST['id']:
-        return HttpResponse({}, content_type='application/json', status=200)
-
-    if not request.POST['id'].isdigit() or int(request.POST['id']) > (DAY_COUNT*WEEK_COUNT):
-        return HttpResponse({}, content_type='application/json', status=200)
-    
-    if not 'week' in request.POST or not request.POST['week']:
-        return HttpResponse({}, content_type='application/json', status=200)
-    
-    if not 'csrfmiddlewaretoken' in request.POST or not request.POST['csrfmiddlewaretoken']:
-        return HttpResponse({}, content_type='application/json', status=200)
-    
-    blockid = int(request.POST['id'])
+        return _my_json_error_response("You must use a POST request for this operation", 
+                                        status=405)
 
+    if (not 'cal_id' in request.POST or not request.POST['cal_id'].isdigit() or 
+            int(request.POST['cal_id']) <= 0):
+        return _my_json_error_response("You must use a valid calendar.", status = 400)
 
     try:
-        beginDate = datetime.datetime.strptime(request.POST['week'],"%Y-%m-%d")
-    except:
-        return HttpResponse({}, content_type='application/json', status=200)
-    if beginDate.weekday() != 0:
-        return HttpResponse({}, content_type='application/json', status=200)
+        ops = json.loads(request.POST.get('ops', ''))
+    except ValueError:
+        return _my_json_error_response("invalid changes", status = 400)
+    if (not isinstance(ops, list) or len(ops) > SYNC_MAX_OPS or 
+            not all(isinstance(op, dict) for op in ops)):
+        return _my_json_error_response("invalid changes", status = 400)
 
-    blockday = blockid // DAY_COUNT # obtain day in week
-    blockslot = blockid % DAY_COUNT # obtain slot time in day
-
-    # obtain date and time for Block model
-    date = beginDate + datetime.timedelta(days=blockday)
-
-    dateStr = date.strftime("%Y-%m-%d")
-    
-    # modify block availability
     try:
-        cal = Calendar.objects.get(id=calid)
+        cal = Calendar.objects.get(id=int(request.POST['cal_id']))
     except:
         return _my_json_error_response("No access to the calendar", status = 400)
 
     if request.user not in cal.members.all() and request.user != cal.owner:
         return _my_json_error_response("No access to the calendar", status = 400)
 
-    blocks = cal.blocks.filter(date__exact=dateStr, slot__exact=blockslot)
+    results = []
+    for op in ops:
+        op_id = str(op.get('id', ''))[:40]
+        key = "sync_%d_%s" % (request.user.id, op_id)
+        result = cache.get(key) if op_id else None
+        if result is None:
+            result = _sync_op(request.user, cal, op)
+            if op_id:
+                cache.set(key, result, SYNC_RESULT_TIMEOUT)
+        results.append(dict(result, id=op_id))
+    return encoding.encode_response(request, {"results": results})
+
+
+# @brief: apply one change of a sync batch, see sync
+# @type op: dict
+# @returns: a result dict with "status" "ok", "conflict" or "error" and a
+#           "message" unless the change was applied
+def _sync_op(user, cal, op):
+    kind = op.get('type')
+    if kind == 'blocks':
+        try:
+            beginDate = datetime.datetime.strptime(op['week'], "%Y-%m-%d")
+            states = dict((int(blockid), bool(wanted)) 
+                          for blockid, wanted in op['blocks'].items())
+        except (KeyError, TypeError, ValueError, AttributeError):
+            return {"status": "error", "message": "invalid week info"}
+        if (beginDate.weekday() != 0 or 
+                not all(0 <= blockid < DAY_COUNT*WEEK_COUNT for blockid in states)):
+            return {"status": "error", "message": "You must choose a valid block."}
+        _set_block_states(user, cal, beginDate, states)
+        return {"status": "ok"}
+
+    if kind not in ('create', 'modify', 'delete'):
+        return {"status": "error", "message": "Unknown change"}
+
+    task = None
+    if kind != 'create':
+        if (not isinstance(op.get('task_id'), int) or 
+                not isinstance(op.get('version'), int)):
+            return {"status": "error", "message": "You must use a valid task."}
+        try:
+            task = Task.objects.get(id=op['task_id'], calendar=cal)
+        except Task.DoesNotExist:
+            return {"status": "conflict", 
+                    "message": "Another user has deleted this task."}
+        if kind == 'delete':
+            if not _delete_task(task, op['version']):
+                return {"status": "conflict", 
+                        "message": "Another user has modified this task."}
+            return {"status": "ok"}
+
+    fields = op.get('task')
+    if not isinstance(fields, dict):
+        return {"status": "error", "message": "Invalid Form"}
+    form = TaskForm(fields, calendar=cal)
+    if not form.is_valid():
+        return {"status": "error", "message": "Invalid Form"}
+    startSlot, endSlot = timeslots.round_range(form.cleaned_data['startTime'],
+                                               form.cleaned_data['endTime'])
+    if startSlot == endSlot:
+        return {"status": "error", "message": "Task cannot begin after 11:45PM"}
+    if _check_overlap(cal, form.cleaned_data['taskDate'], startSlot, endSlot,
+                      exclude_id=task.id if task else None) is not None:
+        return {"status": "error", 
+                "message": "You can only create up to 5 overlapped tasks."}
+    tag = Tag.objects.get(id=form.cleaned_data['tag'])
+    if task is None:
+        task = _insert_task(user, cal, tag, form.cleaned_data, startSlot, endSlot)
+        return {"status": "ok", "task_id": task.id, "version": task.version}
+    if not _update_task(user, task, op['version'], tag, form.cleaned_data, 
+                        startSlot, endSlot):
+        return {"status": "conflict", 
+                "message": "Another user has modified this task."}
+    return {"status": "ok", "task_id": task.id, "version": op['version'] + 1}
 
 
-    # modify date
-    if blocks.count() != 0:
-        curBlock = blocks[0] # get 0th element, should only contain 1
-        # flip if in selectedUser
-        if request.user in curBlock.select_user.all():
-            curBlock.select_user.remove(request.user)
-        else:
-            curBlock.select_user.add(request.user)
-        curBlock.save()
-    else:
-        # create new block
-        curBlock = Block(date=dateStr, slot=blockslot, calendar=cal)
-        curBlock.save()
-        request.user.toblocks.add(curBlock)
-        request.user.save()
-    
-    return HttpResponse({}, content_type='application/json', status=200)
-    
-
 # @brief: get prev week information
 # @return: HttpRresponse with calendar JSON data upon success execution
 @login_required
@@ -766,10 +1327,6 @@ def prev_week(request):
     if not request.GET['cal_id'].isdigit() or int(request.GET['cal_id']) <= 0:
         return _my_json_error_response("You must use a valid calendar.", status = 400)
     
-    if (not request.GET['cal_id'].isdigit() or 
-        int(request.GET['cal_id']) > Calendar.objects.all().count()):
-        return _my_json_error_response("You must use a valid calendar.", status = 400)
-    
     if not 'week' in request.GET or not request.GET['week']:
         return _my_json_error_response("You must choose a valid week", status = 400)
     
@@ -806,10 +1363,6 @@ def next_week(request):
     if not request.GET['cal_id'].isdigit() or int(request.GET['cal_id']) <= 0:
         return _my_json_error_response("You must use a valid calendar.", status = 400)
     
-    if (not request.GET['cal_id'].isdigit() or 
-        int(request.GET['cal_id']) > Calendar.objects.all().count()):
-        return _my_json_error_response("You must use a valid calendar.", status = 400)
-    
     if not 'week' in request.GET or not request.GET['week']:
         return _my_json_error_response("You must choose a valid week", status = 400)
     
@@ -850,24 +1403,318 @@ def get_task(request):
 
     id = int(request.GET['id'])
     try:
-        task = Task.objects.get(id=id)
+        task = Task.objects.select_related('description').get(id=id)
+        description = task.description
+        # what the page needs to edit the task in place
+        editable = {"tag": task.tag_id, "version": task.version}
     except:
-        return _my_json_error_response("No access to the task.", status = 400)
+        # tasks of old weeks may have been moved to the archive, where the
+        # description is stored on the task itself
+        try:
+            task = ArchivedTask.objects.get(id=id)
+            description = task
+            editable = {}
+        except:
+            return _my_json_error_response("No access to the task.", status = 400)
 
     
     # generate return value
-    parsedStart = task.startTime.strftime("%H:%M:%S")
-    parsedEnd = task.endTime.strftime("%H:%M:%S")
+    parsedStart = timeslots.format_slot(task.startSlot, seconds=True)
+    parsedEnd = timeslots.format_slot(task.endSlot, seconds=True)
     parsedDate = task.taskDate.strftime("%Y-%m-%d")
     data = {
         'id':task.id,
         "topic": task.topic,
-        'link':task.description.link,
-        'location':task.description.location,
-        'description':task.description.text,
+        'link':description.link,
+        'location':description.location,
+        'description':description.text,
         'date':parsedDate,
         "startTime": parsedStart,
         "endTime": parsedEnd,
     }    
-    response_json = json.dumps(data)
-    return HttpResponse(response_json, content_type='application/json')
+    data.update(editable)
+    return encoding.encode_response(request, data)
+
+
+# @brief: get the number of available members in every block of a calendar
+# for a range of days (a week or a month) in one aggregate query. Member names
+# are not included, use availability_members for a chosen slot range
+# @return: HttpRresponse with JSON {"days": [...], "counts": [[...], ...]}
+# where counts[d][s] is the count of slot s on day d
+@login_required
+def availability_heatmap(request):
+    if request.method != 'GET':
+        return _my_json_error_response("You must use a GET request for this operation", 
+                                        status=405)
+    cal = _get_accessible_calendar(request.user, request.GET.get('cal_id', ''))
+    if cal is None:
+        return _my_json_error_response("No access to the calendar", status = 400)
+
+    try:
+        startDay = datetime.datetime.strptime(request.GET.get('start', ''),"%Y-%m-%d")
+    except:
+        return _my_json_error_response("invalid start date", status = 400)
+    dayCount = request.GET.get('days', str(WEEK_COUNT))
+    if not dayCount.isdigit() or not 0 < int(dayCount) <= HEATMAP_MAX_DAYS:
+        return _my_json_error_response("invalid number of days", status = 400)
+
+    days = [(startDay + datetime.timedelta(days=i)).strftime("%Y-%m-%d") 
+            for i in range(int(dayCount))]
+    counts = [[0] * DAY_COUNT for day in days]
+    for date, slot, count, mine in _get_block_counts(cal, days[0], days[-1]):
+        counts[days.index(date)][slot] = count
+    return encoding.encode_response(request, {"days": days, "counts": counts})
+
+
+# @brief: get the times the user is busy in their other calendars during a
+# week, for the busy overlay of the availability grid
+# @return: HttpRresponse with JSON {"week": monday, "days": [...]} with one
+# list of {"startBlock", "endBlock", "topic", "calendar"} per day
+@login_required
+def busy_times(request):
+    if request.method != 'GET':
+        return _my_json_error_response("You must use a GET request for this operation", 
+                                        status=405)
+    cal = _get_accessible_calendar(request.user, request.GET.get('cal_id', ''))
+    if cal is None:
+        return _my_json_error_response("No access to the calendar", status = 400)
+
+    try:
+        startDay = datetime.datetime.strptime(request.GET.get('week', ''),"%Y-%m-%d")
+    except:
+        return _my_json_error_response("invalid week info", status = 400)
+    if startDay.weekday() != 0:
+        return _my_json_error_response("invalid week info", status = 400)
+
+    first = startDay.date()
+    days = [[] for i in range(WEEK_COUNT)]
+    for date, start, end, topic, cal_name in _get_busy_tasks(
+            request.user, first, first + datetime.timedelta(days=WEEK_COUNT - 1), 
+            exclude_cal=cal):
+        days[(date - first).days].append({"startBlock": start,
+                                          "endBlock": end,
+                                          "topic": topic,
+                                          "calendar": cal_name})
+    return encoding.encode_response(request, {"week": first.strftime("%Y-%m-%d"),
+                                              "days": days})
+
+
+# @brief: get the members available in a slot range of one day, for the hover
+# details of the availability grid
+# @return: HttpRresponse with JSON {"members": [...]} where every member has
+# the number of slots of the range they are available in
+@login_required
+def availability_members(request):
+    if request.method != 'GET':
+        return _my_json_error_response("You must use a GET request for this operation", 
+                                        status=405)
+    cal = _get_accessible_calendar(request.user, request.GET.get('cal_id', ''))
+    if cal is None:
+        return _my_json_error_response("No access to the calendar", status = 400)
+
+    date = request.GET.get('date', '')
+    try:
+        datetime.datetime.strptime(date,"%Y-%m-%d")
+    except:
+        return _my_json_error_response("invalid date", status = 400)
+    startSlot = request.GET.get('start_slot', '')
+    endSlot = request.GET.get('end_slot', '')
+    if (not startSlot.isdigit() or not endSlot.isdigit() or 
+            not int(startSlot) < int(endSlot) <= DAY_COUNT):
+        return _my_json_error_response("invalid slot range", status = 400)
+
+    sources = [Block.select_user.through.objects.filter(block__calendar=cal,
+                    block__date=date, block__slot__gte=int(startSlot), 
+                    block__slot__lt=int(endSlot)).values_list(
+                    'user__username', 'user__first_name', 'user__last_name',
+                    'block__slot')]
+    if _is_archived(cal, date):
+        sources.append(ArchivedBlock.select_user.through.objects.filter(
+                    archivedblock__calendar=cal, archivedblock__date=date, 
+                    archivedblock__slot__gte=int(startSlot), 
+                    archivedblock__slot__lt=int(endSlot)).values_list(
+                    'user__username', 'user__first_name', 'user__last_name',
+                    'archivedblock__slot'))
+    # a day may have blocks in both tables, merge the slots of every member
+    slots = {}
+    for rows in sources:
+        for username, first_name, last_name, slot in rows:
+            slots.setdefault((username, first_name, last_name), set()).add(slot)
+    members = []
+    for (username, first_name, last_name), member_slots in slots.items():
+        members.append({"username": username,
+                        "first_name": first_name,
+                        "last_name": last_name,
+                        "slots": len(member_slots)})
+    return encoding.encode_response(request, {"members": members})
+
+
+# @brief: get a calendar by an id string if the user is its owner or a member
+# @type cal_id: string
+# @param cal_id: calendar id from the request
+# @returns: the Calendar object, or None if it does not exist or no access
+def _get_accessible_calendar(user, cal_id):
+    if not cal_id.isdigit():
+        return None
+    cal = Calendar.objects.filter(id=int(cal_id)).first()
+    if cal is None:
+        return None
+    if cal.owner_id != user.id and not cal.members.filter(id=user.id).exists():
+        return None
+    return cal
+
+
+# @brief: get one page of the owned or shared calendars of the user for the
+# home page gallery. Member and task counts come from subqueries of the same
+# query, and pages are cut with a keyset cursor instead of an offset
+# @return: HttpRresponse with JSON {"calendars": [...], "cursor": ...} where
+# cursor is null on the last page
+@login_required
+def calendar_list(request):
+    if request.method != 'GET':
+        return _my_json_error_response("You must use a GET request for this operation", 
+                                        status=405)
+    kind = request.GET.get('kind', 'owned')
+    if kind == 'owned':
+        cals = Calendar.objects.filter(owner=request.user)
+    elif kind == 'shared':
+        cals = Calendar.objects.filter(members=request.user)
+    else:
+        return _my_json_error_response("invalid calendar list", status = 400)
+
+    sort = request.GET.get('sort', 'recent')
+    if sort not in ('recent', 'name'):
+        return _my_json_error_response("invalid sort order", status = 400)
+    limit = request.GET.get('limit', str(GALLERY_PAGE_SIZE))
+    if not limit.isdigit() or not 0 < int(limit) <= GALLERY_MAX_PAGE_SIZE:
+        return _my_json_error_response("invalid page size", status = 400)
+    limit = int(limit)
+
+    member_count = (Calendar.members.through.objects
+                        .filter(calendar=OuterRef('pk')).values('calendar')
+                        .annotate(n=Count('id')).values('n'))
+    task_count = (Task.objects.filter(calendar=OuterRef('pk')).values('calendar')
+                      .annotate(n=Count('id')).values('n'))
+    last_accessed = (CalendarAccess.objects
+                         .filter(calendar=OuterRef('pk'), user=request.user)
+                         .values('last_accessed'))
+    cals = cals.select_related('owner').annotate(
+        member_count=Coalesce(Subquery(member_count, output_field=IntegerField()), 0),
+        task_count=Coalesce(Subquery(task_count, output_field=IntegerField()), 0),
+        last_accessed=Coalesce(Subquery(last_accessed, output_field=DateTimeField()),
+                               Value(NEVER_ACCESSED, output_field=DateTimeField())))
+
+    # continue after the last calendar of the previous page
+    if request.GET.get('cursor'):
+        try:
+            key, last_id = json.loads(base64.urlsafe_b64decode(
+                                        request.GET['cursor'].encode()))
+            if sort == 'recent':
+                key = datetime.datetime.fromisoformat(key)
+        except:
+            return _my_json_error_response("invalid cursor", status = 400)
+        if sort == 'recent':
+            cals = cals.filter(Q(last_accessed__lt=key) | 
+                               Q(last_accessed=key, id__lt=last_id))
+        else:
+            cals = cals.filter(Q(name__gt=key) | Q(name=key, id__gt=last_id))
+    if sort == 'recent':
+        cals = cals.order_by('-last_accessed', '-id')
+    else:
+        cals = cals.order_by('name', 'id')
+
+    page = list(cals[:limit + 1])
+    cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        last = page[-1]
+        key = last.last_accessed.isoformat() if sort == 'recent' else last.name
+        cursor = base64.urlsafe_b64encode(
+                    json.dumps([key, last.id]).encode()).decode()
+
+    calendars = []
+    for c in page:
+        calendars.append({
+            "id": c.id,
+            "name": c.name,
+            "owner": c.owner.first_name + " " + c.owner.last_name,
+            "member_count": c.member_count,
+            "task_count": c.task_count,
+            "last_accessed": (None if c.last_accessed == NEVER_ACCESSED 
+                              else c.last_accessed.isoformat())
+        })
+    return encoding.encode_response(request, {"calendars": calendars, "cursor": cursor})
+
+
+# @brief: full-text search of the tasks of all calendars the user owns or is a
+# member of, or of one of them if cal_id is given. Live and archived tasks are
+# both searched, best matches first
+# @return: HttpRresponse with JSON {"tasks": [...], "more": ...} where more is
+# true if there is a next page
+@login_required
+def search_tasks(request):
+    if request.method != 'GET':
+        return _my_json_error_response("You must use a GET request for this operation", 
+                                        status=405)
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return _my_json_error_response("You must enter a search text", status = 400)
+    page = request.GET.get('page', '0')
+    if not page.isdigit() or int(page) >= SEARCH_MAX_PAGE:
+        return _my_json_error_response("invalid page", status = 400)
+
+    cals = Calendar.objects.filter(Q(owner=request.user) | Q(members=request.user))
+    if request.GET.get('cal_id'):
+        cal = _get_accessible_calendar(request.user, request.GET['cal_id'])
+        if cal is None:
+            return _my_json_error_response("No access to the calendar", status = 400)
+        cals = cals.filter(id=cal.id)
+    cal_names = dict(cals.distinct().values_list('id', 'name'))
+
+    from wasabicalendar import search
+    ids, more = search.search_task_ids(cal_names.keys(), query, int(page))
+    # the index only has ids, fetch the tasks of the page from both tables
+    found = {}
+    for tasks in (Task.objects.filter(id__in=ids), 
+                  ArchivedTask.objects.filter(id__in=ids)):
+        for task in tasks.select_related('tag'):
+            found[task.id] = task
+    results = []
+    for id in ids:
+        if id not in found:
+            # deleted since it was indexed
+            continue
+        task = found[id]
+        results.append({"id": task.id,
+                        "topic": task.topic,
+                        "calendar_id": task.calendar_id,
+                        "calendar": cal_names[task.calendar_id],
+                        "date": task.taskDate.strftime("%Y-%m-%d"),
+                        "startTime": timeslots.format_slot(task.startSlot, seconds=True),
+                        "endTime": timeslots.format_slot(task.endSlot, seconds=True),
+                        "color": task.tag.color})
+    return encoding.encode_response(request, {"tasks": results, "more": more})
+
+
+# @brief: get the status and progress of a background job of the user
+# @return: HttpRresponse with JSON {"id", "kind", "status", "progress",
+# "total", "message", "result"}, status is one of queued, running, done and
+# failed, result is set once the job is done
+@login_required
+def job_status(request):
+    if request.method != 'GET':
+        return _my_json_error_response("You must use a GET request for this operation", 
+                                        status=405)
+    job_id = request.GET.get('id', '')
+    if not job_id.isdigit():
+        return _my_json_error_response("You must have a job id.", status = 400)
+    job = Job.objects.filter(id=int(job_id), owner=request.user).first()
+    if job is None:
+        return _my_json_error_response("No such job", status = 400)
+    return encoding.encode_response(request, {"id": job.id,
+                                              "kind": job.kind,
+                                              "status": job.status,
+                                              "progress": job.progress,
+                                              "total": job.total,
+                                              "message": job.message,
+                                              "result": json.loads(job.result)})
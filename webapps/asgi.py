@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'webapps.settings')
 
 application = get_asgi_application()
+
+from wasabicalendar.startup import warm_up
+
+warm_up()
@@ -34,7 +34,9 @@ ALLOWED_HOSTS = ['3.220.224.177','wasabicalendar.com']
 # Application definition
 
 INSTALLED_APPS = [
-    'django.contrib.admin',
+    # admin modules are discovered when the URLconf is loaded (see urls.py),
+    # so management commands and job workers do not import them
+    'django.contrib.admin.apps.SimpleAdminConfig',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -50,6 +52,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'wasabicalendar.middleware.CachedUserMiddleware',
+    'wasabicalendar.middleware.RateLimitMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -88,6 +92,57 @@ DATABASES = {
 }
 
 
+# Cache
+# Calendar revisions, access checks and week payloads are kept here. With
+# more than one worker process use a backend shared by all workers: "file"
+# and "db" need no external service ("db" needs `manage.py createcachetable`)
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', ''),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache',
+             str(BASE_DIR / 'cache')),
+    'db': ('django.core.cache.backends.db.DatabaseCache', 'wasabicalendar_cache'),
+    'memcached': ('django.core.cache.backends.memcached.PyMemcacheCache',
+                  '127.0.0.1:11211'),
+    'redis': ('django.core.cache.backends.redis.RedisCache',
+              'redis://127.0.0.1:6379'),
+}
+CACHE_BACKEND, CACHE_LOCATION = CACHE_BACKENDS[CONFIG.get("Cache", "backend",
+                                                          fallback="locmem")]
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': CONFIG.get("Cache", "location", fallback=CACHE_LOCATION),
+    }
+}
+if not CACHE_BACKEND.endswith(('PyMemcacheCache', 'RedisCache')):
+    # culling limit of the built-in backends, the default of 300 is too low
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': 10000}
+
+
+# Sessions
+# "cached_db" or "signed_cookies" let the JSON polls skip the session table
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_ENGINE = SESSION_ENGINES[CONFIG.get("Session", "engine", fallback="db")]
+
+
+# Rate limits of the JSON endpoints, see wasabicalendar/ratelimit.py. Buckets
+# refill at "rate" requests per second and hold up to "burst" requests
+RATE_LIMIT_ENABLED = CONFIG.getboolean("RateLimit", "enabled", fallback=True)
+RATE_LIMIT_USER_RATE = CONFIG.getfloat("RateLimit", "user_rate", fallback=10)
+RATE_LIMIT_USER_BURST = CONFIG.getint("RateLimit", "user_burst", fallback=30)
+RATE_LIMIT_CALENDAR_RATE = CONFIG.getfloat("RateLimit", "calendar_rate", fallback=50)
+RATE_LIMIT_CALENDAR_BURST = CONFIG.getint("RateLimit", "calendar_burst", fallback=100)
+# requests one worker process runs at once before it answers 429. Only has an
+# effect with threaded (gunicorn --threads) or ASGI workers, a sync worker
+# never runs more than one request at a time
+RATE_LIMIT_MAX_INFLIGHT = CONFIG.getint("RateLimit", "max_inflight", fallback=32)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -123,6 +178,13 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/4.1/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# with manifest enabled, `manage.py collectstatic` writes content hashed file
+# names and .gz/.br variants to STATIC_ROOT, to be served with far-future
+# cache headers (see README)
+if CONFIG.getboolean("Static", "manifest", fallback=False):
+    STATICFILES_STORAGE = 'wasabicalendar.storage.CompressedManifestStaticFilesStorage'
 
 AUTHENTICATION_BACKENDS = (
     'social_core.backends.google.GoogleOAuth2',
@@ -140,4 +202,16 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGIN_URL = '/oauth/login/google-oauth2/'
 
-LOGIN_REDIRECT_URL = '/'
\ No newline at end of file
+LOGIN_REDIRECT_URL = '/'
+
+# `python manage.py profile_startup` fails when a cold start of the process
+# takes longer than this many ms
+STARTUP_BUDGET_MS = CONFIG.getint("Startup", "budget_ms", fallback=1500)
+# import the views and auth backends when the process starts instead of on
+# the first request, see wasabicalendar/startup.py. None (not set) warms up
+# only under gunicorn --preload
+STARTUP_WARM_UP = CONFIG.getboolean("Startup", "warm_up", fallback=None)
+
+# Tasks and availability blocks older than this many days are moved to the
+# archive tables by `python manage.py archive_history`
+ARCHIVE_HORIZON_DAYS = CONFIG.getint("Archive", "horizon_days", fallback=365)
@@ -18,15 +18,24 @@ from django.urls import path, include
 from wasabicalendar import views
 from django.contrib.auth import views as auth_views
 
+# SimpleAdminConfig leaves the discovery of admin modules to us
+admin.autodiscover()
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', views.profile_action, name='home'),
     path('oauth/', include('social_django.urls', namespace='social')),
     path('profile', views.profile_action, name='profile'),
     path('create_calendar', views.create_calendar, name='create_calendar'),
+    path('wasabicalendar/calendar-list', views.calendar_list, name='calendar_list'),
     path('get_calendar/<int:id>', views.get_calendar, name='get_calendar'),
     path('add_member/<int:id>', views.add_member, name='member'),
+    path('invite_members/<int:id>', views.invite_members, name='invite_members'),
+    path('wasabicalendar/user-search', views.user_search, name='user_search'),
+    path('get_calendar/wasabicalendar/user-search', views.user_search, name='get_user_search'),
     path('add_tag/<int:id>', views.add_tag, name='tag'),
+    path('clone_calendar/<int:id>', views.clone_calendar, name='clone_calendar'),
+    path('print_week/<int:id>', views.print_week, name='print_week'),
     path('new_task/<int:id>', views.new_task, name='new_task'),
     path('create_task/<int:id>', views.create_task, name='create_task'),
     path('back/<int:id>', views.back, name='back'),
@@ -42,8 +51,18 @@ urlpatterns = [
     path('add_tag/wasabicalendar/get-cal-list', views.get_cal_list_wrapper, name='get_cal_list_tag'),
     path('back/wasabicalendar/get-cal-list', views.get_cal_list_wrapper, name='get_cal_list_back'),
     path('create_task/wasabicalendar/get-cal-list', views.get_cal_list_wrapper, name='get_cal_list_create_task'),
-    path('wasabicalendar/flip-block', views.flip_block, name='flip-block'),
-    path('get_calendar/wasabicalendar/flip-block', views.flip_block, name='get_flip_block'),
+    path('wasabicalendar/sync', views.sync, name='sync'),
+    path('get_calendar/wasabicalendar/sync', views.sync, name='get_sync'),
+    path('wasabicalendar/availability-heatmap', views.availability_heatmap, name='availability_heatmap'),
+    path('get_calendar/wasabicalendar/availability-heatmap', views.availability_heatmap, name='get_availability_heatmap'),
+    path('wasabicalendar/availability-members', views.availability_members, name='availability_members'),
+    path('get_calendar/wasabicalendar/availability-members', views.availability_members, name='get_availability_members'),
+    path('wasabicalendar/busy-times', views.busy_times, name='busy_times'),
+    path('get_calendar/wasabicalendar/busy-times', views.busy_times, name='get_busy_times'),
+    path('wasabicalendar/search-tasks', views.search_tasks, name='search_tasks'),
+    path('wasabicalendar/job-status', views.job_status, name='job_status'),
+    path('get_calendar/wasabicalendar/job-status', views.job_status, name='get_job_status'),
+    path('get_calendar/wasabicalendar/search-tasks', views.search_tasks, name='get_search_tasks'),
     path('wasabicalendar/prev-week', views.prev_week, name = 'prev_week'),
     path('wasabicalendar/next-week', views.next_week, name = 'next_week'),
     path('get_calendar/wasabicalendar/prev-week', views.prev_week, name = 'prev_week'),